@@ -0,0 +1,26 @@
+"""
+dependencies.py
+FastAPI dependencies returning the service singletons built in the app lifespan (see app/main.py).
+get_llm_service is the process-wide LLMService (lazily built, see app/services/llm_service.py).
+"""
+
+from fastapi import Request
+from app.services.files_service import FilesService
+from app.services.ingestion_service import IngestionService
+from app.services.llm_service import get_llm_service
+from app.services.pdf_service import PDFIngestionService
+
+
+def get_files_service(request: Request) -> FilesService:
+    return request.app.state.files
+
+
+def get_ingestion_service(request: Request) -> IngestionService:
+    return request.app.state.ingestion
+
+
+def get_pdf_service(request: Request) -> PDFIngestionService:
+    return request.app.state.pdf
+
+
+__all__ = ["get_files_service", "get_ingestion_service", "get_llm_service", "get_pdf_service"]
@@ -3,45 +3,69 @@ files.py
 API endpoints for file management (list, delete, upload) - Used by frontend.
 """
 
-from fastapi import APIRouter, UploadFile, File, Request, HTTPException
+from fastapi import APIRouter, UploadFile, File, Request, HTTPException, Depends
+from app.api.dependencies import get_files_service, get_ingestion_service, get_pdf_service
 from app.services.files_service import FilesService
 from app.services.pdf_service import PDFIngestionService
 from app.services.ingestion_service import IngestionService
+from app.utils.logging_config import logger
+from starlette.concurrency import run_in_threadpool
 import os
 import tempfile
 
 router = APIRouter()
 
-# Use consistent collection name
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "rag_collection")
+UPLOAD_BUFFER_BYTES = 1 << 20  # 1 MiB
 
-files_service = FilesService(
-    qdrant_url=os.getenv("QDRANT_URL", "http://localhost:6333"),
-    qdrant_api_key=os.getenv("QDRANT_API", ""),
-    collection_name=COLLECTION_NAME
-)
 
-pdf_service = PDFIngestionService(
-    qdrant_url=os.getenv("QDRANT_URL", "http://localhost:6333"),
-    qdrant_api_key=os.getenv("QDRANT_API", ""),
-    collection_name=COLLECTION_NAME
-)
+def _write_all(fd: int, data) -> None:
+    """os.write may write partially; loop until the whole buffer is on disk."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
 
-ingestion_service = IngestionService()
+
+async def _stream_to_fd(stream, fd: int) -> int:
+    """Copy an async byte stream to a raw file descriptor; returns the number of bytes received.
+
+    Small body chunks are coalesced into one preallocated per-request buffer so the file
+    is written in ~1 MiB syscalls (one threadpool hop each) instead of one write per chunk.
+    """
+    buffer = bytearray(UPLOAD_BUFFER_BYTES)
+    view = memoryview(buffer)
+    filled = 0
+    received = 0
+    async for chunk in stream:
+        if not chunk:
+            continue
+        received += len(chunk)
+        if filled + len(chunk) > len(buffer):
+            if filled:
+                await run_in_threadpool(_write_all, fd, view[:filled])
+                filled = 0
+            if len(chunk) >= len(buffer):
+                await run_in_threadpool(_write_all, fd, chunk)
+                continue
+        view[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+    if filled:
+        await run_in_threadpool(_write_all, fd, view[:filled])
+    return received
 
 @router.get("/list")
-def list_files():
+def list_files(files_service: FilesService = Depends(get_files_service)):
     """List all uploaded files."""
     return files_service.list_files()
 
 @router.delete("/delete")
-def delete_file(fileurl: str):
+def delete_file(fileurl: str, files_service: FilesService = Depends(get_files_service)):
     """Delete a file and all its associated data points from the vector database."""
     try:
         if not fileurl:
             raise HTTPException(status_code=400, detail="File URL parameter is required")
         
-        print(f"Delete request received for file: {fileurl}")
+        logger.debug(f"Delete request received for file: {fileurl}")
         result = files_service.delete_file(fileurl)
         
         if result["status"] == "error":
@@ -50,51 +74,52 @@ def delete_file(fileurl: str):
             # Return 200 with warning message for files that don't exist
             return result
         
-        print(f"Successfully deleted file: {fileurl}")
+        logger.debug(f"Successfully deleted file: {fileurl}")
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in delete_file endpoint: {e}")
+        logger.error(f"Unexpected error in delete_file endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/upload")
-async def upload_file(request: Request, filename: str):
+async def upload_file(
+    request: Request,
+    filename: str,
+    pdf_service: PDFIngestionService = Depends(get_pdf_service),
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
+):
     """Upload and ingest a file."""
     if not filename.lower().endswith(('.pdf', '.csv')):
         return {"status": "error", "message": "Only PDF and CSV files are supported"}
     
-    # Read the raw file data from request body
-    file_data = await request.body()
-    
-    if not file_data:
-        raise HTTPException(status_code=400, detail="No file data received")
-    
     # Determine file extension for temp file
     file_ext = ".pdf" if filename.lower().endswith('.pdf') else ".csv"
-    
-    # Save uploaded file to temp location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-        tmp.write(file_data)
-        tmp_path = tmp.name
+
+    # Stream the request body straight to a temp file (peak memory = one buffer, not the whole upload)
+    fd, tmp_path = tempfile.mkstemp(suffix=file_ext)
+    try:
+        received_bytes = await _stream_to_fd(request.stream(), fd)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        os.close(fd)
+
+    if not received_bytes:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=400, detail="No file data received")
     
     try:
         if filename.lower().endswith('.pdf'):
             pdf_service.ingest_pdf(tmp_path, metadata={"filename": filename})
             return {"status": "success", "message": f"PDF {filename} uploaded and ingested successfully."}
         else:
-            # Handle CSV files using IngestionService
-            from fastapi import UploadFile
-            from io import BytesIO
-            
-            # Create UploadFile object from the file data
-            csv_file = UploadFile(
-                filename=filename,
-                file=BytesIO(file_data)
-            )
-            
-            result = ingestion_service.ingest_csv(csv_file)
+            # Handle CSV files using IngestionService; pandas reads the temp file from disk in chunks
+            with open(tmp_path, 'rb') as fh:
+                csv_file = UploadFile(filename=filename, file=fh)
+                result = ingestion_service.ingest_csv(csv_file)
             if result.success:
                 return {"status": "success", "message": f"CSV {filename} uploaded and ingested successfully. Rows processed: {result.ingested_rows}"}
             else:
@@ -1,7 +1,7 @@
 
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
-import asyncio
+from starlette.concurrency import iterate_in_threadpool
 from app.services.query_service import QueryService
 # from app.services.pdf_query_service import PDFQueryService  # Disabled to avoid memory issues
 from app.models.query import QueryRequest, QueryResponse
@@ -9,6 +9,21 @@ import os
 
 router = APIRouter()
 
+
+def _sse_event(chunk: str) -> str:
+    """Frame one chunk as a single SSE event; each newline becomes a separate data line per spec."""
+    # Fast path: most streamed tokens contain no line breaks
+    if '\n' not in chunk and '\r' not in chunk:
+        return f"data: {chunk}\n\n"
+    # Normalize Windows line endings; empty lines are preserved explicitly
+    lines = chunk.replace('\r\n', '\n').split('\n')
+    return "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+# Stop nginx/CDN proxies from buffering the event stream so tokens reach the client as they are produced
+_SSE_HEADERS = {"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+
+
 query_service = QueryService()
 # pdf_query_service = PDFQueryService(  # Disabled to avoid memory issues at startup
 #     qdrant_url=os.getenv("QDRANT_URL", "http://localhost:6333"),
@@ -38,21 +53,14 @@ async def stream_rag(request: Request):
     query_req = QueryRequest(**body)
 
     async def token_stream():
-        # Stream chunks; ensure each newline becomes a separate SSE data line per spec
-        for chunk in query_service.stream_answer(query_req):
+        # Stream chunks as SSE events (one yield per chunk)
+        # Retrieval runs on a worker thread; the Gemini stream is awaited on the event loop
+        async for chunk in query_service.astream_answer(query_req):
             if chunk is None:
                 continue
-            # Normalize Windows line endings
-            chunk = chunk.replace('\r\n', '\n')
-            lines = chunk.split('\n')
-            for i, line in enumerate(lines):
-                # Preserve empty lines explicitly
-                yield f"data: {line}\n"
-            # Event terminator
-            yield "\n"
-            await asyncio.sleep(0)  # Yield control to event loop
-
-    return StreamingResponse(token_stream(), media_type="text/event-stream")
+            yield _sse_event(chunk)
+
+    return StreamingResponse(token_stream(), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 @router.post("/stream-auto")
 async def stream_rag_auto(request: Request):
@@ -65,17 +73,9 @@ async def stream_rag_auto(request: Request):
 
     async def token_stream():
         # Use the new auto method that supports both approaches
-        for chunk in query_service.stream_answer_auto(query_req, use_function_calling):
+        async for chunk in iterate_in_threadpool(query_service.stream_answer_auto(query_req, use_function_calling)):
             if chunk is None:
                 continue
-            # Normalize Windows line endings
-            chunk = chunk.replace('\r\n', '\n')
-            lines = chunk.split('\n')
-            for i, line in enumerate(lines):
-                # Preserve empty lines explicitly
-                yield f"data: {line}\n"
-            # Event terminator
-            yield "\n"
-            await asyncio.sleep(0)  # Yield control to event loop
-
-    return StreamingResponse(token_stream(), media_type="text/event-stream")
+            yield _sse_event(chunk)
+
+    return StreamingResponse(token_stream(), media_type="text/event-stream", headers=_SSE_HEADERS)
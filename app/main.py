@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 import os
 
@@ -7,8 +10,44 @@ import os
 load_dotenv(".env.local")
 
 from app.api import ingestion, query, files
+from app.services.files_service import FilesService
+from app.services.ingestion_service import IngestionService
+from app.services.pdf_service import PDFIngestionService
+from app.services.query_service import init_rag_components
+from app.utils.colbert_embedder import ColBERTEmbedder
+from app.utils.qdrant_client import QdrantClientWrapper
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the heavy shared components once per process and expose them on app.state."""
+    collection_name = os.getenv("COLLECTION_NAME", "rag_collection")
+    qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
+    qdrant_api_key = os.getenv("QDRANT_API", "")
+
+    # One embedding model set and one Qdrant HTTP pool shared by every ingestion path
+    app.state.embedder = ColBERTEmbedder()
+    app.state.qdrant = QdrantClientWrapper()
+    app.state.ingestion = IngestionService(embedder=app.state.embedder, qdrant=app.state.qdrant)
+    app.state.pdf = PDFIngestionService(
+        qdrant_url=qdrant_url,
+        qdrant_api_key=qdrant_api_key,
+        collection_name=collection_name,
+        embedder=app.state.embedder,
+        qdrant=app.state.qdrant,
+    )
+    # Function-calling rag_search reuses the same instances, so its first call pays no init cost
+    init_rag_components(embedder=app.state.embedder, qdrant=app.state.qdrant)
+    app.state.files = FilesService(
+        qdrant_url=qdrant_url,
+        qdrant_api_key=qdrant_api_key,
+        collection_name=collection_name,
+    )
+    yield
+
+
+# orjson serializes large source lists (and numpy score scalars) in C
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,6 +58,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Optional response compression (ENABLE_COMPRESSION): Brotli with gzip fallback when brotli-asgi
+# is installed, otherwise gzip. Small bodies (< 1 KiB) are sent uncompressed.
+if os.getenv("ENABLE_COMPRESSION") is not None:
+    try:
+        from brotli_asgi import BrotliMiddleware
+        # Low quality keeps per-frame CPU small for streamed SSE responses
+        app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024, gzip_fallback=True)
+    except ImportError:
+        app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include routers for modular endpoints
 app.include_router(ingestion.router, prefix="/ingestion", tags=["ingestion"])
 app.include_router(query.router, prefix="/query", tags=["query"])
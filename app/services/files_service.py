@@ -4,50 +4,59 @@ Service for managing file operations (list, delete) in Qdrant.
 """
 
 from qdrant_client import QdrantClient, models
+from app.utils.logging_config import logger
+from app.utils.payload_index import ensure_keyword_index
+from app.utils.collection_events import collection_changed
 import os
 
 class FilesService:
     """Service for file management operations."""
     def __init__(self, qdrant_url: str, qdrant_api_key: str, collection_name: str):
         self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        self.qdrant_url = qdrant_url
         self.collection_name = collection_name
         self._ensure_filename_index()
 
     def _ensure_filename_index(self):
         """Ensure that the filename field is indexed for efficient filtering."""
-        try:
-            # Create index on filename field if it doesn't exist
-            self.client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="filename",
-                field_schema=models.PayloadSchemaType.KEYWORD
-            )
-            print(f"Created index on 'filename' field for collection {self.collection_name}")
-        except Exception as e:
-            # Index might already exist, which is fine
-            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
-                print(f"Index on 'filename' field already exists for collection {self.collection_name}")
-            else:
-                print(f"Note: Could not create index on 'filename' field: {e}")
+        ensure_keyword_index(self.client, self.collection_name, "filename", server_url=self.qdrant_url)
 
     def list_files(self):
         """List all files in the collection."""
         try:
-            # Get unique filenames from collection payloads
-            response = self.client.scroll(
+            # Server-side facet over the indexed 'filename' keyword field: one round trip,
+            # response size proportional to the number of unique files rather than points
+            result = self.client.facet(
                 collection_name=self.collection_name,
-                limit=1000,
-                with_payload=True
+                key="filename",
+                limit=int(os.getenv("FILES_LIST_LIMIT", "10000")),
             )
-            
+            return [{"pathname": hit.value} for hit in result.hits]
+        except Exception as e:
+            logger.warning(f"Facet listing unavailable, falling back to scroll: {e}")
+            return self._list_files_by_scroll()
+
+    def _list_files_by_scroll(self):
+        """Fallback for Qdrant servers without the facet API: page through points fetching only 'filename'."""
+        try:
             filenames = set()
-            for point in response[0]:
-                if point.payload and 'filename' in point.payload:
-                    filenames.add(point.payload['filename'])
-            
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=["filename"],
+                    with_vectors=False,
+                )
+                for point in points:
+                    if point.payload and 'filename' in point.payload:
+                        filenames.add(point.payload['filename'])
+                if offset is None:
+                    break
             return [{"pathname": filename} for filename in filenames]
         except Exception as e:
-            print(f"Error listing files: {e}")
+            logger.error(f"Error listing files: {e}")
             return []
 
     def delete_file(self, file_url: str):
@@ -56,41 +65,7 @@ class FilesService:
             # Extract filename from URL or use as is
             filename = file_url.split('/')[-1] if '/' in file_url else file_url
             
-            print(f"Attempting to delete file: {filename}")
-            
-            # First, check if any points exist for this file using scroll (more reliable than count)
-            scroll_result = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter={
-                    "must": [{"key": "filename", "match": {"value": filename}}]
-                },
-                limit=100,  # Get up to 100 points to count
-                with_payload=True
-            )
-            
-            points_found = len(scroll_result[0])
-            if points_found == 0:
-                print(f"No points found for file: {filename}")
-                return {"status": "warning", "message": f"No data found for file {filename}."}
-            
-            # Continue scrolling to get all points if there are more
-            total_points = points_found
-            next_page_offset = scroll_result[1]
-            
-            while next_page_offset is not None:
-                scroll_result = self.client.scroll(
-                    collection_name=self.collection_name,
-                    scroll_filter={
-                        "must": [{"key": "filename", "match": {"value": filename}}]
-                    },
-                    limit=100,
-                    offset=next_page_offset,
-                    with_payload=True
-                )
-                total_points += len(scroll_result[0])
-                next_page_offset = scroll_result[1]
-            
-            print(f"Found {total_points} points to delete for file: {filename}")
+            logger.debug(f"Attempting to delete file: {filename}")
             
             # Build a proper Qdrant filter selector (previous dict caused Unsupported points selector type error)
             filter_selector = models.Filter(
@@ -102,13 +77,27 @@ class FilesService:
                 ]
             )
 
+            # Single count request (served from the filename payload index) instead of scrolling every point
+            total_points = self.client.count(
+                collection_name=self.collection_name,
+                count_filter=filter_selector,
+                exact=True,
+            ).count
+            if total_points == 0:
+                logger.warning(f"No points found for file: {filename}")
+                return {"status": "warning", "message": f"No data found for file {filename}."}
+            
+            logger.debug(f"Found {total_points} points to delete for file: {filename}")
+
             delete_result = self.client.delete(
                 collection_name=self.collection_name,
                 points_selector=models.FilterSelector(filter=filter_selector)
             )
             
-            print(f"Delete operation completed for file: {filename}")
-            print(f"Delete result: {delete_result}")
+            logger.debug(f"Delete operation completed for file: {filename}")
+            logger.debug(f"Delete result: {delete_result}")
+            # Cached answers may cite the deleted file
+            collection_changed()
             
             return {
                 "status": "success", 
@@ -117,5 +106,5 @@ class FilesService:
             }
             
         except Exception as e:
-            print(f"Error deleting file {filename}: {e}")
+            logger.error(f"Error deleting file {filename}: {e}")
             return {"status": "error", "message": f"Failed to delete file: {str(e)}"}
@@ -1,17 +1,28 @@
 import os
 import math
+import contextlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 import pandas as pd
 from fastapi import UploadFile
 from app.utils.qdrant_client import QdrantClientWrapper
 from app.utils.colbert_embedder import ColBERTEmbedder
+from app.utils.embedding_cache import shared_embedding_cache
+from app.utils.upsert_pipeline import UpsertPipeline
+from app.utils.text_clean import CLEANED_MARKER, clean_source_text
+from app.utils.collection_events import collection_changed
+from app.utils.memory import is_oom_error, release_memory, under_memory_pressure
 from app.models.ingestion import IngestionResponse
-from app.utils.segmentation import segment_text_by_tokens, dynamic_segment_text
+from app.utils.segmentation import segment_or_whole
 from app.utils.logging_config import logger
 
 class IngestionService:
-    def __init__(self):
-        self.qdrant = QdrantClientWrapper()
-        self.embedder = ColBERTEmbedder()
+    def __init__(self, embedder: Optional[ColBERTEmbedder] = None, qdrant: Optional[QdrantClientWrapper] = None):
+        # Accept shared components from the app lifespan; build our own only when used standalone
+        self.qdrant = qdrant if qdrant is not None else QdrantClientWrapper()
+        self.embedder = embedder if embedder is not None else ColBERTEmbedder()
+        self.embedding_cache = shared_embedding_cache()
 
 
     def ingest_csv(self, file: UploadFile) -> IngestionResponse:
@@ -21,6 +32,10 @@ class IngestionService:
         - Stream CSV with pandas chunksize (INGEST_BATCH_SIZE env or default 64)
         - For each chunk, further adapt batch size on-the-fly if embedding triggers OOM / allocation errors.
         - ColBERT often the memory bottleneck; we progressively halve the batch until success (min 1).
+        - Embedding and upsert overlap: a background thread upserts batch N while batch N+1 embeds
+          (bounded queue of INGEST_PIPELINE_DEPTH batches, default 2).
+        - After each batch, if free device/system memory drops below INGEST_MEMORY_LOW_WATERMARK (default 0.15),
+          the batch size is halved and caches are released proactively instead of waiting for an OOM.
     """
         # Batch & segmentation params (all inside method scope)
         base_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "64"))
@@ -33,12 +48,33 @@ class IngestionService:
         dynamic_min_tokens = int(os.getenv("CSV_DYNAMIC_MIN_TOKENS", "120"))
         dynamic_max_tokens = int(os.getenv("CSV_DYNAMIC_MAX_TOKENS", str(soft_max_tokens)))
         adaptive_min_batch = 1
+        upsert_parallel = int(os.getenv("INGEST_PARALLEL", "1"))
+        segment_workers = int(os.getenv("CSV_SEGMENT_WORKERS", "1")) or (os.cpu_count() or 1)
+        pipeline_depth = int(os.getenv("INGEST_PIPELINE_DEPTH", "2"))
         store_text = os.getenv("STORE_CHUNK_TEXT") is not None
         chunk_text_field = os.getenv("CHUNK_TEXT_FIELD", "text")
         chunk_text_max = int(os.getenv("CHUNK_TEXT_MAX_CHARS", "1600"))
         full_text_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
         full_text_max = int(os.getenv("FULL_CHUNK_TEXT_MAX_CHARS", "8000"))
 
+        if dynamic_enabled:
+            segment_params = dict(
+                target_segment_count=dynamic_target_segments,
+                min_tokens=dynamic_min_tokens,
+                max_tokens=dynamic_max_tokens,
+                hard_max_tokens=hard_max_tokens,
+                overlap_tokens=overlap_tokens,
+            )
+        else:
+            segment_params = dict(
+                target_tokens=target_tokens,
+                soft_max_tokens=soft_max_tokens,
+                overlap_tokens=overlap_tokens,
+                hard_max_tokens=hard_max_tokens,
+            )
+        segment_fn = functools.partial(segment_or_whole, dynamic=dynamic_enabled, params=segment_params)
+        segment_chunksize = max(1, base_batch_size // max(1, segment_workers))
+
         processed_rows = 0
         total_segments = 0
         logger.info(
@@ -52,88 +88,108 @@ class IngestionService:
             except Exception:
                 pass
 
-            chunk_iter = pd.read_csv(file.file, chunksize=base_batch_size)
-            for chunk_idx, df_chunk in enumerate(chunk_iter):
-                base_texts = self._select_text_columns(df_chunk)
-                row_payloads = df_chunk.to_dict(orient="records")
+            def upsert(dense_vecs, sparse_vecs, colbert_vecs, sub_payloads):
+                if upsert_parallel > 1:
+                    self.qdrant.upsert_hybrid_parallel(
+                        dense_vecs, sparse_vecs, colbert_vecs, sub_payloads, parallel=upsert_parallel
+                    )
+                else:
+                    self.qdrant.upsert_hybrid_batch(dense_vecs, sparse_vecs, colbert_vecs, sub_payloads)
 
-                texts: list[str] = []
-                payloads: list[dict] = []
-                for row_offset, (text, row_payload) in enumerate(zip(base_texts, row_payloads)):
-                    if dynamic_enabled:
-                        segs = dynamic_segment_text(
-                            text,
-                            target_segment_count=dynamic_target_segments,
-                            min_tokens=dynamic_min_tokens,
-                            max_tokens=dynamic_max_tokens,
-                            hard_max_tokens=hard_max_tokens,
-                            overlap_tokens=overlap_tokens,
-                        ) or [text]
-                    else:
-                        segs = segment_text_by_tokens(
-                            text,
-                            target_tokens=target_tokens,
-                            soft_max_tokens=soft_max_tokens,
-                            overlap_tokens=overlap_tokens,
-                            hard_max_tokens=hard_max_tokens,
-                        ) or [text]
-                    for seg_idx, seg in enumerate(segs):
-                        seg_payload = dict(row_payload)
-                        seg_payload.update(
-                            {
-                                "_segment_index": seg_idx,
-                                "_segments_total": len(segs),
-                                "_original_row_index": processed_rows + row_offset,
-                                "filename": getattr(file, "filename", None) or getattr(file, "original_filename", None),
-                            }
-                        )
-                        if store_text:
-                            seg_payload[chunk_text_field] = seg if len(seg) <= chunk_text_max else seg[:chunk_text_max] + "…"
-                        seg_payload[full_text_field] = seg if len(seg) <= full_text_max else seg[:full_text_max] + "…"
-                        texts.append(seg)
-                        payloads.append(seg_payload)
-                total_segments += len(texts)
+            # Bulk mode (INGEST_PARALLEL > 1): defer HNSW indexing until the whole upload is done
+            bulk_ctx = self.qdrant.bulk_indexing() if upsert_parallel > 1 else contextlib.nullcontext()
+            segment_pool_ctx = ProcessPoolExecutor(max_workers=segment_workers) if segment_workers > 1 else contextlib.nullcontext()
+            with bulk_ctx, segment_pool_ctx as segment_pool, UpsertPipeline(upsert, maxsize=pipeline_depth, name="csv-upsert") as pipeline:
+                chunk_iter = pd.read_csv(file.file, chunksize=base_batch_size)
+                for chunk_idx, df_chunk in enumerate(chunk_iter):
+                    base_texts = self._select_text_columns(df_chunk)
+                    # Lazily build one payload dict per row (single pass) instead of materializing all records
+                    columns = list(df_chunk.columns)
+                    row_payloads = (dict(zip(columns, values)) for values in df_chunk.itertuples(index=False, name=None))
 
-                start = 0
-                current_batch_size = min(len(texts), base_batch_size)
-                while start < len(texts):
-                    end = min(start + current_batch_size, len(texts))
-                    sub_texts = texts[start:end]
-                    sub_payloads = payloads[start:end]
-                    while True:
-                        try:
-                            dense_vecs = self.embedder.embed_dense(sub_texts)
-                            sparse_vecs = self.embedder.embed_sparse(sub_texts)
-                            colbert_vecs = self.embedder.embed_colbert(sub_texts)
-                            self.qdrant.upsert_hybrid_batch(dense_vecs, sparse_vecs, colbert_vecs, sub_payloads)
-                            logger.info(
-                                f"Ingestion progress: rows={processed_rows + len(df_chunk)} segments={total_segments} (chunk {chunk_idx}, seg_batch {start}-{end})"
+                    texts: list[str] = []
+                    payloads: list[dict] = []
+                    # Segmentation is pure-Python CPU work; optionally fan it out across processes
+                    if segment_pool is not None:
+                        row_segments = list(segment_pool.map(segment_fn, base_texts, chunksize=segment_chunksize))
+                    else:
+                        row_segments = [segment_fn(text) for text in base_texts]
+                    for row_offset, (segs, row_payload) in enumerate(zip(row_segments, row_payloads)):
+                        for seg_idx, seg in enumerate(segs):
+                            seg_payload = dict(row_payload)
+                            seg_payload.update(
+                                {
+                                    "_segment_index": seg_idx,
+                                    "_segments_total": len(segs),
+                                    "_original_row_index": processed_rows + row_offset,
+                                    "filename": getattr(file, "filename", None) or getattr(file, "original_filename", None),
+                                }
                             )
-                            break
-                        except Exception as e:
-                            msg = str(e).lower()
-                            oom_like = any(
-                                t in msg for t in ["failed to allocate", "out of memory", "cuda error", "oom", "allocation failed"]
+                            if store_text:
+                                seg_payload[chunk_text_field] = seg if len(seg) <= chunk_text_max else seg[:chunk_text_max] + "…"
+                            # Normalized once here so queries can use the full text without re-cleaning
+                            full = clean_source_text(seg)
+                            seg_payload[full_text_field] = full if len(full) <= full_text_max else full[:full_text_max] + "…"
+                            seg_payload[CLEANED_MARKER] = True
+                            texts.append(seg)
+                            payloads.append(seg_payload)
+                    total_segments += len(texts)
+
+                    start = 0
+                    current_batch_size = min(len(texts), base_batch_size)
+                    while start < len(texts):
+                        free_before_retry = False
+                        while True:
+                            if free_before_retry:
+                                # Runs after the except frame (and its traceback) is gone, so partial tensors are collectable
+                                release_memory()
+                                free_before_retry = False
+                            # Recompute the slice each attempt so a reduced batch size takes effect
+                            end = min(start + current_batch_size, len(texts))
+                            sub_texts = texts[start:end]
+                            sub_payloads = payloads[start:end]
+                            try:
+                                # Duplicate segment text is only embedded once (content-hash cache)
+                                dense_vecs, sparse_vecs, colbert_vecs = self.embedding_cache.embed(self.embedder, sub_texts)
+                                break
+                            except Exception as e:
+                                if is_oom_error(e) and current_batch_size > adaptive_min_batch:
+                                    new_size = max(adaptive_min_batch, current_batch_size // 2)
+                                    if new_size == current_batch_size and new_size > adaptive_min_batch:
+                                        new_size = adaptive_min_batch
+                                    logger.warning(
+                                        f"Memory issue embedding CSV batch (size={current_batch_size}). Reducing to {new_size}. Error: {e}"
+                                    )
+                                    current_batch_size = new_size
+                                    free_before_retry = True
+                                    continue
+                                raise
+                        # Outside the try: upsert-thread failures surfaced here must not be retried as embedding OOMs.
+                        # Upsert happens on the pipeline thread while the next batch embeds.
+                        pipeline.submit(dense_vecs, sparse_vecs, colbert_vecs, sub_payloads)
+                        logger.info(
+                            f"Ingestion progress: rows={processed_rows + len(df_chunk)} segments={total_segments} (chunk {chunk_idx}, seg_batch {start}-{end} queued)"
+                        )
+                        del dense_vecs, sparse_vecs, colbert_vecs  # pipeline holds its own references
+                        start = end
+                        if under_memory_pressure():
+                            # Low watermark: shrink and free caches before the next allocation fails
+                            new_size = max(adaptive_min_batch, current_batch_size // 2)
+                            logger.warning(
+                                f"Low free memory after CSV batch; reducing batch size {current_batch_size} -> {new_size}"
                             )
-                            if oom_like and current_batch_size > adaptive_min_batch:
-                                new_size = max(adaptive_min_batch, current_batch_size // 2)
-                                if new_size == current_batch_size and new_size > adaptive_min_batch:
-                                    new_size = adaptive_min_batch
-                                logger.warning(
-                                    f"Memory issue embedding CSV batch (size={current_batch_size}). Reducing to {new_size}. Error: {e}"
-                                )
-                                current_batch_size = new_size
-                                continue
-                            raise
-                    start = end
-                    if current_batch_size < base_batch_size:
-                        current_batch_size = min(base_batch_size, current_batch_size * 2)
+                            current_batch_size = new_size
+                            release_memory()
+                        elif current_batch_size < base_batch_size:
+                            current_batch_size = min(base_batch_size, current_batch_size * 2)
 
-                processed_rows += len(df_chunk)
+                    processed_rows += len(df_chunk)
 
             logger.info(
-                f"Ingestion completed successfully. rows={processed_rows} segments={total_segments} dynamic={dynamic_enabled}"
+                f"Ingestion completed successfully. rows={processed_rows} segments={total_segments} dynamic={dynamic_enabled} "
+                f"embed_cache_hits={self.embedding_cache.hits} embed_cache_misses={self.embedding_cache.misses}"
             )
+            self.embedding_cache.save()
             return IngestionResponse(
                 success=True,
                 message="Ingestion successful",
@@ -149,10 +205,21 @@ class IngestionService:
                 segments=total_segments or None,
                 errors=[str(e)],
             )
+        finally:
+            # Even a partial ingest changes what queries can retrieve
+            collection_changed()
 
     def _select_text_columns(self, df: pd.DataFrame):
         # Select all object (string) columns for embedding
         text_cols = df.select_dtypes(include=["object"]).columns
-        return df[text_cols].astype(str).agg(" ".join, axis=1).tolist()
+        if len(text_cols) == 0:
+            return [""] * len(df)
+        # Column-wise Series.str.cat runs in C instead of one Python join call per row (.agg(axis=1))
+        columns = df[text_cols].astype(str)
+        first = columns.iloc[:, 0]
+        if columns.shape[1] == 1:
+            return first.tolist()
+        others = [columns.iloc[:, i] for i in range(1, columns.shape[1])]
+        return first.str.cat(others, sep=" ").tolist()
 
     # Legacy char-based _segment_text removed (token-based segmentation now centralized in segmentation.py)
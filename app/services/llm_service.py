@@ -1,29 +1,47 @@
-from typing import Generator, Optional, Tuple, List, Dict, Any
+from typing import Callable, Generator, Iterator, Mapping, Optional, Tuple, List, Dict, Any
+import asyncio
+import functools
+import hashlib
+import io
+import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+import numpy as np
 from app.utils.logging_config import logger
+from app.utils.proximity_cache import ProximityCache
+from app.utils.stream_shaping import drain_lines, shape_stream
 
-try:
-    from google import genai
-    from google.genai import types as genai_types
-except ImportError:
-    genai = None
-    logger.warning("Google Genai not available")
-
-# Lazy imports for retrieval components
-from app.utils.qdrant_client import QdrantClientWrapper
-from app.utils.colbert_embedder import ColBERTEmbedder
-
-# Module-level singletons for tool reuse
-_RAG_EMBEDDER: Optional[ColBERTEmbedder] = None
-_RAG_QDRANT: Optional[QdrantClientWrapper] = None
-
-def _get_rag_components():
-    global _RAG_EMBEDDER, _RAG_QDRANT
-    if _RAG_EMBEDDER is None:
-        _RAG_EMBEDDER = ColBERTEmbedder()
-    if _RAG_QDRANT is None:
-        _RAG_QDRANT = QdrantClientWrapper()
-    return _RAG_EMBEDDER, _RAG_QDRANT
+# Request-path settings, read once at import instead of per call / per streamed line
+_DEBUG_NEWLINES = bool(os.getenv("RAG_DEBUG_MARK_NEWLINES"))
+_NEWLINE_MARK = "⏎" if _DEBUG_NEWLINES else ""  # appended to the unterminated final line
+_METRICS_MAX_FILE_LIST = int(os.getenv("METRICS_MAX_FILE_LIST", "12"))
+
+# google.genai is imported on first use (see _import_genai) so startup and
+# retrieval-only requests do not pay for the SDK import
+genai = None
+genai_types = None
+_GENAI_IMPORTED = False
+_GENAI_LOCK = threading.Lock()
+
+
+def _import_genai() -> bool:
+    """Import google.genai once; returns whether the SDK is available."""
+    global genai, genai_types, _GENAI_IMPORTED
+    if not _GENAI_IMPORTED:
+        with _GENAI_LOCK:
+            if not _GENAI_IMPORTED:
+                try:
+                    from google import genai as _genai
+                    from google.genai import types as _genai_types
+                    genai, genai_types = _genai, _genai_types
+                except ImportError:
+                    logger.warning("Google Genai not available")
+                _GENAI_IMPORTED = True
+    return genai is not None
 
 def rag_search(question: str, top_k: int = 5, selected_files: Optional[List[str]] = None) -> Dict:
     """Retrieve relevant document segments for grounding an answer.
@@ -43,49 +61,238 @@ def rag_search(question: str, top_k: int = 5, selected_files: Optional[List[str]
 
     Notes:
         The calling model MUST ground factual claims only in returned segment text. If a fact (e.g., email, teammate name) is absent, state it is not specified.
+        Delegates to query_service.rag_search, so both tools share its retrieval components,
+        concurrent/micro-batched query encoders, embedding LRU and search TTLCache.
     """
-    try:
-        embedder, qdrant = _get_rag_components()
-        dense_q = embedder.embed_dense_query(question)
-        sparse_q = embedder.embed_sparse_query(question)
-        colbert_q = embedder.embed_colbert_query(question)
-
-        # Build optional filter
-        qdrant_filter = None
-        if selected_files:
-            from qdrant_client import models
-            qdrant_filter = models.Filter(
-                should=[
-                    models.FieldCondition(key="filename", match=models.MatchValue(value=f))
-                    for f in selected_files if f
-                ]
-            )
-        results = qdrant.query_hybrid_with_rerank(dense_q, sparse_q, colbert_q, qdrant_filter, top_k)
-        chunk_field = os.getenv("CHUNK_TEXT_FIELD", "text")
-        full_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
-        segs = []
-        for r in results:
-            payload = r.payload or {}
-            seg = {
-                "filename": payload.get("filename", "Unknown"),
-                "score": getattr(r, "score", 0.0),
-                "page": payload.get("page"),
-                "text": payload.get(chunk_field, "")
-            }
-            if payload.get(full_field):
-                seg[full_field] = payload.get(full_field)
-            segs.append(seg)
-        files = list({s["filename"] for s in segs})
-        return {
-            "question": question,
-            "segments": segs,
-            "files": files,
-            "num_segments": len(segs),
-            "unique_files": len(files)
-        }
-    except Exception as e:
-        logger.warning(f"rag_search tool failure: {e}")
-        return {"question": question, "segments": [], "files": [], "num_segments": 0, "unique_files": 0, "error": str(e)}
+    # Imported here: query_service imports this module at load time
+    from app.services import query_service
+    return query_service.rag_search(
+        question=question, top_k=top_k, selected_files=selected_files, fast=query_service._RAG_FAST_MODE
+    )
+
+
+# Greeting words/phrases as whole words, case-insensitive, in one regex pass
+_GREETING_RE = re.compile(r"\b(?:hi|hello|hey|good (?:morning|afternoon|evening))\b", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def is_greeting(question: str) -> bool:
+    """True if the question contains a greeting word/phrase; lets callers skip retrieval for trivial inputs."""
+    return bool(_GREETING_RE.search(question or ""))
+
+
+# Streaming bypass triggers, each matched in a single regex pass
+_IDENTITY_RE = re.compile(
+    r"who are you|your name|what is your name|who is ira|introduce yourself|what are you", re.IGNORECASE
+)
+_CHITCHAT_EXACT = frozenset({"hi", "hey", "hello", "hola", "yo", "sup", "hiya"})
+_CHITCHAT_PREFIX_RE = re.compile(r"good morning|good afternoon|good evening|how are you|how's it going|what's up")
+
+
+def is_identity_question(question: str) -> bool:
+    """True if the user asks who/what the assistant is."""
+    return bool(question) and _IDENTITY_RE.search(question) is not None
+
+
+def is_chitchat(question: str) -> bool:
+    """True for bare greetings or small-talk openers that need no retrieval."""
+    if not question:
+        return False
+    q = question.strip().lower()
+    return q in _CHITCHAT_EXACT or _CHITCHAT_PREFIX_RE.match(q) is not None
+
+
+# Answer style word limits (read once at import)
+_STYLE_MINIMAL_MAX_WORDS = int(os.getenv("STYLE_MINIMAL_MAX_WORDS", "25"))
+_STYLE_CONCISE_MAX_WORDS = int(os.getenv("STYLE_CONCISE_MAX_WORDS", "60"))
+_STYLE_DETAILED_MAX_WORDS = int(os.getenv("STYLE_DETAILED_MAX_WORDS", "180"))
+_DETAIL_RE = re.compile(
+    r"detailed|in detail|elaborate|elaboration|comprehensive|full explanation|full answer"
+    r"|deep dive|in depth|step by step|thorough|explain how|explain why"
+)
+_NON_MINIMAL_RE = re.compile(r"why|how|compare|difference")
+
+
+# The few possible styles, built once as read-only mappings: classify_answer_style is
+# lru_cached, so a caller mutating a returned style would corrupt every later answer
+_STYLE_EMPTY = MappingProxyType({"label": "minimal", "max_words": 25, "directive": "Respond with one short sentence."})
+_STYLE_DETAILED = MappingProxyType({
+    "label": "detailed",
+    "max_words": _STYLE_DETAILED_MAX_WORDS,
+    "directive": "Provide a structured but tight explanation; avoid fluff; include only source-grounded specifics."
+})
+_STYLE_MINIMAL = MappingProxyType({
+    "label": "minimal",
+    "max_words": _STYLE_MINIMAL_MAX_WORDS,
+    "directive": "One crisp sentence; no preamble or bullets."
+})
+_STYLE_CONCISE = MappingProxyType({
+    "label": "concise",
+    "max_words": _STYLE_CONCISE_MAX_WORDS,
+    "directive": "Answer directly in 1-3 short sentences; only add a bullet list if enumerating 3+ distinct points."
+})
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_answer_style(question: str) -> Mapping[str, Any]:
+    """Answer style (label, max_words, directive) for a question, as a read-only mapping."""
+    q = (question or "").strip().lower()
+    if not q:
+        return _STYLE_EMPTY
+    if _DETAIL_RE.search(q):
+        return _STYLE_DETAILED
+    # Extremely short or greeting-like
+    if len(q.split()) <= 6 and not _NON_MINIMAL_RE.search(q):
+        return _STYLE_MINIMAL
+    # Default concise style
+    return _STYLE_CONCISE
+
+
+# Function-calling system instructions depend only on the answer style, which takes a
+# handful of values; build each variant once instead of re-assembling ~1 KB per request.
+@functools.lru_cache(maxsize=8)
+def _auto_system_instruction(label: str, max_words: int, directive: str) -> str:
+    return (
+        "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
+        "Call rag_search ONLY if factual content from documents is required to answer.\n"
+        "If greeting / small talk / identity question: respond directly, no tool call.\n"
+        "If you call rag_search, base every fact strictly on its segments; do not invent missing data.\n"
+        "If a requested fact (like colleague names, emails) is absent, say it is not specified in the provided documents.\n"
+        "If the user explicitly asks to list / show / table / compare items (keywords: list, show, table, compare, enumerate, all X), and the retrieved segments contain 3 or more distinct items with consistent fields (e.g., filename, page, score, or clearly parallel bullet-worthy attributes), present them as a compact markdown table. One row per item, concise headers. If fewer than 3 structured items or fields are inconsistent, use a short bullet list instead. Never fabricate rows.\n"
+        "TABLE FORMAT (when used): each row MUST be on its own line; header line; separator line using pipes and dashes; no blank pipes; never collapse rows into one line; do not use HTML.\n"
+        f"Default to brevity. Style: {label} (max {max_words} words). Only produce a longer, detailed answer when the user explicitly requests depth with words like 'detailed', 'elaborate', 'step by step', 'in depth', 'comprehensive'.\n"
+        f"Answer directive: {directive}"
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _auto_stream_system_instruction(label: str, max_words: int, directive: str) -> str:
+    return (
+        "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
+        "Call rag_search ONLY if factual document content is required.\n"
+        "If greeting / small talk / identity: respond directly without calling rag_search.\n"
+        "When rag_search is called, ground every fact strictly in returned segment text.\n"
+        "If a requested fact is absent, state it is not specified in the provided documents.\n"
+        "If the user asks to list / show / table / compare (keywords: list, show, table, compare, enumerate, all <noun>), and ≥3 structured items with similar fields are present, output a concise markdown table (header + rows). Otherwise prefer a brief bullet list. Do not fabricate rows or columns.\n"
+        "TABLE FORMAT (when used): each row on its own line; header then separator; no double pipes from row merges; never join multiple rows into a single line.\n"
+        f"Default to concise output. Style: {label} (max {max_words} words). Only expand if the user explicitly asked for detail.\n"
+        f"Answer directive: {directive}"
+    )
+
+# Canned responses for the greeting / no-documents paths; only the question is spliced in per call
+_GREETING_HAS_DOCS = (
+    "Hello! I'm **IRA** (Information Retrieval Assistant), your RAG assistant.\n\n"
+    "I have access to your knowledge base and I'm ready to help answer questions "
+    "based on the uploaded documents. What would you like to know?"
+)
+_GREETING_NO_DOCS = (
+    "Hello! I'm **IRA** (Information Retrieval Assistant), your RAG assistant.\n\n"
+    "I'd be happy to help you, but I don't have any documents in my knowledge base yet. "
+    "Please **upload some documents** first, and then I can answer questions based on their content."
+)
+_Q_PREFIX = "I'd like to help answer your question about **'"
+_Q_SUFFIX_HAS_DOCS = (
+    "'**, but no files are currently selected from the knowledge base.\n\n"
+    "Please use the file manager to select the documents you want me to search through, then ask your question again."
+)
+_Q_SUFFIX_NO_DOCS = (
+    "'**, but I don't have any documents in my knowledge base yet.\n\n"
+    "Please upload some relevant documents first, and then I'll be able to provide accurate answers based on their content."
+)
+
+# Static RAG instruction preamble, built once. It is identical for every request, so it can
+# also be uploaded once as Gemini cached content (LLM_CONTEXT_CACHE) instead of re-sent each call
+_RAG_PREAMBLE = (
+    "You are IRA (Information Retrieval Assistant), a professional RAG assistant. "
+    "Default to minimal, high-signal answers. Expand only when explicitly asked (keywords: detailed, elaborate, comprehensive, in depth, step by step).\n\n"
+    "**FORMATTING:**\n"
+    "- Prefer plain sentences; bullets only if listing 3+ items.\n"
+    "- Keep markdown lightweight.\n"
+    "- Tables only when user clearly requests comparison.\n"
+    "- Do NOT exceed the max word limit.\n\n"
+    "**TABLE RULE:** If the user requests a list / table / comparison (list, show, table, compare, enumerate, all X) and there are ≥3 parallel items with similar fields (filename/page/etc.), render a compact markdown table (single header row, concise headers, one item per row). Otherwise use bullets or a sentence. Never invent rows or columns.\n\n"
+    "Table format example (each row separate):\n| Item | Attribute |\n|------|-----------|\n| A    | 1         |\n| B    | 2         |\n\n"
+)
+
+# Per-request part. Sources come first: retrieved context is often identical across follow-up
+# questions, so preamble + sources form a stable prefix for provider prefix caching and only
+# the question-dependent tail (style, question) differs
+_RAG_REQUEST_TEMPLATE = (
+    "**Sources:**\n{context}\n\n"
+    "**STYLE:** {style_label} (max {max_words} words). {directive}\n\n"
+    "**Question:** {question}\n\n"
+    "Answer:"
+)
+
+
+# Placeholder QueryService._build_context returns when retrieval finds nothing
+_NO_CONTENT_SENTINEL = "No relevant content found in the documents."
+_NO_CONTENT_SENTINEL_LEN = len(_NO_CONTENT_SENTINEL)
+
+
+def _lacks_context(context: str) -> bool:
+    """True for empty context or the no-content placeholder.
+
+    The length bound short-circuits real (large) contexts before str.strip copies them.
+    """
+    return not context or (len(context) < _NO_CONTENT_SENTINEL_LEN + 8 and context.strip() == _NO_CONTENT_SENTINEL)
+
+
+# Header line QueryService._build_context puts at the top of every source block
+_SOURCE_HEADER_RE = re.compile(r"^\*\*Source \d+\*\*[^\n]*\n?", re.MULTILINE)
+# Blank-line separator used to split context that carries no source headers
+_BLANK_LINE_RE = re.compile(r"\n[ \t]*\n")
+_CONTEXT_BLOCK_SEPARATOR = "\n\n"
+# Character budget for the context placed in a RAG prompt (read once at import)
+_CONTEXT_MAX_CHARS = int(os.getenv("LLM_CONTEXT_MAX_CHARS", "12000"))
+
+
+def _context_blocks(context: str) -> List[Tuple[str, str]]:
+    """Split context into (block, dedupe key) pairs.
+
+    With `**Source N**` headers a block is one whole source, keyed by its text below the
+    header (so renumbered repeats match); any text before the first header is its own block.
+    Without headers the blank-line separated paragraphs are the blocks.
+    """
+    headers = list(_SOURCE_HEADER_RE.finditer(context))
+    if not headers:
+        return [(b.strip(), b.strip()) for b in _BLANK_LINE_RE.split(context) if b.strip()]
+    bounds = [m.start() for m in headers] + [len(context)]
+    blocks: List[Tuple[str, str]] = []
+    preamble = context[:bounds[0]].strip()
+    if preamble:
+        blocks.append((preamble, preamble))
+    for header, start, end in zip(headers, bounds, bounds[1:]):
+        blocks.append((context[start:end].strip(), context[header.end():end].strip()))
+    return blocks
+
+
+def _normalize_context(context: str, max_chars: Optional[int] = None) -> str:
+    """Drop repeated context blocks (order preserved) and cap the total size.
+
+    Overlapping retrieval windows can hand the same text over more than once; every
+    repeated character is paid for in prefill time and tokens. Blocks (see _context_blocks)
+    are kept whole while they fit in `max_chars` (LLM_CONTEXT_MAX_CHARS, default 12000);
+    a single oversized first block is truncated.
+    """
+    if max_chars is None:
+        max_chars = _CONTEXT_MAX_CHARS
+    blocks = _context_blocks(context)
+    kept: List[str] = []
+    seen = set()
+    total = 0
+    for block, key in blocks:
+        if key in seen:
+            continue
+        seen.add(key)
+        cost = len(block) + (len(_CONTEXT_BLOCK_SEPARATOR) if kept else 0)
+        if total + cost > max_chars:
+            if not kept:
+                kept.append(block[:max_chars])
+            break
+        kept.append(block)
+        total += cost
+    return _CONTEXT_BLOCK_SEPARATOR.join(kept)
 
 
 class LLMService:
@@ -93,21 +300,137 @@ class LLMService:
     Service class for handling LLM interactions and response generation.
     Provides markdown-formatted responses for RAG applications.
     """
+    # Direct replies for the chit-chat / identity bypass (shared by streaming and non-streaming paths)
+    _IDENTITY_REPLY = "I'm IRA (Information Resource Assistant). Ask a question and I'll decide whether to consult your documents."
+    _CHITCHAT_REPLY = "Hi! I'm IRA. Ask something that might need your documents if you want a grounded answer."
+
     
-    def __init__(self):
-        """Initialize the LLM service."""
-        self.client = None
-        if genai:
-            try:
-                self.client = genai.Client()
-                logger.info("LLM service initialized successfully")
-            except Exception as e:
-                logger.warning(f"Gemini client initialization failed: {e}")
+    def __init__(self, semantic_cache: Optional[ProximityCache] = None, embed_fn: Optional[Callable[[str], Any]] = None):
+        """Initialize the LLM service.
+        
+        Args:
+            semantic_cache: Optional near-duplicate answer cache (e.g. ProximityCache())
+            embed_fn: Question -> dense vector, required for semantic_cache
+                (e.g. ColBERTEmbedder().embed_dense_query)
+        """
+        self._MODEL = "gemini-2.5-flash"
+        self.semantic_cache = semantic_cache if embed_fn is not None else None
+        self.embed_fn = embed_fn
+        # Exact-match answers keyed by BLAKE2b(rendered per-request prompt); LLM_EXACT_CACHE_SIZE=0 disables
+        self._exact_cache_size = int(os.getenv("LLM_EXACT_CACHE_SIZE", "1024"))
+        self._exact_cache: "OrderedDict[bytes, Tuple[str, str]]" = OrderedDict()
+        self._exact_cache_lock = threading.Lock()
+        # Gemini cached content holding _RAG_PREAMBLE (opt-in via LLM_CONTEXT_CACHE), created lazily
+        self._context_cache_enabled = os.getenv("LLM_CONTEXT_CACHE") is not None
+        self._context_cache_ttl = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+        self._context_cache_name: Optional[str] = None
+        self._context_cache_expires = 0.0
+        self._context_cache_lock = threading.Lock()
+        # Gemini client is built on first use; _available caches the outcome (None = not tried yet)
+        self._client = None
+        self._available: Optional[bool] = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Gemini client, constructed on first access (None if the SDK or credentials are missing)."""
+        if self._available is None:
+            with self._client_lock:
+                if self._available is None:
+                    if _import_genai():
+                        try:
+                            self._client = genai.Client()
+                            logger.info("LLM service initialized successfully")
+                        except Exception as e:
+                            logger.warning(f"Gemini client initialization failed: {e}")
+                    self._available = self._client is not None
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+        self._available = value is not None
     
     def is_available(self) -> bool:
         """Check if LLM service is available."""
         return self.client is not None
 
+    def _exact_get(self, key: bytes) -> Optional[Tuple[str, str]]:
+        with self._exact_cache_lock:
+            value = self._exact_cache.get(key)
+            if value is not None:
+                self._exact_cache.move_to_end(key)
+            return value
+
+    def _exact_put(self, key: bytes, value: Tuple[str, str]) -> None:
+        if self._exact_cache_size <= 0:
+            return
+        with self._exact_cache_lock:
+            self._exact_cache[key] = value
+            self._exact_cache.move_to_end(key)
+            while len(self._exact_cache) > self._exact_cache_size:
+                self._exact_cache.popitem(last=False)
+
+    def _preamble_cache_name(self) -> Optional[str]:
+        """Return the cached-content handle for _RAG_PREAMBLE, (re)creating it shortly before expiry."""
+        if not self._context_cache_enabled:
+            return None
+        with self._context_cache_lock:
+            if self._context_cache_name and time.monotonic() < self._context_cache_expires:
+                return self._context_cache_name
+            try:
+                cache = self.client.caches.create(
+                    model=self._MODEL,
+                    config=genai_types.CreateCachedContentConfig(
+                        system_instruction=_RAG_PREAMBLE,
+                        ttl=f"{self._context_cache_ttl}s",
+                    ),
+                )
+                self._context_cache_name = cache.name
+                # Refresh a minute early so in-flight requests never reference an expired cache
+                self._context_cache_expires = time.monotonic() + max(0, self._context_cache_ttl - 60)
+                logger.info(f"Created Gemini context cache {cache.name} for the RAG preamble")
+            except Exception as e:
+                # e.g. preamble below the model's minimum cacheable token count: stop trying
+                logger.warning(f"Gemini context caching unavailable, sending full prompts: {e}")
+                self._context_cache_enabled = False
+                self._context_cache_name = None
+            return self._context_cache_name
+
+    def _invalidate_preamble_cache(self) -> None:
+        with self._context_cache_lock:
+            self._context_cache_name = None
+            self._context_cache_expires = 0.0
+
+    def _rag_request(self, question: str, context: str, request: Optional[str] = None) -> Tuple[str, Any]:
+        """Return (contents, config) for a RAG generation call.
+
+        With a preamble cache only the per-request part is sent and the config references
+        the cached content; otherwise the full prompt is sent with no config. Pass `request`
+        when the per-request part is already rendered so it is not built twice.
+        """
+        if request is None:
+            request = self._build_rag_prompt(question, context, include_preamble=False)
+        cache_name = self._preamble_cache_name()
+        if cache_name is None:
+            return _RAG_PREAMBLE + request, None
+        return request, genai_types.GenerateContentConfig(cached_content=cache_name)
+
+    def _semantic_key(self, kind: str, question: str, context: str) -> Optional[Tuple[Any, Tuple[str, str]]]:
+        """Return (question vector, scope) for the semantic cache, or None when caching is off.
+
+        Answers are only reused for the same context (BLAKE2b digest) and output kind.
+        """
+        if self.semantic_cache is None or not self.semantic_cache.enabled:
+            return None
+        try:
+            vector = self.embed_fn(question)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None
+        ctx_hash = hashlib.blake2b(context.encode("utf-8"), digest_size=16).hexdigest()
+        return vector, (kind, ctx_hash)
+
     # ------------------------------------------------------------------
     # Automatic function calling entry point
     # ------------------------------------------------------------------
@@ -121,24 +444,19 @@ class LLMService:
         """
         if not self.is_available():
             return "LLM not configured."
+        # Same chit-chat / identity bypass as auto_answer_stream: no model round-trip needed
+        if self._is_identity_q(question):
+            return self._IDENTITY_REPLY
+        if self._is_chitchat(question):
+            return self._CHITCHAT_REPLY
         style = self._classify_answer_style(question)
-        system_instruction = (
-            "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
-            "Call rag_search ONLY if factual content from documents is required to answer.\n"
-            "If greeting / small talk / identity question: respond directly, no tool call.\n"
-            "If you call rag_search, base every fact strictly on its segments; do not invent missing data.\n"
-            "If a requested fact (like colleague names, emails) is absent, say it is not specified in the provided documents.\n"
-            "If the user explicitly asks to list / show / table / compare items (keywords: list, show, table, compare, enumerate, all X), and the retrieved segments contain 3 or more distinct items with consistent fields (e.g., filename, page, score, or clearly parallel bullet-worthy attributes), present them as a compact markdown table. One row per item, concise headers. If fewer than 3 structured items or fields are inconsistent, use a short bullet list instead. Never fabricate rows.\n"
-            "TABLE FORMAT (when used): each row MUST be on its own line; header line; separator line using pipes and dashes; no blank pipes; never collapse rows into one line; do not use HTML.\n"
-            f"Default to brevity. Style: {style['label']} (max {style['max_words']} words). Only produce a longer, detailed answer when the user explicitly requests depth with words like 'detailed', 'elaborate', 'step by step', 'in depth', 'comprehensive'.\n"
-            f"Answer directive: {style['directive']}"
-        )
+        system_instruction = _auto_system_instruction(style['label'], style['max_words'], style['directive'])
         # Provide tool with bound selected_files by partial application pattern via closure wrapper
         def rag_search_bound(question: str, top_k: int = top_k) -> Dict:
             return rag_search(question=question, top_k=top_k, selected_files=selected_files)
         try:
             resp = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+                model=self._MODEL,
                 contents=question,
                 config=genai_types.GenerateContentConfig(
                     tools=[rag_search_bound],
@@ -165,24 +483,14 @@ class LLMService:
 
         # Lightweight chit-chat / identity bypass (avoid latency and tool invocation)
         if self._is_identity_q(question):
-            yield "I'm IRA (Information Resource Assistant). Ask a question and I'll decide whether to consult your documents."
+            yield self._IDENTITY_REPLY
             return
         if self._is_chitchat(question):
-            yield "Hi! I'm IRA. Ask something that might need your documents if you want a grounded answer."
+            yield self._CHITCHAT_REPLY
             return
 
         style = self._classify_answer_style(question)
-        system_instruction = (
-            "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
-            "Call rag_search ONLY if factual document content is required.\n"
-            "If greeting / small talk / identity: respond directly without calling rag_search.\n"
-            "When rag_search is called, ground every fact strictly in returned segment text.\n"
-            "If a requested fact is absent, state it is not specified in the provided documents.\n"
-            "If the user asks to list / show / table / compare (keywords: list, show, table, compare, enumerate, all <noun>), and ≥3 structured items with similar fields are present, output a concise markdown table (header + rows). Otherwise prefer a brief bullet list. Do not fabricate rows or columns.\n"
-            "TABLE FORMAT (when used): each row on its own line; header then separator; no double pipes from row merges; never join multiple rows into a single line.\n"
-            f"Default to concise output. Style: {style['label']} (max {style['max_words']} words). Only expand if the user explicitly asked for detail.\n"
-            f"Answer directive: {style['directive']}"
-        )
+        system_instruction = _auto_stream_system_instruction(style['label'], style['max_words'], style['directive'])
         last_tool_result: Dict[str, Any] = {}
         def rag_search_bound(question: str, top_k: int = top_k) -> Dict:
             result = rag_search(question=question, top_k=top_k, selected_files=selected_files)
@@ -192,14 +500,13 @@ class LLMService:
 
         try:
             # Attempt streaming; if SDK does not support streaming for function calling we catch and fallback
-            stream = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+            stream = self.client.models.generate_content_stream(
+                model=self._MODEL,
                 contents=question,
                 config=genai_types.GenerateContentConfig(
                     tools=[rag_search_bound],
                     system_instruction=system_instruction,
                 ),
-                stream=True,
             )
             collected_any = False
             line_buffer = ""
@@ -210,30 +517,22 @@ class LLMService:
                     continue
                 collected_any = True
                 chunk_count += 1
-                newline_count = text_part.count('\n')
-                logger.info(
-                    f"LLM Chunk {chunk_count}: repr={repr(text_part)} | has_newlines={newline_count>0} | newline_count={newline_count}"
-                )
-                # Accumulate with any prior partial line
-                combined = line_buffer + text_part
-                lines = combined.split('\n')
-                # Keep last segment (may be partial if original chunk had no trailing newline)
-                line_buffer = lines.pop()  # last element
-                for line in lines:
-                    out_line = line + '\n'
-                    if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                        out_line = out_line.replace('\n', '⏎\n')
-                    yield out_line
+                # Lazy %-formatting behind a level check: nothing is built per chunk unless DEBUG is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("LLM Chunk %d len=%d", chunk_count, len(text_part))
+                # Complete lines (if any) go out as one block; the partial tail stays buffered
+                line_buffer, emit = drain_lines(line_buffer, text_part)
+                if emit:
+                    if _DEBUG_NEWLINES:
+                        emit = emit.replace('\n', '⏎\n')
+                    yield emit
             # Flush any remaining buffered partial line
             if line_buffer:
-                final_line = line_buffer
-                if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                    final_line = final_line + '⏎'
-                yield final_line
+                yield line_buffer + _NEWLINE_MARK
             if not collected_any:  # fallback (SDK gave no streaming text)
                 # Fallback full response call
                 resp = self.client.models.generate_content(
-                    model="gemini-2.5-flash",
+                    model=self._MODEL,
                     contents=question,
                     config=genai_types.GenerateContentConfig(
                         tools=[rag_search_bound],
@@ -247,32 +546,29 @@ class LLMService:
                 segments = result.get("segments", []) or []
                 if segments:
                     # Compute lightweight metrics similar to QueryService
-                    scores = [s.get("score", 0.0) for s in segments if isinstance(s, dict)]
-                    avg_score = sum(scores)/len(scores) if scores else 0.0
-                    max_score = max(scores) if scores else 0.0
-                    min_score = min(scores) if scores else 0.0
+                    # Score statistics as C-level reductions over one array
+                    scores = np.fromiter(
+                        (s.get("score", 0.0) for s in segments if isinstance(s, dict)), dtype=np.float64
+                    )
+                    if scores.size:
+                        avg_score, max_score = float(scores.mean()), float(scores.max())
+                        min_score, std = float(scores.min()), float(scores.std())
+                    else:
+                        avg_score = max_score = min_score = std = 0.0
                     files = [s.get("filename", "Unknown") for s in segments]
-                    unique_files = []
-                    seen_files = set()
-                    for f in files:
-                        if f not in seen_files:
-                            seen_files.add(f)
-                            unique_files.append(f)
+                    unique_files = list(dict.fromkeys(files))
                     diversity = (len(unique_files)/len(files)) if files else 0.0
                     # Simple confidence proxy
-                    top = max_score if scores else 0.0
-                    import math
-                    std = (sum((sc-avg_score)**2 for sc in scores)/len(scores))**0.5 if scores else 0.0
+                    top = max_score
                     confidence = top * (1 - min(std / top, 0.5)) if top > 0 else 0.0
                     # Append
                     yield "\n\n---\n**📊 Response Quality Metrics (Auto Retrieval):**\n"
                     yield f"• **Retrieval Quality:** {avg_score:.3f} (avg), {max_score:.3f} (max)\n"
                     yield f"• **Result Points Returned:** {len(segments)} segments\n"
                     if unique_files:
-                        max_list_files = int(os.getenv('METRICS_MAX_FILE_LIST', '12'))
-                        display_files = unique_files[:max_list_files]
+                        display_files = unique_files[:_METRICS_MAX_FILE_LIST]
                         files_list_str = ', '.join(display_files)
-                        if len(unique_files) > max_list_files:
+                        if len(unique_files) > _METRICS_MAX_FILE_LIST:
                             files_list_str += ', …'
                         yield f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n"
                     yield f"• **Confidence (proxy):** {confidence:.3f}/1.0\n"
@@ -281,7 +577,7 @@ class LLMService:
             logger.warning(f"auto_answer_stream failed (falling back): {e}")
             try:
                 resp = self.client.models.generate_content(
-                    model="gemini-2.5-flash",
+                    model=self._MODEL,
                     contents=question,
                     config=genai_types.GenerateContentConfig(
                         tools=[rag_search_bound],
@@ -296,41 +592,25 @@ class LLMService:
     # Lightweight intent classifiers for streaming bypass
     # ------------------------------------------------------------------
     def _is_identity_q(self, question: str) -> bool:
-        if not question:
-            return False
-        q = question.lower()
-        triggers = ["who are you", "your name", "what is your name", "who is ira", "introduce yourself", "what are you"]
-        return any(t in q for t in triggers)
+        return is_identity_question(question)
 
     def _is_chitchat(self, question: str) -> bool:
-        if not question:
-            return False
-        q = question.strip().lower()
-        greetings = {"hi", "hey", "hello", "hola", "yo", "sup", "hiya"}
-        if q in greetings:
-            return True
-        phrases = ["good morning", "good afternoon", "good evening", "how are you", "how's it going", "what's up"]
-        if any(q.startswith(p) for p in phrases):
-            return True
-        return False
+        return is_chitchat(question)
     
-    def _build_rag_prompt(self, question: str, context: str) -> str:
-        """Build a prompt that enforces adaptive brevity unless user explicitly wants detail."""
+    def _build_rag_prompt(self, question: str, context: str, include_preamble: bool = True) -> str:
+        """Build a prompt that enforces adaptive brevity unless user explicitly wants detail.
+
+        include_preamble=False returns only the per-request part (preamble served from Gemini cache).
+        """
         style = self._classify_answer_style(question)
-        return (
-            "You are IRA (Information Retrieval Assistant), a professional RAG assistant. "
-            "Default to minimal, high-signal answers. Expand only when explicitly asked (keywords: detailed, elaborate, comprehensive, in depth, step by step).\n\n"
-            "**FORMATTING:**\n"
-            "- Prefer plain sentences; bullets only if listing 3+ items.\n"
-            "- Keep markdown lightweight.\n"
-            "- Tables only when user clearly requests comparison.\n"
-            "- Do NOT exceed the max word limit.\n\n"
-            "**TABLE RULE:** If the user requests a list / table / comparison (list, show, table, compare, enumerate, all X) and there are ≥3 parallel items with similar fields (filename/page/etc.), render a compact markdown table (single header row, concise headers, one item per row). Otherwise use bullets or a sentence. Never invent rows or columns.\n\n"
-            "Table format example (each row separate):\n| Item | Attribute |\n|------|-----------|\n| A    | 1         |\n| B    | 2         |\n\n"
-            f"**STYLE:** {style['label']} (max {style['max_words']} words). {style['directive']}\n\n"
-            f"**Question:** {question}\n\n"
-            f"**Sources:**\n{context}\n\n"
-            "Answer:" )
+        request = _RAG_REQUEST_TEMPLATE.format(
+            style_label=style['label'],
+            max_words=style['max_words'],
+            directive=style['directive'],
+            question=question,
+            context=_normalize_context(context),
+        )
+        return _RAG_PREAMBLE + request if include_preamble else request
     
     def _build_greeting_response(self, question: str, has_documents: bool = False) -> str:
         """
@@ -343,29 +623,10 @@ class LLMService:
         Returns:
             Appropriate greeting response
         """
-        question_lower = question.lower()
-        is_greeting = any(greeting in question_lower for greeting in [
-            'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening'
-        ])
-        
-        if is_greeting:
-            if has_documents:
-                return ("Hello! I'm **IRA** (Information Retrieval Assistant), your RAG assistant.\n\n"
-                       "I have access to your knowledge base and I'm ready to help answer questions "
-                       "based on the uploaded documents. What would you like to know?")
-            else:
-                return ("Hello! I'm **IRA** (Information Retrieval Assistant), your RAG assistant.\n\n"
-                       "I'd be happy to help you, but I don't have any documents in my knowledge base yet. "
-                       "Please **upload some documents** first, and then I can answer questions based on their content.")
-        else:
-            if has_documents:
-                return (f"I'd like to help answer your question about **'{question}'**, but no files are currently "
-                       f"selected from the knowledge base.\n\nPlease use the file manager to select the documents "
-                       f"you want me to search through, then ask your question again.")
-            else:
-                return (f"I'd like to help answer your question about **'{question}'**, but I don't have any "
-                       f"documents in my knowledge base yet.\n\nPlease upload some relevant documents first, "
-                       f"and then I'll be able to provide accurate answers based on their content.")
+        if is_greeting(question):
+            return _GREETING_HAS_DOCS if has_documents else _GREETING_NO_DOCS
+        suffix = _Q_SUFFIX_HAS_DOCS if has_documents else _Q_SUFFIX_NO_DOCS
+        return _Q_PREFIX + question + suffix
     
     def synthesize_answer(self, question: str, context: str) -> Tuple[str, str]:
         """
@@ -383,23 +644,41 @@ class LLMService:
                     "No reasoning available (LLM disabled).")
         
         # Check if we have relevant context
-        if not context or context.strip() == "No relevant content found in the documents.":
+        if _lacks_context(context):
             answer = self._build_greeting_response(question, has_documents=False)
             return (answer, "No documents available")
-        prompt = self._build_rag_prompt(question, context)
+        # Rendered once; the preamble is constant, so the per-request part alone identifies the prompt
+        request = self._build_rag_prompt(question, context, include_preamble=False)
+        # Identical re-asks (same question + context) are a single dict lookup
+        exact_key = hashlib.blake2b(request.encode("utf-8"), digest_size=16).digest()
+        cached = self._exact_get(exact_key)
+        if cached is not None:
+            return cached
+        cache_key = self._semantic_key("synthesize", question, context)
+        if cache_key is not None:
+            cached = self.semantic_cache.get(*cache_key)
+            if cached is not None:
+                return cached
 
+        contents, config = self._rag_request(question, context, request)
         try:
-            chat = self.client.chats.create(model="gemini-2.5-flash")
-            stream = chat.send_message_stream(prompt)
-            answer_chunks = []
-
-            for chunk in stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    answer_chunks.append(chunk.text)
-
-            full_answer = "".join(answer_chunks).strip()
+            # Whole answer is needed at once: one non-streaming round trip, no per-chunk assembly
+            try:
+                resp = self.client.models.generate_content(model=self._MODEL, contents=contents, config=config)
+            except Exception as e:
+                if config is None:
+                    raise
+                # Cached preamble expired or was deleted server-side: retry once with the full prompt
+                logger.warning(f"Cached-preamble generation failed, retrying with full prompt: {e}")
+                self._invalidate_preamble_cache()
+                resp = self.client.models.generate_content(model=self._MODEL, contents=_RAG_PREAMBLE + request)
+            full_answer = ((resp.text if resp else None) or "").strip()
             reasoning = "Generated from provided source documents using LLM synthesis"
 
+            if full_answer:
+                self._exact_put(exact_key, (full_answer, reasoning))
+                if cache_key is not None:
+                    self.semantic_cache.put(cache_key[0], (full_answer, reasoning), cache_key[1])
             return full_answer, reasoning
 
         except Exception as e:
@@ -407,62 +686,121 @@ class LLMService:
             return ("I apologize, but I encountered an error while generating the response. "
                     "Please try again.", str(e))
     
-    def stream_answer(self, question: str, context: str) -> Generator[str, None, None]:
+    async def _aio_generate(self, contents: str, config: Any, semaphore: asyncio.Semaphore) -> Tuple[str, str]:
+        """One non-streaming async generation, returned in synthesize_answer's (answer, reasoning) shape."""
+        async with semaphore:
+            try:
+                resp = await self.client.aio.models.generate_content(model=self._MODEL, contents=contents, config=config)
+                answer = ((resp.text if resp else None) or "").strip()
+                return answer, "Generated from provided source documents using LLM synthesis"
+            except Exception as e:
+                logger.warning(f"LLM batch synthesis failed: {e}")
+                return ("I apologize, but I encountered an error while generating the response. "
+                        "Please try again.", str(e))
+
+    async def synthesize_answers_batch(
+        self, pairs: List[Tuple[str, str]], max_concurrency: Optional[int] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Answer many (question, context) pairs concurrently (e.g. evaluation runs).
+        
+        Args:
+            pairs: List of (question, context) tuples
+            max_concurrency: Max in-flight Gemini requests (default LLM_MAX_CONCURRENCY env or 8)
+            
+        Returns:
+            List of (answer, reasoning) tuples in input order
+        """
+        if not self.is_available():
+            return [("LLM not configured. Provide GOOGLE API credentials to enable answer synthesis.",
+                     "No reasoning available (LLM disabled).") for _ in pairs]
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def answer_one(question: str, context: str) -> Tuple[str, str]:
+            if _lacks_context(context):
+                return self._build_greeting_response(question, has_documents=False), "No documents available"
+            contents, config = self._rag_request(question, context)
+            return await self._aio_generate(contents, config, semaphore)
+
+        return list(await asyncio.gather(*[answer_one(q, c) for q, c in pairs]))
+    
+    def stream_answer(self, question: str, context: str) -> Iterator[str]:
         """
         Generate a streaming answer using the LLM.
         
+        Tiny provider chunks are coalesced (STREAM_COALESCE_MS) and oversized ones can be
+        paced (STREAM_PACE_MS); see app/utils/stream_shaping.py.
+        
         Args:
             question: User's question
             context: Context from retrieved documents
             
-        Yields:
-            Answer chunks as they are generated
+        Returns:
+            Iterator over answer chunks as they are generated
         """
+        return self._stream_raw(question, context)
+
+    def _stream_raw(self, question: str, context: str) -> Iterator[str]:
+        """Shaped answer stream shared by stream_answer and stream_answer_with_metrics (no wrapper frame per chunk)."""
+        return shape_stream(self._stream_lines(question, context))
+
+    def _stream_lines(self, question: str, context: str) -> Generator[str, None, None]:
+        """Unshaped answer stream: newline-complete lines, then any trailing partial line."""
         if not self.is_available():
             yield "LLM not configured. Provide GOOGLE API credentials to enable answer synthesis."
             return
         
         # Check if we have relevant context
-        if not context or context.strip() == "No relevant content found in the documents.":
+        if _lacks_context(context):
             answer = self._build_greeting_response(question, has_documents=False)
             # Send the complete answer as one chunk to avoid extra spacing
             yield answer
             return
-        prompt = self._build_rag_prompt(question, context)
+        cache_key = self._semantic_key("stream", question, context)
+        if cache_key is not None:
+            cached = self.semantic_cache.get(*cache_key)
+            if cached is not None:
+                yield cached
+                return
+        contents, config = self._rag_request(question, context)
 
         try:
-            chat = self.client.chats.create(model="gemini-2.5-flash")
-            stream = chat.send_message_stream(prompt)
-            chunk_idx = 0
+            # Requests are single-turn: stateless streaming call, no chat session per request
+            stream = self.client.models.generate_content_stream(model=self._MODEL, contents=contents, config=config)
+            # Cache copy of the answer accumulated in one growing buffer (no per-line list entries)
+            answer_buf = io.StringIO()
             line_buffer = ""
             chunk_count = 0
             # Always newline-aware to preserve table rows & bullet formatting
             for chunk in stream:
-                if not hasattr(chunk, 'text') or not chunk.text:
+                # One attribute probe instead of hasattr + attribute access
+                part = getattr(chunk, "text", None)
+                if not part:
                     continue
-                part = chunk.text
                 chunk_count += 1
-                newline_count = part.count('\n')
-                logger.info(
-                    f"LLM stream chunk {chunk_count}: repr={repr(part)} | has_newline={newline_count > 0} | newline_count={newline_count}"
-                )
-                # Accumulate with any prior partial line
-                combined = line_buffer + part
-                lines = combined.split('\n')
-                # Keep last segment (may be partial if original chunk had no trailing newline)
-                line_buffer = lines.pop()  # last element
-                for line in lines:
-                    out_line = line + '\n'
-                    if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                        out_line = out_line.replace('\n', '⏎\n')
-                    yield out_line
+                # Lazy %-formatting behind a level check: nothing is built per chunk unless DEBUG is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("LLM stream chunk %d len=%d", chunk_count, len(part))
+                # Complete lines (if any) go out as one block; the partial tail stays buffered
+                line_buffer, emit = drain_lines(line_buffer, part)
+                if emit:
+                    if _DEBUG_NEWLINES:
+                        emit = emit.replace('\n', '⏎\n')
+                    answer_buf.write(emit)
+                    yield emit
             # Flush any remaining buffered partial line
             if line_buffer:
-                final_line = line_buffer
-                if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                    final_line = final_line + '⏎'
+                final_line = line_buffer + _NEWLINE_MARK
+                answer_buf.write(final_line)
                 yield final_line
+            # Only completed streams are cached; a hit replays the answer as one chunk
+            if cache_key is not None and answer_buf.tell():
+                self.semantic_cache.put(cache_key[0], answer_buf.getvalue(), cache_key[1])
         except Exception as e:
+            if config is not None:
+                self._invalidate_preamble_cache()  # recreated on the next request
             logger.warning(f"Streaming LLM answer failed: {e}")
             yield f"I apologize, but I encountered an error while processing your request: {str(e)}"
     
@@ -479,41 +817,40 @@ class LLMService:
         Yields:
             Answer chunks as they are generated, followed by metrics
         """
-        # Stream the main answer
-        for chunk in self.stream_answer(question, context):
-            # (Already logged in stream_answer) pass-through
-            yield chunk
+        # Stream the main answer straight from the shaped stream
+        yield from self._stream_raw(question, context)
         
         # Add evaluation metrics at the end if available
         if evaluation_metrics:
-            yield "\n\n---\n**📊 Response Quality Metrics:**\n"
-            # Derive unique file list
-            unique_files = []
-            seen = set()
-            if sources:
-                for s in sources:
-                    fn = (s or {}).get('filename') or 'Unknown'
-                    if fn not in seen:
-                        seen.add(fn)
-                        unique_files.append(fn)
-            max_list_files = int(os.getenv('METRICS_MAX_FILE_LIST', '12'))
-            display_files = unique_files[:max_list_files]
-            files_list_str = ', '.join(display_files)
-            if len(unique_files) > max_list_files:
-                files_list_str += ', …'
-            # Metrics lines (match legacy formatting intention)
-            yield f"• **Retrieval Quality:** {evaluation_metrics.avg_retrieval_score:.3f} (avg), {evaluation_metrics.max_retrieval_score:.3f} (max)\n"
-            yield f"• **Result Points Returned:** {evaluation_metrics.num_sources_used} segments\n"
-            if unique_files:
-                yield f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n"
-            yield f"• **Confidence:** {evaluation_metrics.confidence_score:.3f}/1.0\n"
-            yield f"• **Coverage:** {evaluation_metrics.coverage_score:.3f}/1.0\n"
-            yield f"• **Source Diversity:** {evaluation_metrics.source_diversity:.3f}/1.0\n"
+            yield self._format_metrics_trailer(evaluation_metrics, sources)
+
+    @staticmethod
+    def _format_metrics_trailer(evaluation_metrics, sources: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Render the metrics block as one string so it is flushed to the client in a single write."""
+        m = evaluation_metrics
+        # Derive unique file list
+        unique_files = list(dict.fromkeys((s or {}).get('filename') or 'Unknown' for s in sources or ()))
+        files_list_str = ', '.join(unique_files[:_METRICS_MAX_FILE_LIST])
+        if len(unique_files) > _METRICS_MAX_FILE_LIST:
+            files_list_str += ', …'
+        # Metrics lines (match legacy formatting intention)
+        files_line = (
+            f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n" if unique_files else ""
+        )
+        return (
+            "\n\n---\n**📊 Response Quality Metrics:**\n"
+            f"• **Retrieval Quality:** {m.avg_retrieval_score:.3f} (avg), {m.max_retrieval_score:.3f} (max)\n"
+            f"• **Result Points Returned:** {m.num_sources_used} segments\n"
+            f"{files_line}"
+            f"• **Confidence:** {m.confidence_score:.3f}/1.0\n"
+            f"• **Coverage:** {m.coverage_score:.3f}/1.0\n"
+            f"• **Source Diversity:** {m.source_diversity:.3f}/1.0\n"
+        )
 
     # ------------------------------------------------------------------
     # Answer style classification (brevity-first)
     # ------------------------------------------------------------------
-    def _classify_answer_style(self, question: str) -> Dict[str, Any]:
+    def _classify_answer_style(self, question: str) -> Mapping[str, Any]:
         """Return answer style config emphasizing brevity unless explicit detail requested.
 
         Labels:
@@ -521,29 +858,10 @@ class LLMService:
           concise: default informative answer (<= 60 words)
           detailed: only when user explicitly requests depth (<= 180 words)
         """
-        q = (question or "").strip().lower()
-        if not q:
-            return {"label": "minimal", "max_words": 25, "directive": "Respond with one short sentence."}
-        detail_triggers = [
-            "detailed", "in detail", "elaborate", "elaboration", "comprehensive", "full explanation",
-            "full answer", "deep dive", "in depth", "step by step", "thorough", "explain how", "explain why",
-        ]
-        if any(t in q for t in detail_triggers):
-            return {
-                "label": "detailed",
-                "max_words": int(os.getenv("STYLE_DETAILED_MAX_WORDS", "180")),
-                "directive": "Provide a structured but tight explanation; avoid fluff; include only source-grounded specifics."
-            }
-        # Extremely short or greeting-like
-        if len(q.split()) <= 6 and not any(k in q for k in ["why", "how", "compare", "difference"]):
-            return {
-                "label": "minimal",
-                "max_words": int(os.getenv("STYLE_MINIMAL_MAX_WORDS", "25")),
-                "directive": "One crisp sentence; no preamble or bullets."
-            }
-        # Default concise style
-        return {
-            "label": "concise",
-            "max_words": int(os.getenv("STYLE_CONCISE_MAX_WORDS", "60")),
-            "directive": "Answer directly in 1-3 short sentences; only add a bullet list if enumerating 3+ distinct points."
-        }
+        return classify_answer_style(question)
+
+
+@functools.lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Process-wide LLMService so the Gemini client and answer caches are shared across requests."""
+    return LLMService()
@@ -1,69 +1,228 @@
 """
 pdf_query_service.py
 Service for querying PDF embeddings in Qdrant using ColPali/ColQwen2.
+
+Environment variables:
+- PDF_QUERY_CACHE_SIZE (int, default 1024) -> query embeddings kept in memory (0 disables the cache)
+- PDF_QUERY_BATCH_MAX (int, default 8) -> concurrent queries embedded in one ColPali forward
+- PDF_QUERY_BATCH_MS (float, default 0) -> extra wait for a batch to fill (0 = batch only under concurrency)
+- COLPALI_QUANT (int8|int4, optional) -> load ColPali weights quantized with bitsandbytes (CUDA only)
+- PDF_BINARY_QUANTIZATION (flag) -> enable binary quantization (in RAM) on the `original` vectors at startup
+- PDF_RESCORE_OVERSAMPLING (float, default 2.0) -> quantized candidates rescored with full vectors, per result
+- COLPALI_COMPILE (torch.compile mode, e.g. reduce-overhead; optional) -> compile and warm up the query forward at load
 """
 
+from collections import OrderedDict
+import functools
+from typing import List
 from qdrant_client import QdrantClient, models
+from app.utils.memory import under_memory_pressure
+from app.utils.micro_batch import MicroBatcher
+from app.utils.qdrant_client import transport_kwargs
+import numpy as np
 import torch
 import os
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+
+def _quantization_kwargs() -> dict:
+    """from_pretrained kwargs for COLPALI_QUANT; empty (bf16 weights) when unset or unsupported here."""
+    quant = os.getenv("COLPALI_QUANT", "").strip().lower()
+    if not quant:
+        return {}
+    if quant not in ("int8", "int4"):
+        logger.warning(f"Unsupported COLPALI_QUANT={quant!r} (expected int8 or int4); loading bf16 weights")
+        return {}
+    if not torch.cuda.is_available():
+        logger.warning(f"COLPALI_QUANT={quant} needs a CUDA device; loading bf16 weights")
+        return {}
+    try:
+        import bitsandbytes  # noqa: F401  (required by BitsAndBytesConfig at load time)
+        from transformers import BitsAndBytesConfig
+    except ImportError:
+        logger.warning(f"COLPALI_QUANT={quant} requires bitsandbytes (pip install .[quantization]); loading bf16 weights")
+        return {}
+    if quant == "int8":
+        config = BitsAndBytesConfig(load_in_8bit=True)
+    else:
+        config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+    logger.info(f"Loading ColPali with {quant} weight quantization")
+    return {"quantization_config": config}
+
+@functools.lru_cache(maxsize=1)
+def _get_colpali():
+    """(model, processor), loaded once per process and shared by every PDFQueryService instance.
+
+    low_cpu_mem_usage loads the safetensors shards via mmap instead of materializing a
+    second full copy in RAM, so CPU-resident weights stay in the shared page cache.
+    """
+    logger.info("Loading ColPali model (this may take a while)...")
+    from colpali_engine.models import ColPali, ColPaliProcessor
+
+    model = ColPali.from_pretrained(
+        "vidore/colpali-v1.3",
+        torch_dtype=torch.bfloat16,
+        device_map="cuda:0" if torch.cuda.is_available() else "cpu",
+        low_cpu_mem_usage=True,
+        **_quantization_kwargs(),
+    ).eval()
+    processor = ColPaliProcessor.from_pretrained("vidore/colpali-v1.3")
+    return model, processor
+
 class PDFQueryService:
     """Service for querying PDF embeddings in Qdrant with lazy model loading."""
     def __init__(self, qdrant_url: str, qdrant_api_key: str, collection_name: str):
-        self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key, **transport_kwargs())
         self.collection_name = collection_name
         self.model = None
         self.processor = None
+        self._rescore_params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                rescore=True,
+                oversampling=float(os.getenv("PDF_RESCORE_OVERSAMPLING", "2.0")),
+            )
+        )
+        if os.getenv("PDF_BINARY_QUANTIZATION") is not None:
+            self._enable_binary_quantization()
+        # LRU of query string -> ColPali multivector (CPU numpy), so repeat queries skip the forward pass
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = int(os.getenv("PDF_QUERY_CACHE_SIZE", "1024"))
+        self._query_cache_lock = threading.Lock()
+        # Concurrent cache misses share one processor call and model forward
+        self._query_batcher = MicroBatcher(
+            self._embed_query_batch,
+            max_batch=int(os.getenv("PDF_QUERY_BATCH_MAX", "8")),
+            window_s=float(os.getenv("PDF_QUERY_BATCH_MS", "0")) / 1000.0,
+            name="pdf-query-embed",
+        )
         logger.info("PDFQueryService initialized (models will load on first use)")
     
+    def _enable_binary_quantization(self):
+        """Binary-quantize the `original` multivectors so the final scoring stage reads 1-bit codes."""
+        try:
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                vectors_config={
+                    "original": models.VectorParamsDiff(
+                        quantization_config=models.BinaryQuantization(
+                            binary=models.BinaryQuantizationConfig(always_ram=True)
+                        )
+                    )
+                },
+            )
+            logger.info(f"Binary quantization enabled for 'original' vectors in '{self.collection_name}'")
+        except Exception as e:
+            logger.warning(f"Could not enable binary quantization on '{self.collection_name}': {e}")
+
     def _load_models(self):
         """Lazy loading of ColPali models"""
         if self.model is None:
             try:
-                logger.info("Loading ColPali model (this may take a while)...")
-                from colpali_engine.models import ColPali, ColPaliProcessor
-                
-                self.model = ColPali.from_pretrained(
-                    "vidore/colpali-v1.3",
-                    torch_dtype=torch.bfloat16,
-                    device_map="cuda:0" if torch.cuda.is_available() else "cpu",
-                ).eval()
-                
-                self.processor = ColPaliProcessor.from_pretrained("vidore/colpali-v1.3")
+                self.model, self.processor = _get_colpali()
+                compile_mode = os.getenv("COLPALI_COMPILE")
+                if compile_mode:
+                    self._compile_model(compile_mode)
                 logger.info("ColPali model loaded successfully!")
                 
             except Exception as e:
                 logger.error(f"Failed to load ColPali model: {e}")
                 raise
 
-    def query_pdf(self, query: str, search_limit: int = 10, prefetch_limit: int = 100):
+    def _compile_model(self, mode: str):
+        """torch.compile the query forward and warm it up so the first real query skips compilation.
+
+        Queries are short, so padded lengths fall into a handful of shapes; each is compiled
+        (and with reduce-overhead, CUDA-graph captured) once. Falls back to eager on failure.
+        """
+        eager_model = self.model
+        try:
+            self.model = torch.compile(eager_model, mode=mode)
+            for warmup_query in ("warmup", "what does the quarterly report say about revenue growth"):
+                processed = self.processor.process_queries([warmup_query]).to(eager_model.device)
+                with torch.inference_mode():
+                    self.model(**processed)
+            logger.info(f"ColPali query forward compiled (mode={mode})")
+        except Exception as e:
+            logger.warning(f"torch.compile(mode={mode!r}) failed, using the eager model: {e}")
+            self.model = eager_model
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """ColPali query multivector, memoized per query string and held on the CPU."""
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+
+        query_embedding = self._query_batcher.submit(query)
+
+        if self._query_cache_size > 0:
+            with self._query_cache_lock:
+                self._query_cache[query] = query_embedding
+                self._query_cache.move_to_end(query)
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return query_embedding
+
+    def _embed_query_batch(self, queries: List[str]) -> List[np.ndarray]:
+        """One ColPali forward for several queries; each row is trimmed to its own (unpadded) tokens."""
         # Load models on first use
         if self.model is None:
             self._load_models()
-            
-        processed_queries = self.processor.process_queries([query]).to(self.model.device)
-        query_embedding = self.model(**processed_queries)[0]
+
+        processed_queries = self.processor.process_queries(queries).to(self.model.device)
+        # No autograd graph or saved activations for the forward (or the slicing below)
+        with torch.inference_mode():
+            embeddings = self.model(**processed_queries)
+            attention_mask = processed_queries.get("attention_mask")
+            results = []
+            for i in range(len(queries)):
+                row = embeddings[i]
+                if attention_mask is not None:
+                    row = row[attention_mask[i].bool()]
+                # bfloat16 has no numpy dtype; Qdrant accepts float32 arrays directly
+                results.append(row.float().cpu().numpy())
+        # Results are on the CPU; drop the device-side inputs/outputs now rather than at frame exit
+        del processed_queries, embeddings, attention_mask, row
+        if torch.cuda.is_available() and under_memory_pressure():
+            # Hand cached blocks back only when the GPU is tight (e.g. shared with ingestion)
+            torch.cuda.empty_cache()
+        return results
+
+    def query_pdf(self, query: str, search_limit: int = 10, prefetch_limit: int = 100):
+        query_embedding = self._embed_query(query)
         response = self.client.query_points(
             collection_name=self.collection_name,
             query=query_embedding,
-            prefetch=[
-                models.Prefetch(
-                    query=query_embedding,
-                    limit=prefetch_limit,
-                    using="mean_pooling_columns"
-                ),
-                models.Prefetch(
-                    query=query_embedding,
-                    limit=prefetch_limit,
-                    using="mean_pooling_rows"
-                ),
-            ],
+            # Both pooled views are RRF-fused server-side into one candidate set for the `original` rerank
+            prefetch=models.Prefetch(
+                prefetch=[
+                    models.Prefetch(
+                        query=query_embedding,
+                        limit=2 * prefetch_limit,
+                        using="mean_pooling_columns"
+                    ),
+                    models.Prefetch(
+                        query=query_embedding,
+                        limit=2 * prefetch_limit,
+                        using="mean_pooling_rows"
+                    ),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=prefetch_limit,
+            ),
             limit=search_limit,
             with_payload=True,
             with_vector=False,
-            using="original"
+            using="original",
+            # Ignored unless `original` is quantized; then top candidates are rescored with full vectors
+            search_params=self._rescore_params,
         )
         return response
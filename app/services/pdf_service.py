@@ -3,148 +3,279 @@ pdf_service.py
 Service for PDF ingestion, embedding, and Qdrant upload.
 """
 
-from typing import List, Optional
+import contextlib
+import functools
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from app.utils.pdf_utils import PDFUtils
 from app.utils.qdrant_client import QdrantClientWrapper
 from app.utils.colbert_embedder import ColBERTEmbedder
-from app.utils.segmentation import segment_text_by_tokens, dynamic_segment_text
+from app.utils.embedding_cache import shared_embedding_cache
+from app.utils.memory import batch_size_for_headroom, is_oom_error, memory_free_bytes, release_memory
+from app.utils.prefetch import prefetch
+from app.utils.collection_events import collection_changed
+from app.utils.upsert_pipeline import UpsertPipeline
+from app.utils.segmentation import segment_or_whole
+from app.utils.text_clean import CLEANED_MARKER, clean_source_text
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+# Pages kept in flight per segmentation worker
+_SEGMENT_WINDOW_PER_WORKER = 4
+
+
+def _segment_pages(
+    pages: Iterable[Tuple[int, str]],
+    segment_fn: Callable[[str], List[str]],
+    segment_pool: Optional[ProcessPoolExecutor] = None,
+    segment_workers: int = 1,
+) -> Iterator[Tuple[int, List[str]]]:
+    """Yield (page index, segments) in page order, segmenting across `segment_pool` when given."""
+    if segment_pool is None:
+        for page_idx, text in pages:
+            yield page_idx, segment_fn(text)
+        return
+    # Bounded window of in-flight pages: keeps every worker busy without reading the whole
+    # PDF ahead of the embedder; futures are yielded oldest first, so page order is kept
+    window = max(1, segment_workers * _SEGMENT_WINDOW_PER_WORKER)
+    in_flight: "deque[Tuple[int, Future]]" = deque()
+    try:
+        for page_idx, text in pages:
+            in_flight.append((page_idx, segment_pool.submit(segment_fn, text)))
+            if len(in_flight) >= window:
+                done_idx, future = in_flight.popleft()
+                yield done_idx, future.result()
+        while in_flight:
+            done_idx, future = in_flight.popleft()
+            yield done_idx, future.result()
+    finally:
+        # Abandoned early (error / consumer closed): drop pages not yet started
+        for _, future in in_flight:
+            future.cancel()
+
+
+class _PDFIngestConfig(NamedTuple):
+    """Segmentation/batching settings for ingest_pdf, parsed from the environment once per service."""
+    segment_fn: Callable[[str], List[str]]
+    batch_size: int
+    pipeline_depth: int
+    segment_workers: int
+    prefetch_pages: int
+    sort_window: int
+    chunk_text_field: str
+    chunk_text_max: int
+    full_text_field: str
+    full_text_max: int
+    text_cache_dir: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> "_PDFIngestConfig":
+        target_tokens = int(os.getenv("PDF_CHUNK_TOKENS", "180"))
+        soft_max_tokens = int(os.getenv("PDF_CHUNK_MAX_TOKENS", "300"))
+        overlap_tokens = int(os.getenv("PDF_CHUNK_OVERLAP_TOKENS", "0"))
+        hard_max_tokens = int(os.getenv("PDF_CHUNK_HARD_MAX_TOKENS", "512"))
+        dynamic_enabled = os.getenv("PDF_DYNAMIC_SEGMENT") is not None
+        if dynamic_enabled:
+            segment_params = dict(
+                target_segment_count=int(os.getenv("PDF_DYNAMIC_TARGET_SEGMENTS", "12")),
+                min_tokens=int(os.getenv("PDF_DYNAMIC_MIN_TOKENS", "120")),
+                max_tokens=int(os.getenv("PDF_DYNAMIC_MAX_TOKENS", str(soft_max_tokens))),
+                hard_max_tokens=hard_max_tokens,
+                overlap_tokens=overlap_tokens,
+            )
+        else:
+            segment_params = dict(
+                target_tokens=target_tokens,
+                soft_max_tokens=soft_max_tokens,
+                overlap_tokens=overlap_tokens,
+                hard_max_tokens=hard_max_tokens,
+            )
+        batch_size = int(os.getenv("PDF_BATCH_SIZE", "64"))
+        return cls(
+            segment_fn=functools.partial(segment_or_whole, dynamic=dynamic_enabled, params=segment_params),
+            batch_size=batch_size,
+            pipeline_depth=int(os.getenv("INGEST_PIPELINE_DEPTH", "2")),
+            segment_workers=int(os.getenv("PDF_SEGMENT_WORKERS", "1")) or (os.cpu_count() or 1),
+            prefetch_pages=int(os.getenv("PDF_PREFETCH_PAGES", "8")),
+            sort_window=batch_size * max(1, int(os.getenv("PDF_LENGTH_SORT_BATCHES", "4"))),
+            chunk_text_field=os.getenv("CHUNK_TEXT_FIELD", "text"),
+            chunk_text_max=int(os.getenv("CHUNK_TEXT_MAX_CHARS", "1600")),
+            full_text_field=os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full"),
+            full_text_max=int(os.getenv("FULL_CHUNK_TEXT_MAX_CHARS", "8000")),
+            text_cache_dir=os.getenv("PDF_TEXT_CACHE_DIR") or None,
+        )
+
 class PDFIngestionService:
     """Service for ingesting and indexing PDF files into Qdrant."""
     _instance: Optional['PDFIngestionService'] = None
     _initialized = False
     
-    def __new__(cls, qdrant_url: str, qdrant_api_key: str, collection_name: str):
+    def __new__(cls, qdrant_url: str, qdrant_api_key: str, collection_name: str,
+                embedder: Optional[ColBERTEmbedder] = None, qdrant: Optional[QdrantClientWrapper] = None):
         if cls._instance is None:
             cls._instance = super(PDFIngestionService, cls).__new__(cls)
         return cls._instance
     
-    def __init__(self, qdrant_url: str, qdrant_api_key: str, collection_name: str):
+    def __init__(self, qdrant_url: str, qdrant_api_key: str, collection_name: str,
+                 embedder: Optional[ColBERTEmbedder] = None, qdrant: Optional[QdrantClientWrapper] = None):
         if PDFIngestionService._initialized:
             return
             
-        self.qdrant = QdrantClientWrapper()
-        self.embedder = ColBERTEmbedder()
+        self.qdrant = qdrant if qdrant is not None else QdrantClientWrapper()
+        self.embedder = embedder if embedder is not None else ColBERTEmbedder()
+        # Repeated headers/footers/boilerplate are embedded once (content-hash cache, shared across PDFs)
+        self.embedding_cache = shared_embedding_cache()
+        # Env settings are parsed here once rather than on every ingest_pdf call
+        self._config = _PDFIngestConfig.from_env()
         PDFIngestionService._initialized = True
         logger.info("PDFIngestionService initialized")
 
     def ingest_pdf(self, pdf_path: str, metadata: dict = None):
         """Ingest a PDF with ColBERT-aligned token segmentation & adaptive batching.
 
-        Token Env Config:
+        Token Env Config (read once, when the service is created):
         - PDF_CHUNK_TOKENS (default 180)
         - PDF_CHUNK_MAX_TOKENS (soft max, default 300)
         - PDF_CHUNK_OVERLAP_TOKENS (default 0)
         - PDF_CHUNK_HARD_MAX_TOKENS (absolute cap, default 512)
-        - PDF_BATCH_SIZE (default 64) -> embedding/upsert batch of segments
+        - PDF_BATCH_SIZE (default 64) -> embedding/upsert batch of segments (upper bound; batches are
+          capped to INGEST_MEMORY_TARGET_UTILIZATION of free memory once per-segment cost is calibrated)
+        - INGEST_PIPELINE_DEPTH (default 2) -> embedded batches queued for the background upsert thread
+        - PDF_SEGMENT_WORKERS (default 1) -> processes segmenting pages (1 = in-process, 0 = one per CPU core)
+        - PDF_PREFETCH_PAGES (default 8) -> segmented pages buffered ahead of embedding
+        - PDF_LENGTH_SORT_BATCHES (default 4) -> batches' worth of segments sorted by length before embedding
+        - PDF_TEXT_CACHE_DIR (path, optional) -> extracted page text memoized per file content hash
+
+        Pages are extracted and segmented on a background thread while earlier batches embed
+        and upsert, so extraction, embedding and upsert overlap and memory stays bounded.
         """
         try:
-            target_tokens = int(os.getenv("PDF_CHUNK_TOKENS", "180"))
-            soft_max_tokens = int(os.getenv("PDF_CHUNK_MAX_TOKENS", "300"))
-            overlap_tokens = int(os.getenv("PDF_CHUNK_OVERLAP_TOKENS", "0"))
-            hard_max_tokens = int(os.getenv("PDF_CHUNK_HARD_MAX_TOKENS", "512"))
-            dynamic_enabled = os.getenv("PDF_DYNAMIC_SEGMENT") is not None
-            dynamic_target_segments = int(os.getenv("PDF_DYNAMIC_TARGET_SEGMENTS", "12"))
-            dynamic_min_tokens = int(os.getenv("PDF_DYNAMIC_MIN_TOKENS", "120"))
-            dynamic_max_tokens = int(os.getenv("PDF_DYNAMIC_MAX_TOKENS", str(soft_max_tokens)))
-            batch_size = int(os.getenv("PDF_BATCH_SIZE", "64"))
+            cfg = self._config
+            batch_size = cfg.batch_size
             adaptive_min_batch = 1
-            store_text = os.getenv("STORE_CHUNK_TEXT") is not None
-            chunk_text_field = os.getenv("CHUNK_TEXT_FIELD", "text")
-            chunk_text_max = int(os.getenv("CHUNK_TEXT_MAX_CHARS", "1600"))
-            full_text_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
-            full_text_max = int(os.getenv("FULL_CHUNK_TEXT_MAX_CHARS", "8000"))
 
-            pages_text = PDFUtils.extract_text_from_pages(pdf_path)
             fname = (metadata or {}).get('filename', os.path.basename(pdf_path))
-            logger.info(f"Processing {len(pages_text)} pages from {fname}")
+            logger.info(f"Processing pages from {fname}")
 
-            non_empty_pages = [(idx, text) for idx, text in enumerate(pages_text) if text and text.strip()]
-            if not non_empty_pages:
-                logger.warning("No text content found in PDF")
-                return
-
-            # Build segments
-            segments = []
-            for page_idx, text in non_empty_pages:
-                if dynamic_enabled:
-                    page_segments = dynamic_segment_text(
-                        text,
-                        target_segment_count=dynamic_target_segments,
-                        min_tokens=dynamic_min_tokens,
-                        max_tokens=dynamic_max_tokens,
-                        hard_max_tokens=hard_max_tokens,
-                        overlap_tokens=overlap_tokens,
-                    ) or [text]
-                else:
-                    page_segments = segment_text_by_tokens(
-                        text,
-                        target_tokens=target_tokens,
-                        soft_max_tokens=soft_max_tokens,
-                        overlap_tokens=overlap_tokens,
-                        hard_max_tokens=hard_max_tokens,
-                    ) or [text]
-                for seg_idx, seg in enumerate(page_segments):
-                    payload = (metadata or {}).copy()
-                    payload.update({
-                        "page": page_idx,
-                        "page_number": page_idx + 1,
-                        "document_type": "pdf",
-                        "_segment_index": seg_idx,
-                        "_segments_total": len(page_segments),
-                        "filename": fname
-                    })
-                    # Always include a truncated version in primary field
-                    truncated = seg if len(seg) <= chunk_text_max else seg[:chunk_text_max] + "…"
-                    payload[chunk_text_field] = truncated
-                    # Always store a (possibly length-limited) full field for retrieval context
-                    if len(seg) <= full_text_max:
-                        payload[full_text_field] = seg
-                    else:
-                        payload[full_text_field] = seg[:full_text_max] + "…"
-                    segments.append((seg, payload))
-
-            logger.info(f"Segmented PDF into {len(segments)} segments (pages={len(non_empty_pages)})")
-
-            start = 0
-            current_batch = min(batch_size, len(segments))
+            # Static fields are merged once; each segment only adds its own small overlay
+            base_payload = {**(metadata or {}), "document_type": "pdf", "filename": fname}
+            # Segments not yet embedded, as parallel lists so batches are plain slices
+            pending_texts: List[str] = []
+            pending_payloads: List[dict] = []
+            pages_with_text = 0
+            total_segments = 0
             processed_segments = 0
-            while start < len(segments):
-                end = min(start + current_batch, len(segments))
-                sub_texts = [s for s, _ in segments[start:end]]
-                sub_payloads = [p for _, p in segments[start:end]]
-                attempt_done = False
-                while not attempt_done:
+            current_batch = batch_size
+            bytes_per_segment = None  # calibrated from the first batch that measurably used memory
+
+            def sort_pending_by_length():
+                order = sorted(range(len(pending_texts)), key=lambda i: len(pending_texts[i]))
+                pending_texts[:] = [pending_texts[i] for i in order]
+                pending_payloads[:] = [pending_payloads[i] for i in order]
+
+            def embed_next_batch(pipeline):
+                """Embed the next batch of pending segments, sized to free memory; out-of-memory errors halve it."""
+                nonlocal current_batch, processed_segments, bytes_per_segment
+                # Proactive cap from measured headroom; the OOM path below is only a safety net
+                headroom_batch = batch_size_for_headroom(current_batch, bytes_per_segment, adaptive_min_batch)
+                free_before_retry = False
+                while True:
+                    if free_before_retry:
+                        # Runs after the except frame (and its traceback) is gone, so partial tensors are collectable
+                        release_memory()
+                        free_before_retry = False
+                    # Recompute the slice each attempt so a reduced batch size takes effect
+                    n = min(current_batch, headroom_batch, len(pending_texts))
+                    sub_texts = pending_texts[:n]
+                    sub_payloads = pending_payloads[:n]
                     try:
-                        dense_vectors = self.embedder.embed_dense(sub_texts)
-                        sparse_vectors = self.embedder.embed_sparse(sub_texts)
-                        colbert_vectors = self.embedder.embed_colbert(sub_texts)
-                        self.qdrant.upsert_hybrid_batch(dense_vectors, sparse_vectors, colbert_vectors, sub_payloads)
-                        processed_segments += len(sub_texts)
-                        logger.info(f"PDF ingestion progress: {processed_segments}/{len(segments)} segments")
-                        attempt_done = True
+                        free_before = memory_free_bytes() if bytes_per_segment is None else None
+                        # Only uncached unique texts reach the models, which run concurrently (EMBED_CONCURRENT=0 for sequential)
+                        dense_vectors, sparse_vectors, colbert_vectors = self.embedding_cache.embed(self.embedder, sub_texts)
+                        if free_before is not None:
+                            free_after = memory_free_bytes()
+                            if free_after is not None and free_after < free_before:
+                                bytes_per_segment = (free_before - free_after) / n
+                                logger.info(f"Calibrated PDF embedding memory: ~{bytes_per_segment / 2**20:.1f} MiB per segment")
+                        break
                     except Exception as e:
-                        msg = str(e).lower()
-                        oom_like = any(term in msg for term in ["failed to allocate", "out of memory", "cuda error", "oom", "allocation failed"])
-                        if oom_like and current_batch > adaptive_min_batch:
-                            new_size = max(adaptive_min_batch, current_batch // 2)
-                            if new_size == current_batch and new_size > adaptive_min_batch:
-                                new_size = adaptive_min_batch
-                            logger.warning(f"Memory issue embedding PDF batch (size={current_batch}). Reducing to {new_size} and retrying. Error: {e}")
-                            current_batch = new_size
+                        if is_oom_error(e) and n > adaptive_min_batch:
+                            # Halve the batch that actually failed, which may be below current_batch (headroom cap)
+                            new_size = max(adaptive_min_batch, n // 2)
+                            logger.warning(f"Memory issue embedding PDF batch (size={n}). Reducing to {new_size} and retrying. Error: {e}")
+                            current_batch = headroom_batch = new_size
+                            free_before_retry = True
                             continue
                         raise
-                start = end
+                # Outside the try: upsert-thread failures surfaced here must not be retried as embedding OOMs.
+                # Upsert happens on the pipeline thread while the next batch embeds.
+                pipeline.submit(dense_vectors, sparse_vectors, colbert_vectors, sub_payloads)
+                del pending_texts[:n], pending_payloads[:n]
+                processed_segments += n
+                logger.info(f"PDF ingestion progress: {processed_segments}/{total_segments} segments queued (pages={pages_with_text})")
                 if current_batch < batch_size:
                     current_batch = min(batch_size, current_batch * 2)
 
-            logger.info(f"Successfully ingested PDF: pages={len(non_empty_pages)} segments={len(segments)}")
+            # Extraction + segmentation run on a producer thread, up to PDF_PREFETCH_PAGES pages ahead,
+            # while this thread embeds; memory holds a bounded window of pages rather than the whole PDF.
+            pages = ((idx, text) for idx, text in PDFUtils.iter_text_from_pages(pdf_path, cfg.text_cache_dir) if text and text.strip())
+            segment_pool_ctx = ProcessPoolExecutor(max_workers=cfg.segment_workers) if cfg.segment_workers > 1 else contextlib.nullcontext()
+            with segment_pool_ctx as segment_pool, UpsertPipeline(self.qdrant.upsert_hybrid_batch, maxsize=cfg.pipeline_depth, name="pdf-upsert") as pipeline:
+                for page_idx, page_segments in prefetch(
+                    _segment_pages(pages, cfg.segment_fn, segment_pool, cfg.segment_workers), maxsize=cfg.prefetch_pages, name="pdf-segment"
+                ):
+                    pages_with_text += 1
+                    segments_total = len(page_segments)
+                    for seg_idx, seg in enumerate(page_segments):
+                        payload = {
+                            **base_payload,
+                            "page": page_idx,
+                            "page_number": page_idx + 1,
+                            "_segment_index": seg_idx,
+                            "_segments_total": segments_total,
+                        }
+                        # Always include a truncated version in primary field
+                        truncated = seg if len(seg) <= cfg.chunk_text_max else seg[:cfg.chunk_text_max] + "…"
+                        payload[cfg.chunk_text_field] = truncated
+                        # Always store a (possibly length-limited) full field for retrieval context,
+                        # normalized once here so queries can use it without re-cleaning
+                        full = clean_source_text(seg)
+                        if len(full) <= cfg.full_text_max:
+                            payload[cfg.full_text_field] = full
+                        else:
+                            payload[cfg.full_text_field] = full[:cfg.full_text_max] + "…"
+                        payload[CLEANED_MARKER] = True
+                        pending_texts.append(seg)
+                        pending_payloads.append(payload)
+                    total_segments += segments_total
+                    if len(pending_texts) >= cfg.sort_window:
+                        # Batch similar-length segments together so each pads to a near-uniform length;
+                        # page/_segment_index in the payload keep the source order recoverable.
+                        sort_pending_by_length()
+                        while len(pending_texts) >= current_batch:
+                            embed_next_batch(pipeline)
+                sort_pending_by_length()
+                while pending_texts:
+                    embed_next_batch(pipeline)
+
+            if not pages_with_text:
+                logger.warning("No text content found in PDF")
+                return
+
+            logger.info(
+                f"Successfully ingested PDF: pages={pages_with_text} segments={total_segments} "
+                f"embed_cache_hits={self.embedding_cache.hits} embed_cache_misses={self.embedding_cache.misses}"
+            )
+            self.embedding_cache.save()
         except Exception as e:
             logger.error(f"Error during PDF ingestion: {e}")
             raise
+        finally:
+            # Even a partial ingest changes what queries can retrieve
+            collection_changed()
 
     # Legacy character-based segmentation method removed (token-based now primary)
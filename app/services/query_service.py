@@ -1,33 +1,181 @@
-from app.utils.qdrant_client import QdrantClientWrapper
+from qdrant_client import models
+from app.utils.qdrant_client import QdrantClientWrapper, filename_filter
 from app.utils.colbert_embedder import ColBERTEmbedder
 from app.models.query import QueryRequest, QueryResponse, EvaluationMetrics
 from app.utils.logging_config import logger
-from typing import List, Dict, Any, Optional, Generator
+from app.utils.collection_events import on_collection_change
+from app.utils.proximity_cache import ProximityCache
+from app.utils.micro_batch import MicroBatcher
+from app.utils.stream_shaping import coalesce_stream, drain_lines
+from app.utils.text_clean import CLEANED_MARKER, clean_source_text
+from app.utils.ttl_cache import TTLCache
+from app.services import llm_service
+from app.services.llm_service import _import_genai, classify_answer_style, is_chitchat, is_greeting, is_identity_question
+from typing import AsyncGenerator, List, Dict, Any, Mapping, NamedTuple, Optional, Generator, Tuple
+import asyncio
+import functools
+import logging
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import re
 import numpy as np
+import orjson
 
-from google import genai
-from google.genai import types as genai_types
+# google.genai is imported on the first QueryService() via llm_service's shared loader,
+# so workers that never build a QueryService (or run without the SDK) skip the import
+genai_types = None
+
+# Request-path settings, read once at import instead of per call / per streamed line
+_CHUNK_FIELD = os.getenv("CHUNK_TEXT_FIELD", "text")
+_FULL_FIELD = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
+_DEBUG_NEWLINES = bool(os.getenv("RAG_DEBUG_MARK_NEWLINES"))
+_NEWLINE_MARK = "⏎" if _DEBUG_NEWLINES else ""  # appended to the unterminated final line
+_METRICS_MAX_FILE_LIST = int(os.getenv("METRICS_MAX_FILE_LIST", "12"))
+
+# Question/source tokenization and ignored words for the coverage metric
+_WORD_RE = re.compile(r'\w+')
+_COVERAGE_STOP_WORDS = frozenset({
+    'the','a','an','and','or','but','in','on','at','to','for','of','with','by','is','are','was','were',
+    'what','how','who','when','where','why','which','that','this','these','those'
+})
 
 # Module-level singletons for function calling tool reuse
 _RAG_EMBEDDER: Optional[ColBERTEmbedder] = None
 _RAG_QDRANT: Optional[QdrantClientWrapper] = None
 
+_RAG_LOCK = threading.Lock()
+
 def _get_rag_components():
     global _RAG_EMBEDDER, _RAG_QDRANT
-    if _RAG_EMBEDDER is None:
-        _RAG_EMBEDDER = ColBERTEmbedder()
-    if _RAG_QDRANT is None:
-        _RAG_QDRANT = QdrantClientWrapper()
+    # Double-checked so concurrent first calls cannot each load a model set / open a client
+    if _RAG_EMBEDDER is None or _RAG_QDRANT is None:
+        with _RAG_LOCK:
+            if _RAG_EMBEDDER is None:
+                _RAG_EMBEDDER = ColBERTEmbedder()
+            if _RAG_QDRANT is None:
+                _RAG_QDRANT = QdrantClientWrapper()
     return _RAG_EMBEDDER, _RAG_QDRANT
 
-def rag_search(question: str, top_k: int = 5, selected_files: Optional[List[str]] = None) -> Dict:
+
+def init_rag_components(embedder: Optional[ColBERTEmbedder] = None, qdrant: Optional[QdrantClientWrapper] = None):
+    """Warm the rag_search components at startup, reusing the app's shared instances when given."""
+    global _RAG_EMBEDDER, _RAG_QDRANT
+    with _RAG_LOCK:
+        if _RAG_EMBEDDER is None and embedder is not None:
+            _RAG_EMBEDDER = embedder
+        if _RAG_QDRANT is None and qdrant is not None:
+            _RAG_QDRANT = qdrant
+    return _get_rag_components()
+
+
+# Short-lived cache of raw search hits; cleared whenever ingestion/deletion changes the
+# collection (collection_events), with the TTL as a backstop
+_SEARCH_CACHE = TTLCache(
+    maxsize=int(os.getenv("RAG_SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RAG_SEARCH_CACHE_TTL", "30")),
+)
+
+
+@on_collection_change
+def clear_search_cache() -> None:
+    """Drop every cached rag_search result."""
+    _SEARCH_CACHE.clear()
+
+
+# One worker per query encoder; separate from the ingestion pool so uploads cannot delay queries
+_RAG_EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="rag_embed")
+
+
+def _embed_query_batch(questions: List[str], with_colbert: bool = True) -> List[tuple]:
+    """(dense, sparse, ColBERT) embeddings for several questions with one pass per encoder.
+
+    The encoders are independent ONNX sessions that release the GIL, so they run
+    concurrently (unless EMBED_CONCURRENT=0) and latency approaches the slowest one.
+    With with_colbert=False the ColBERT pass is skipped and its slot is None (fast mode).
+    """
+    embedder, _ = _get_rag_components()
+    if os.getenv("EMBED_CONCURRENT", "1") == "0":
+        dense = embedder.embed_dense_queries(questions)
+        sparse = embedder.embed_sparse_queries(questions)
+        colbert = embedder.embed_colbert_queries(questions) if with_colbert else [None] * len(questions)
+        return list(zip(dense, sparse, colbert))
+    dense_future = _RAG_EMBED_EXECUTOR.submit(embedder.embed_dense_queries, questions)
+    sparse_future = _RAG_EMBED_EXECUTOR.submit(embedder.embed_sparse_queries, questions)
+    colbert_future = _RAG_EMBED_EXECUTOR.submit(embedder.embed_colbert_queries, questions) if with_colbert else None
+    colbert = colbert_future.result() if colbert_future is not None else [None] * len(questions)
+    return list(zip(dense_future.result(), sparse_future.result(), colbert))
+
+
+def _make_query_batcher(with_colbert: bool) -> MicroBatcher:
+    return MicroBatcher(
+        functools.partial(_embed_query_batch, with_colbert=with_colbert),
+        max_batch=int(os.getenv("RAG_QUERY_BATCH_MAX", "32")),
+        max_tokens=int(os.getenv("RAG_QUERY_BATCH_TOKENS", "1024")),
+        window_s=float(os.getenv("RAG_QUERY_BATCH_MS", "0")) / 1000.0,
+        name="rag-query-embed" if with_colbert else "rag-query-embed-fast",
+    )
+
+
+# Concurrent rag_search tool calls (one per streaming request thread) share encoder passes
+_QUERY_BATCHER = _make_query_batcher(with_colbert=True)
+_FAST_QUERY_BATCHER = _make_query_batcher(with_colbert=False)
+
+# RAG_FAST_MODE: function-calling retrieval skips the ColBERT query encoder and rerank stage
+_RAG_FAST_MODE = os.getenv("RAG_FAST_MODE") is not None
+
+
+class _StreamPlan(NamedTuple):
+    """What stream_answer needs after retrieval: a direct reply, or the prompt plus metrics inputs."""
+    reply: Optional[str]
+    prompt: Optional[str] = None
+    sources: Optional[List[Dict[str, Any]]] = None
+    eval_metrics: Optional[EvaluationMetrics] = None
+
+
+class _Segment(NamedTuple):
+    """One rag_search hit, slotted so cached results hold no per-hit dict or Qdrant point."""
+    filename: str
+    score: float
+    page: Optional[int]
+    text: str
+    text_full: Optional[str] = None
+
+    @classmethod
+    def from_point(cls, point) -> "_Segment":
+        payload = point.payload or {}
+        return cls(
+            payload.get("filename", "Unknown"),
+            getattr(point, "score", 0.0),
+            payload.get("page"),
+            payload.get(_CHUNK_FIELD, ""),
+            payload.get(_FULL_FIELD) or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready form returned to the model; the full-text field only when present."""
+        seg = {"filename": self.filename, "score": self.score, "page": self.page, "text": self.text}
+        if self.text_full:
+            seg[_FULL_FIELD] = self.text_full
+        return seg
+
+
+@functools.lru_cache(maxsize=512)
+def _embed_query_cached(q_norm: str, with_colbert: bool = True):
+    """(dense, sparse, ColBERT-or-None) query embeddings, memoized so hot questions skip the encoders."""
+    batcher = _QUERY_BATCHER if with_colbert else _FAST_QUERY_BATCHER
+    return batcher.submit(q_norm)
+
+
+def rag_search(question: str, top_k: int = 5, selected_files: Optional[List[str]] = None, fast: bool = False) -> Dict:
     """Retrieve relevant document segments for grounding an answer.
 
     Args:
         question: Natural language user query requiring factual lookup.
         top_k: Maximum number of segments to return (default 5).
         selected_files: Optional list of filenames to constrain search scope.
+        fast: Dense + BM25 with Reciprocal Rank Fusion only; skips the ColBERT query
+            embedding and rerank stage (lower latency, slightly coarser ranking).
 
     Returns:
         Dict containing:
@@ -42,48 +190,43 @@ def rag_search(question: str, top_k: int = 5, selected_files: Optional[List[str]
         For summary-like queries with higher top_k, attempts to diversify results across different source files.
     """
     try:
-        embedder, qdrant = _get_rag_components()
-        dense_q = embedder.embed_dense_query(question)
-        sparse_q = embedder.embed_sparse_query(question)
-        colbert_q = embedder.embed_colbert_query(question)
-
-        # Build optional filter
-        qdrant_filter = None
-        if selected_files:
-            from qdrant_client import models
-            qdrant_filter = models.Filter(
-                should=[
-                    models.FieldCondition(key="filename", match=models.MatchValue(value=f))
-                    for f in selected_files if f
-                ]
-            )
-        
+        _, qdrant = _get_rag_components()
+        q_norm = " ".join(question.split())
+
         # For better diversity, especially on summary queries, retrieve more results initially
         # then post-process for diversity if top_k is high (indicating summary request)
         initial_k = max(top_k, top_k * 2) if top_k > 10 else top_k
-        
-        results = qdrant.query_hybrid_with_rerank(dense_q, sparse_q, colbert_q, qdrant_filter, initial_k)
+
+        # Identical searches within RAG_SEARCH_CACHE_TTL skip embedding and Qdrant entirely
+        wanted_files = tuple(sorted(f for f in selected_files or () if f))
+        search_key = (q_norm, wanted_files, initial_k, fast)
+        results = _SEARCH_CACHE.get(search_key)
+        if results is None:
+            dense_q, sparse_q, colbert_q = _embed_query_cached(q_norm, not fast)
+
+            # Optional filter, reused across questions against the same file selection
+            qdrant_filter = filename_filter(wanted_files) if wanted_files else None
+
+            if fast:
+                points = qdrant.query_hybrid_rrf(dense_q, sparse_q, qdrant_filter, initial_k)
+            else:
+                points = qdrant.query_hybrid_with_rerank(dense_q, sparse_q, colbert_q, qdrant_filter, initial_k)
+            # Cache compact records rather than full Qdrant points
+            results = [_Segment.from_point(p) for p in points or ()]
+            _SEARCH_CACHE.put(search_key, results)
+        if not results:
+            # No hits (common for narrow file filters): nothing to diversify or shape
+            return {"question": question, "segments": [], "files": [], "num_segments": 0, "unique_files": 0}
         
         # Apply diversity filtering if we retrieved more than requested (summary mode)
         if len(results) > top_k and top_k > 10:
             # Diversify results to ensure better file coverage
             results = _diversify_results_by_file(results, top_k)
         
-        chunk_field = os.getenv("CHUNK_TEXT_FIELD", "text")
-        full_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
-        segs = []
-        for r in results:
-            payload = r.payload or {}
-            seg = {
-                "filename": payload.get("filename", "Unknown"),
-                "score": getattr(r, "score", 0.0),
-                "page": payload.get("page"),
-                "text": payload.get(chunk_field, "")
-            }
-            if payload.get(full_field):
-                seg[full_field] = payload.get(full_field)
-            segs.append(seg)
-        files = list({s["filename"] for s in segs})
+        # Dicts only at the tool boundary (Gemini serializes the return value)
+        segs = [r.to_dict() for r in results]
+        # Distinct filenames in retrieval order
+        files = list(dict.fromkeys(r.filename for r in results))
         return {
             "question": question,
             "segments": segs,
@@ -100,7 +243,7 @@ def _diversify_results_by_file(results, target_k: int):
     """Diversify search results to ensure better coverage across different files.
     
     Args:
-        results: List of search results with .payload containing filename
+        results: List of _Segment search results
         target_k: Target number of results to return
         
     Returns:
@@ -112,7 +255,7 @@ def _diversify_results_by_file(results, target_k: int):
     # Group results by filename
     by_file = {}
     for result in results:
-        filename = result.payload.get("filename", "Unknown") if result.payload else "Unknown"
+        filename = result.filename
         if filename not in by_file:
             by_file[filename] = []
         by_file[filename].append(result)
@@ -125,7 +268,7 @@ def _diversify_results_by_file(results, target_k: int):
     for filename, file_results in by_file.items():
         if len(diversified) < target_k:
             # Take the highest scoring result from this file
-            best_result = max(file_results, key=lambda r: getattr(r, 'score', 0.0))
+            best_result = max(file_results, key=lambda r: r.score)
             diversified.append(best_result)
             files_used.add(filename)
             file_results.remove(best_result)  # Remove it so we don't pick it again
@@ -136,7 +279,7 @@ def _diversify_results_by_file(results, target_k: int):
         remaining_results.extend(file_results)
     
     # Sort remaining by score and take the best ones
-    remaining_results.sort(key=lambda r: getattr(r, 'score', 0.0), reverse=True)
+    remaining_results.sort(key=lambda r: r.score, reverse=True)
     
     slots_remaining = target_k - len(diversified)
     diversified.extend(remaining_results[:slots_remaining])
@@ -144,14 +287,90 @@ def _diversify_results_by_file(results, target_k: int):
     return diversified
 
 
+# Function-calling system instructions depend only on summary mode and the answer style,
+# which take a handful of values; build each variant once instead of per request.
+_SUMMARY_INSTRUCTION = (
+    "SUMMARY MODE DETECTED: The user is asking for a summary or overview. When you call rag_search:\n"
+    "- Synthesize information from multiple diverse sources\n"
+    "- Highlight key themes and topics across different documents\n"
+    "- Organize information logically with clear structure\n"
+    "- Include insights from as many different source files as possible\n"
+    "- Use bullet points or numbered lists for clarity when presenting multiple points\n"
+)
+
+
+@functools.lru_cache(maxsize=16)
+def _auto_system_instruction(is_summary: bool, label: str, max_words: int, directive: str) -> str:
+    base_instruction = (
+        "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
+        "Call rag_search ONLY if factual content from documents is required to answer.\n"
+        "If greeting / small talk / identity question: respond directly, no tool call.\n"
+        "If you call rag_search, base every fact strictly on its segments; do not invent missing data.\n"
+        "If a requested fact (like colleague names, emails) is absent, say it is not specified in the provided documents.\n"
+    )
+    return (
+        base_instruction
+        + (_SUMMARY_INSTRUCTION if is_summary else "")
+        + "If the user explicitly asks to list / show / table / compare items (keywords: list, show, table, compare, enumerate, all X), and the retrieved segments contain 3 or more distinct items with consistent fields (e.g., filename, page, score, or clearly parallel bullet-worthy attributes), present them as a compact markdown table. One row per item, concise headers. If fewer than 3 structured items or fields are inconsistent, use a short bullet list instead. Never fabricate rows.\n"
+        "TABLE FORMAT (when used): each row MUST be on its own line; header line; separator line using pipes and dashes; no blank pipes; never collapse rows into one line; do not use HTML.\n"
+        f"Default to brevity. Style: {label} (max {max_words} words). Only produce a longer, detailed answer when the user explicitly requests depth with words like 'detailed', 'elaborate', 'step by step', 'in depth', 'comprehensive'.\n"
+        f"Answer directive: {directive}"
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def _auto_stream_system_instruction(is_summary: bool, label: str, max_words: int, directive: str) -> str:
+    base_instruction = (
+        "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
+        "Call rag_search ONLY if factual document content is required.\n"
+        "If greeting / small talk / identity: respond directly without calling rag_search.\n"
+        "When rag_search is called, ground every fact strictly in returned segment text.\n"
+        "If a requested fact is absent, state it is not specified in the provided documents.\n"
+    )
+    summary_instruction = (
+        _SUMMARY_INSTRUCTION
+        + "- Provide a comprehensive view that draws from the breadth of available sources\n"
+    )
+    return (
+        base_instruction
+        + (summary_instruction if is_summary else "")
+        + "If the user asks to list / show / table / compare (keywords: list, show, table, compare, enumerate, all <noun>), and ≥3 structured items with similar fields are present, output a concise markdown table (header + rows). Otherwise prefer a brief bullet list. Do not fabricate rows or columns.\n"
+        "TABLE FORMAT (when used): each row on its own line; header then separator; no double pipes from row merges; never join multiple rows into a single line.\n"
+        f"Default to concise output. Style: {label} (max {max_words} words). Only expand if the user explicitly asked for detail.\n"
+        f"Answer directive: {directive}"
+    )
+
+
+def _load_genai() -> bool:
+    """Import google.genai (once, shared with llm_service) and bind its types module here."""
+    global genai_types
+    if not _import_genai():
+        return False
+    genai_types = llm_service.genai_types
+    return True
+
+
 class QueryService:
+    # Direct replies for the chit-chat / identity bypass (shared by streaming and non-streaming paths)
+    _IDENTITY_REPLY = "I'm IRA (Information Resource Assistant). Ask a question and I'll decide whether to consult your documents."
+    _CHITCHAT_REPLY = "Hi! I'm IRA. Ask something that might need your documents if you want a grounded answer."
+
     def __init__(self):
         self.qdrant = QdrantClientWrapper()
         self.embedder = ColBERTEmbedder()
+        self.proximity_cache = ProximityCache()
+        # Concurrent query/stream_answer searches share one Qdrant query_batch_points round-trip
+        self._search_batcher = MicroBatcher(
+            self._search_batch,
+            max_batch=int(os.getenv("RAG_SEARCH_BATCH_MAX", "16")),
+            window_s=float(os.getenv("RAG_SEARCH_BATCH_MS", "0")) / 1000.0,
+            name="qdrant-search",
+            cost_fn=lambda search: 1,
+        )
         self.llm_client = None
-        if genai:
+        if _load_genai():
             try:
-                self.llm_client = genai.Client()
+                self.llm_client = llm_service.genai.Client()
             except Exception as e:
                 logger.warning(f"Gemini client init failed: {e}")
 
@@ -174,6 +393,11 @@ class QueryService:
         """
         if not self.is_available():
             return "LLM not configured."
+        # Same chit-chat / identity bypass as auto_answer_stream: no model round-trip needed
+        if self._is_identity_q(question):
+            return self._IDENTITY_REPLY
+        if self._is_chitchat(question):
+            return self._CHITCHAT_REPLY
         
         # Detect summary requests and enhance top_k for better diversity
         is_summary = self._is_summary_request(question)
@@ -181,38 +405,11 @@ class QueryService:
         
         style = self._classify_answer_style(question)
         
-        # Enhanced system instruction for summary requests
-        base_instruction = (
-            "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
-            "Call rag_search ONLY if factual content from documents is required to answer.\n"
-            "If greeting / small talk / identity question: respond directly, no tool call.\n"
-            "If you call rag_search, base every fact strictly on its segments; do not invent missing data.\n"
-            "If a requested fact (like colleague names, emails) is absent, say it is not specified in the provided documents.\n"
-        )
-        
-        if is_summary:
-            summary_instruction = (
-                "SUMMARY MODE DETECTED: The user is asking for a summary or overview. When you call rag_search:\n"
-                "- Synthesize information from multiple diverse sources\n" 
-                "- Highlight key themes and topics across different documents\n"
-                "- Organize information logically with clear structure\n"
-                "- Include insights from as many different source files as possible\n"
-                "- Use bullet points or numbered lists for clarity when presenting multiple points\n"
-            )
-            system_instruction = base_instruction + summary_instruction
-        else:
-            system_instruction = base_instruction
-            
-        system_instruction += (
-            "If the user explicitly asks to list / show / table / compare items (keywords: list, show, table, compare, enumerate, all X), and the retrieved segments contain 3 or more distinct items with consistent fields (e.g., filename, page, score, or clearly parallel bullet-worthy attributes), present them as a compact markdown table. One row per item, concise headers. If fewer than 3 structured items or fields are inconsistent, use a short bullet list instead. Never fabricate rows.\n"
-            "TABLE FORMAT (when used): each row MUST be on its own line; header line; separator line using pipes and dashes; no blank pipes; never collapse rows into one line; do not use HTML.\n"
-            f"Default to brevity. Style: {style['label']} (max {style['max_words']} words). Only produce a longer, detailed answer when the user explicitly requests depth with words like 'detailed', 'elaborate', 'step by step', 'in depth', 'comprehensive'.\n"
-            f"Answer directive: {style['directive']}"
-        )
-        
+        system_instruction = _auto_system_instruction(is_summary, style['label'], style['max_words'], style['directive'])
+
         # Provide tool with bound selected_files by partial application pattern via closure wrapper
         def rag_search_bound(question: str, top_k: int = effective_top_k) -> Dict:
-            return rag_search(question=question, top_k=top_k, selected_files=selected_files)
+            return rag_search(question=question, top_k=top_k, selected_files=selected_files, fast=_RAG_FAST_MODE)
         try:
             resp = self.llm_client.models.generate_content(
                 model="gemini-2.5-flash",
@@ -240,10 +437,10 @@ class QueryService:
 
         # Lightweight chit-chat / identity bypass (avoid latency and tool invocation)
         if self._is_identity_q(question):
-            yield "I'm IRA (Information Resource Assistant). Ask a question and I'll decide whether to consult your documents."
+            yield self._IDENTITY_REPLY
             return
         if self._is_chitchat(question):
-            yield "Hi! I'm IRA. Ask something that might need your documents if you want a grounded answer."
+            yield self._CHITCHAT_REPLY
             return
 
         # Detect summary requests and enhance top_k for better diversity
@@ -252,53 +449,24 @@ class QueryService:
         
         style = self._classify_answer_style(question)
         
-        # Enhanced system instruction for summary requests
-        base_instruction = (
-            "You are IRA (Information Resource Assistant). Decide whether the user question needs document grounding.\n"
-            "Call rag_search ONLY if factual document content is required.\n"
-            "If greeting / small talk / identity: respond directly without calling rag_search.\n"
-            "When rag_search is called, ground every fact strictly in returned segment text.\n"
-            "If a requested fact is absent, state it is not specified in the provided documents.\n"
-        )
-        
-        if is_summary:
-            summary_instruction = (
-                "SUMMARY MODE DETECTED: The user is asking for a summary or overview. When you call rag_search:\n"
-                "- Synthesize information from multiple diverse sources\n" 
-                "- Highlight key themes and topics across different documents\n"
-                "- Organize information logically with clear structure\n"
-                "- Include insights from as many different source files as possible\n"
-                "- Use bullet points or numbered lists for clarity when presenting multiple points\n"
-                "- Provide a comprehensive view that draws from the breadth of available sources\n"
-            )
-            system_instruction = base_instruction + summary_instruction
-        else:
-            system_instruction = base_instruction
-            
-        system_instruction += (
-            "If the user asks to list / show / table / compare (keywords: list, show, table, compare, enumerate, all <noun>), and ≥3 structured items with similar fields are present, output a concise markdown table (header + rows). Otherwise prefer a brief bullet list. Do not fabricate rows or columns.\n"
-            "TABLE FORMAT (when used): each row on its own line; header then separator; no double pipes from row merges; never join multiple rows into a single line.\n"
-            f"Default to concise output. Style: {style['label']} (max {style['max_words']} words). Only expand if the user explicitly asked for detail.\n"
-            f"Answer directive: {style['directive']}"
-        )
-        
+        system_instruction = _auto_stream_system_instruction(is_summary, style['label'], style['max_words'], style['directive'])
+
         last_tool_result: Dict[str, Any] = {}
         def rag_search_bound(question: str, top_k: int = effective_top_k) -> Dict:
-            result = rag_search(question=question, top_k=top_k, selected_files=selected_files)
+            result = rag_search(question=question, top_k=top_k, selected_files=selected_files, fast=_RAG_FAST_MODE)
             # Store for metrics after streaming
             last_tool_result["result"] = result
             return result
 
         try:
             # Attempt streaming; if SDK does not support streaming for function calling we catch and fallback
-            stream = self.llm_client.models.generate_content(
+            stream = self.llm_client.models.generate_content_stream(
                 model="gemini-2.5-flash",
                 contents=question,
                 config=genai_types.GenerateContentConfig(
                     tools=[rag_search_bound],
                     system_instruction=system_instruction,
                 ),
-                stream=True,
             )
             collected_any = False
             line_buffer = ""
@@ -309,26 +477,18 @@ class QueryService:
                     continue
                 collected_any = True
                 chunk_count += 1
-                newline_count = text_part.count('\n')
-                logger.info(
-                    f"LLM Chunk {chunk_count}: repr={repr(text_part)} | has_newlines={newline_count>0} | newline_count={newline_count}"
-                )
-                # Accumulate with any prior partial line
-                combined = line_buffer + text_part
-                lines = combined.split('\n')
-                # Keep last segment (may be partial if original chunk had no trailing newline)
-                line_buffer = lines.pop()  # last element
-                for line in lines:
-                    out_line = line + '\n'
-                    if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                        out_line = out_line.replace('\n', '⏎\n')
-                    yield out_line
+                # Lazy %-formatting behind a level check: nothing is built per chunk unless DEBUG is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("LLM Chunk %d len=%d", chunk_count, len(text_part))
+                # Complete lines (if any) go out as one block; the partial tail stays buffered
+                line_buffer, emit = drain_lines(line_buffer, text_part)
+                if emit:
+                    if _DEBUG_NEWLINES:
+                        emit = emit.replace('\n', '⏎\n')
+                    yield emit
             # Flush any remaining buffered partial line
             if line_buffer:
-                final_line = line_buffer
-                if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                    final_line = final_line + '⏎'
-                yield final_line
+                yield line_buffer + _NEWLINE_MARK
             if not collected_any:  # fallback (SDK gave no streaming text)
                 # Fallback full response call
                 resp = self.llm_client.models.generate_content(
@@ -346,21 +506,20 @@ class QueryService:
                 segments = result.get("segments", []) or []
                 if segments:
                     # Compute lightweight metrics similar to existing QueryService
-                    scores = [s.get("score", 0.0) for s in segments if isinstance(s, dict)]
-                    avg_score = sum(scores)/len(scores) if scores else 0.0
-                    max_score = max(scores) if scores else 0.0
-                    min_score = min(scores) if scores else 0.0
+                    # Score statistics as C-level reductions over one array
+                    scores = np.fromiter(
+                        (s.get("score", 0.0) for s in segments if isinstance(s, dict)), dtype=np.float64
+                    )
+                    if scores.size:
+                        avg_score, max_score = float(scores.mean()), float(scores.max())
+                        min_score, std = float(scores.min()), float(scores.std())
+                    else:
+                        avg_score = max_score = min_score = std = 0.0
                     files = [s.get("filename", "Unknown") for s in segments]
-                    unique_files = []
-                    seen_files = set()
-                    for f in files:
-                        if f not in seen_files:
-                            seen_files.add(f)
-                            unique_files.append(f)
+                    unique_files = list(dict.fromkeys(files))
                     diversity = (len(unique_files)/len(files)) if files else 0.0
                     # Simple confidence proxy
-                    top = max_score if scores else 0.0
-                    std = (sum((sc-avg_score)**2 for sc in scores)/len(scores))**0.5 if scores else 0.0
+                    top = max_score
                     confidence = top * (1 - min(std / top, 0.5)) if top > 0 else 0.0
                     
                     # Enhanced metrics display for summaries
@@ -369,10 +528,9 @@ class QueryService:
                     yield f"• **Retrieval Quality:** {avg_score:.3f} (avg), {max_score:.3f} (max)\n"
                     yield f"• **Result Points Returned:** {len(segments)} segments\n"
                     if unique_files:
-                        max_list_files = int(os.getenv('METRICS_MAX_FILE_LIST', '12'))
-                        display_files = unique_files[:max_list_files]
+                        display_files = unique_files[:_METRICS_MAX_FILE_LIST]
                         files_list_str = ', '.join(display_files)
-                        if len(unique_files) > max_list_files:
+                        if len(unique_files) > _METRICS_MAX_FILE_LIST:
                             files_list_str += ', …'
                         yield f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n"
                     yield f"• **Confidence (proxy):** {confidence:.3f}/1.0\n"
@@ -399,28 +557,38 @@ class QueryService:
     # ------------------------------------------------------------------
     def query(self, request: QueryRequest) -> QueryResponse:
         try:
-            dense_query = self.embedder.embed_dense_query(request.question)
-            sparse_query = self.embedder.embed_sparse_query(request.question)
-            colbert_query = self.embedder.embed_colbert_query(request.question)
-            
-            # Convert selected_files filter to Qdrant filter format
-            qdrant_filters = self._build_qdrant_filters(request.filters)
-            
-            # Check if no files are selected before querying
+            # No files selected: answer before spending any embedding or vector search work
             if (request.filters and 
                 "selected_files" in request.filters and 
                 isinstance(request.filters["selected_files"], list) and 
                 len(request.filters["selected_files"]) == 0):
                 
                 # No files selected - provide helpful message
-                question_lower = request.question.lower()
-                if any(greeting in question_lower for greeting in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
+                if is_greeting(request.question):
                     answer = "Hello! I'm IRA (Information Retrieval Assistant), your RAG assistant. I'd be happy to help you! To get started, please **select one or more files** from the knowledge base using the file manager, then ask your question."
                 else:
                     answer = f"I'd like to help answer your question, but **no files are currently selected** from the knowledge base. Please use the file manager to select the documents you want me to search through, then ask your question again."
                 return QueryResponse(answer=answer, sources=[], reasoning="No files selected")
+
+            # Sparse/ColBERT encoders start on the pool while the dense one runs here for the cache probe
+            pending = self._submit_sparse_colbert(request.question)
+            dense_query = self.embedder.embed_dense_query(request.question)
+
+            # Near-duplicate question already answered under the same filters/top_k -> reuse it
+            cache_scope = self._cache_scope(request)
+            cached = self.proximity_cache.get(dense_query, cache_scope)
+            if cached is not None:
+                logger.info("Proximity cache hit; skipping retrieval and generation")
+                for future in pending or ():
+                    future.cancel()
+                return cached
+
+            sparse_query, colbert_query = self._collect_sparse_colbert(request.question, pending)
+            
+            # Convert selected_files filter to Qdrant filter format
+            qdrant_filters = self._build_qdrant_filters(request.filters)
             
-            results = self.qdrant.query_hybrid_with_rerank(dense_query, sparse_query, colbert_query, qdrant_filters, request.top_k)
+            results = self._search_batcher.submit((dense_query, sparse_query, colbert_query, qdrant_filters, request.top_k))
             sources = [r.payload for r in results]
 
             # Handle meta identity questions directly (do not force document grounding)
@@ -438,22 +606,52 @@ class QueryService:
             
             # Use function calling for answer generation instead of legacy synthesis
             answer = self.auto_answer(request.question, selected_files, request.top_k)
-            return QueryResponse(
+            response = QueryResponse(
                 answer=answer, 
                 sources=sources, 
                 reasoning="Generated using function calling",
                 evaluation_metrics=eval_metrics
             )
+            self.proximity_cache.put(dense_query, response, cache_scope)
+            return response
         except Exception as e:
             logger.exception("Query handling failed")
             return QueryResponse(answer="", sources=[], reasoning=str(e))
 
+    def _submit_sparse_colbert(self, question: str) -> Optional[Tuple[Future, Future]]:
+        """Start the sparse and ColBERT query encoders on the shared pool (None when EMBED_CONCURRENT=0)."""
+        if os.getenv("EMBED_CONCURRENT", "1") == "0":
+            return None
+        return (
+            _RAG_EMBED_EXECUTOR.submit(self.embedder.embed_sparse_query, question),
+            _RAG_EMBED_EXECUTOR.submit(self.embedder.embed_colbert_query, question),
+        )
+
+    def _collect_sparse_colbert(self, question: str, pending: Optional[Tuple[Future, Future]]):
+        """(sparse, ColBERT) query embeddings, from `pending` futures or computed inline."""
+        if pending is None:
+            return self.embedder.embed_sparse_query(question), self.embedder.embed_colbert_query(question)
+        sparse_future, colbert_future = pending
+        return sparse_future.result(), colbert_future.result()
+
+    def _search_batch(self, searches: List[tuple]) -> List[list]:
+        """Hybrid ColBERT-reranked search for each queued (dense, sparse, colbert, filters, top_k)."""
+        if len(searches) == 1:
+            return [self.qdrant.query_hybrid_with_rerank(*searches[0])]
+        return self.qdrant.query_hybrid_with_rerank_batch(searches)
+
+    def _cache_scope(self, request: QueryRequest) -> bytes:
+        """Key separating cached answers by everything other than the question itself."""
+        return orjson.dumps(
+            {"filters": request.filters, "top_k": request.top_k},
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=str,
+        )
+
     def _build_qdrant_filters(self, filters: Dict[str, Any]):
         """Convert request filters to Qdrant filter format"""
         if not filters:
             return None
-            
-        from qdrant_client import models
         
         # Handle selected_files filter
         if "selected_files" in filters:
@@ -474,15 +672,9 @@ class QueryService:
             
             # If files are selected, create a filter to match them
             if selected_files and len(selected_files) > 0:
-                # Create a filter to match documents with filenames in the selected list
-                return models.Filter(
-                    should=[
-                        models.FieldCondition(
-                            key="filename",
-                            match=models.MatchValue(value=filename)
-                        ) for filename in selected_files
-                    ]
-                )
+                # One MatchAny condition (a single keyword-index lookup) instead of an OR of MatchValues;
+                # shared, memoized Filter per selection, as in rag_search
+                return filename_filter(tuple(sorted(selected_files)))
         
         # For other filters, pass them through (you can extend this as needed)
         return None
@@ -496,8 +688,6 @@ class QueryService:
         3. 'content' or 'raw_text' fallback
         Each source truncated by CONTEXT_SOURCE_MAX_CHARS. Total context limited by CONTEXT_TOTAL_MAX_CHARS.
         """
-        full_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
-        primary_field = os.getenv("CHUNK_TEXT_FIELD", "text")
         per_source_cap = int(os.getenv("CONTEXT_SOURCE_MAX_CHARS", "1200"))
         total_cap = int(os.getenv("CONTEXT_TOTAL_MAX_CHARS", "6000"))
 
@@ -507,8 +697,8 @@ class QueryService:
 
         for idx, s in enumerate(sources, 1):
             raw = (
-                s.get(full_field)
-                or s.get(primary_field)
+                s.get(_FULL_FIELD)
+                or s.get(_CHUNK_FIELD)
                 or s.get("content")
                 or s.get("raw_text")
                 or ""
@@ -516,7 +706,8 @@ class QueryService:
             text = (raw or "").strip()
             if not text or len(text) < 15:
                 continue
-            cleaned_text = self._clean_text(text)
+            # Payloads normalized at ingest skip the per-query cleaning pass
+            cleaned_text = text if s.get(CLEANED_MARKER) else self._clean_text(text)
             if not cleaned_text:
                 continue
             # Deduplicate by first 120 chars signature
@@ -540,29 +731,17 @@ class QueryService:
     
     def _clean_text(self, text: str) -> str:
         """Light normalization for source context (do NOT alter answer streaming)."""
-        import re
-        if not text:
-            return ""
-        # Collapse windows line endings
-        text = text.replace('\r\n', '\n')
-        # Trim excessive blank lines in source snippets (but keep single newlines)
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        # Strip leading/trailing whitespace on each line
-        lines = [ln.strip() for ln in text.split('\n')]
-        # Remove empty lines at start/end
-        while lines and lines[0] == '':
-            lines.pop(0)
-        while lines and lines[-1] == '':
-            lines.pop()
-        return '\n'.join(lines)
+        return clean_source_text(text)
 
     def _calculate_evaluation_metrics(self, question: str, results, sources: List[Dict[str, Any]]) -> EvaluationMetrics:
         """Compute retrieval/answer quality metrics (does not mutate streaming)."""
-        scores = [getattr(r, 'score', 0.0) for r in results]
-        avg_score = np.mean(scores) if scores else 0.0
-        max_score = np.max(scores) if scores else 0.0
-        min_score = np.min(scores) if scores else 0.0
-        confidence = self._calculate_confidence_score(scores)
+        # One array for every score statistic instead of a list->array conversion per numpy call
+        scores = np.fromiter((getattr(r, 'score', 0.0) for r in results), dtype=np.float64, count=len(results))
+        if scores.size:
+            avg_score, max_score, min_score = scores.mean(), scores.max(), scores.min()
+        else:
+            avg_score = max_score = min_score = 0.0
+        confidence = self._calculate_confidence_score(scores, top_score=float(max_score))
         coverage = self._calculate_coverage_score(question, sources)
         diversity = self._calculate_source_diversity(sources)
         return EvaluationMetrics(
@@ -575,14 +754,19 @@ class QueryService:
             source_diversity=round(diversity, 3)
         )
     
-    def _calculate_confidence_score(self, scores: List[float]) -> float:
-        """Calculate confidence based on score quality and distribution."""
-        if not scores:
+    def _calculate_confidence_score(self, scores, top_score: Optional[float] = None) -> float:
+        """Calculate confidence based on score quality and distribution.
+
+        `scores` may be a list or a float array; pass `top_score` when its max is already known.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if not scores.size:
             return 0.0
-        top_score = max(scores)
+        if top_score is None:
+            top_score = float(scores.max())
         if top_score <= 0:
             return 0.0
-        score_std = np.std(scores) if len(scores) > 1 else 0.0
+        score_std = float(scores.std()) if scores.size > 1 else 0.0
         confidence = top_score * (1 - min(score_std / top_score, 0.5))
         return float(min(confidence, 1.0))
 
@@ -590,23 +774,17 @@ class QueryService:
         """Rough coverage: proportion of unique meaningful question tokens present across sources."""
         if not sources:
             return 0.0
-        stop = {
-            'the','a','an','and','or','but','in','on','at','to','for','of','with','by','is','are','was','were',
-            'what','how','who','when','where','why','which','that','this','these','those'
-        }
-        q_words = {w for w in question.lower().split() if w.isalpha() and w not in stop}
+        q_words = {w for w in _WORD_RE.findall(question.lower()) if w.isalpha()} - _COVERAGE_STOP_WORDS
         if not q_words:
             return 0.5
-        covered = 0
-        full_field = os.getenv("FULL_CHUNK_TEXT_FIELD", "text_full")
-        primary_field = os.getenv("CHUNK_TEXT_FIELD", "text")
-        for w in q_words:
-            if any(
-                w in (s.get(full_field,'') or s.get(primary_field,'') or '').lower()
-                for s in sources
-            ):
-                covered += 1
-        return min(covered / len(q_words), 1.0)
+        # Whole-word matches via set intersection ("is" no longer matches inside "this")
+        covered = set()
+        for s in sources:
+            text = (s.get(_FULL_FIELD,'') or s.get(_CHUNK_FIELD,'') or '').lower()
+            covered |= q_words.intersection(_WORD_RE.findall(text))
+            if len(covered) == len(q_words):
+                break
+        return min(len(covered) / len(q_words), 1.0)
 
     def _calculate_source_diversity(self, sources: List[Dict[str, Any]]) -> float:
         """Simple diversity metric based on unique filenames among returned sources."""
@@ -620,23 +798,10 @@ class QueryService:
 
     # --- Lightweight intent classifiers for streaming bypass ------------------------
     def _is_identity_q(self, question: str) -> bool:
-        if not question:
-            return False
-        q = question.lower()
-        triggers = ["who are you", "your name", "what is your name", "who is ira", "introduce yourself", "what are you"]
-        return any(t in q for t in triggers)
+        return is_identity_question(question)
 
     def _is_chitchat(self, question: str) -> bool:
-        if not question:
-            return False
-        q = question.strip().lower()
-        greetings = {"hi", "hey", "hello", "hola", "yo", "sup", "hiya"}
-        if q in greetings:
-            return True
-        phrases = ["good morning", "good afternoon", "good evening", "how are you", "how's it going", "what's up"]
-        if any(q.startswith(p) for p in phrases):
-            return True
-        return False
+        return is_chitchat(question)
 
     def _is_summary_request(self, question: str) -> bool:
         """Detect if the question is asking for a summary or overview that would benefit from diverse sources."""
@@ -659,7 +824,7 @@ class QueryService:
         return min(enhanced_k, max_k)
 
     # --- Answer style classification (brevity-first) ---------------------------------
-    def _classify_answer_style(self, question: str) -> Dict[str, Any]:
+    def _classify_answer_style(self, question: str) -> Mapping[str, Any]:
         """Return answer style config emphasizing brevity unless explicit detail requested.
 
         Labels:
@@ -667,32 +832,7 @@ class QueryService:
           concise: default informative answer (<= 60 words)
           detailed: only when user explicitly requests depth (<= 180 words)
         """
-        q = (question or "").strip().lower()
-        if not q:
-            return {"label": "minimal", "max_words": 25, "directive": "Respond with one short sentence."}
-        detail_triggers = [
-            "detailed", "in detail", "elaborate", "elaboration", "comprehensive", "full explanation",
-            "full answer", "deep dive", "in depth", "step by step", "thorough", "explain how", "explain why",
-        ]
-        if any(t in q for t in detail_triggers):
-            return {
-                "label": "detailed",
-                "max_words": int(os.getenv("STYLE_DETAILED_MAX_WORDS", "180")),
-                "directive": "Provide a structured but tight explanation; avoid fluff; include only source-grounded specifics."
-            }
-        # Extremely short or greeting-like
-        if len(q.split()) <= 6 and not any(k in q for k in ["why", "how", "compare", "difference"]):
-            return {
-                "label": "minimal",
-                "max_words": int(os.getenv("STYLE_MINIMAL_MAX_WORDS", "25")),
-                "directive": "One crisp sentence; no preamble or bullets."
-            }
-        # Default concise style
-        return {
-            "label": "concise",
-            "max_words": int(os.getenv("STYLE_CONCISE_MAX_WORDS", "60")),
-            "directive": "Answer directly in 1-3 short sentences; only add a bullet list if enumerating 3+ distinct points."
-        }
+        return classify_answer_style(question)
 
 
 
@@ -701,119 +841,149 @@ class QueryService:
     def stream_answer(self, request: QueryRequest):
         """Yields answer tokens incrementally using Gemini streaming."""
         try:
-            dense_query = self.embedder.embed_dense_query(request.question)
-            sparse_query = self.embedder.embed_sparse_query(request.question)
-            colbert_query = self.embedder.embed_colbert_query(request.question)
-            
-            # Convert selected_files filter to Qdrant filter format
-            qdrant_filters = self._build_qdrant_filters(request.filters)
-            
-            # Check if no files are selected before querying
-            if (request.filters and 
-                "selected_files" in request.filters and 
-                isinstance(request.filters["selected_files"], list) and 
-                len(request.filters["selected_files"]) == 0):
-                
-                # No files selected - provide helpful message
-                question_lower = request.question.lower()
-                if any(greeting in question_lower for greeting in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
-                    yield "Hello! I'm IRA (Information Retrieval Assistant), your RAG assistant. I'd be happy to help you! To get started, please **select one or more files** from the knowledge base using the file manager, then ask your question."
-                else:
-                    yield f"I'd like to help answer your question, but **no files are currently selected** from the knowledge base. Please use the file manager to select the documents you want me to search through, then ask your question again."
-                return
-            
-            results = self.qdrant.query_hybrid_with_rerank(dense_query, sparse_query, colbert_query, qdrant_filters, request.top_k)
-            sources = [r.payload for r in results]
-
-            # Meta identity question bypass: respond directly without LLM (or with minimal)
-            if self._is_meta_identity_question(request.question):
-                yield self._identity_answer()
+            plan = self._prepare_stream(request)
+            if plan.reply is not None:
+                yield plan.reply
                 return
-            
-            # Calculate evaluation metrics
-            eval_metrics = self._calculate_evaluation_metrics(request.question, results, sources)
-            
-            if not self.llm_client:
-                yield "LLM not configured. Provide GOOGLE API credentials to enable answer synthesis."
-                return
-                
-            # Check if we have any relevant documents
-            if not sources or len(sources) == 0:
-                # Handle empty knowledge base with a helpful response
-                question_lower = request.question.lower()
-                if any(greeting in question_lower for greeting in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
-                    yield "Hello! I'm IRA. I'd be happy to help you, but I don't have any documents in my knowledge base yet. Please upload some documents first, and then I can answer questions based on their content."
-                else:
-                    yield f"I'd like to help answer your question about '{request.question}', but I don't have any documents in my knowledge base yet. Please upload some relevant documents first, and then I'll be able to provide accurate answers based on their content."
-                return
-            
-            context_block = self._build_context(sources)
-            style = self._classify_answer_style(request.question)
-            system_instruction = self._system_instruction(style)
-            prompt = (
-                f"{system_instruction}\n"
-                f"Question: {request.question}\n"
-                f"Answer style directive: {style['directive']}\n"
-                f"Hard word limit: {style['max_words']} words.\n"
-                "If question is brief, respond with a single concise layman sentence. If detailed, give a succinct structured answer without fluff.\n"
-                "If a detail (like a teammate name) is not in sources, explicitly say it's not specified in the provided documents.\n"
-                "Do NOT hallucinate names, numbers, dates, or attributions.\n\n"
-                f"Sources (verbatim snippets):\n{context_block}\n\nAnswer:" )
-            chat = self.llm_client.chats.create(model="gemini-2.5-flash")
-            stream = chat.send_message_stream(prompt)
+            # Single-turn request: stateless streaming call, no chat session per question
+            stream = self.llm_client.models.generate_content_stream(model="gemini-2.5-flash", contents=plan.prompt)
             chunk_count = 0
             line_buffer = ""
             for chunk in stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    chunk_count += 1
-                    newline_count = chunk.text.count('\n')
-                    logger.info(
-                        f"LLM Chunk {chunk_count}: repr={repr(chunk.text)} | has_newlines={newline_count>0} | newline_count={newline_count}"
-                    )
-                    incoming = chunk.text
-                    # Accumulate with any prior partial line
-                    combined = line_buffer + incoming
-                    lines = combined.split('\n')
-                    # Keep last segment (may be partial if original chunk had no trailing newline)
-                    line_buffer = lines.pop()  # last element
-                    for line in lines:
-                        out_line = line + '\n'
-                        if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                            out_line = out_line.replace('\n', '⏎\n')
-                        yield out_line
+                part = getattr(chunk, "text", None)
+                if not part:
+                    continue
+                chunk_count += 1
+                # Lazy %-formatting behind a level check: nothing is built per chunk unless DEBUG is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("LLM Chunk %d len=%d", chunk_count, len(part))
+                # Complete lines (if any) go out as one block; the partial tail stays buffered
+                line_buffer, emit = drain_lines(line_buffer, part)
+                if emit:
+                    yield emit.replace('\n', '⏎\n') if _DEBUG_NEWLINES else emit
             # Flush any remaining buffered partial line
             if line_buffer:
-                final_line = line_buffer
-                if os.getenv('RAG_DEBUG_MARK_NEWLINES'):
-                    final_line = final_line + '⏎'
-                yield final_line
-            
-            # Add evaluation metrics at the end
-            yield f"\n\n---\n**📊 Response Quality Metrics:**\n"
-            # Unique filenames among returned points (files actually contributing)
-            unique_files = []
-            seen_files = set()
-            for s in sources:
-                fn = s.get('filename') or 'Unknown'
-                if fn not in seen_files:
-                    seen_files.add(fn)
-                    unique_files.append(fn)
-            # Prepare file listing (truncate if extremely long)
-            max_list_files = int(os.getenv('METRICS_MAX_FILE_LIST', '12'))
-            display_files = unique_files[:max_list_files]
-            files_list_str = ', '.join(display_files)
-            if len(unique_files) > max_list_files:
-                files_list_str += ', …'
-            yield f"• **Retrieval Quality:** {eval_metrics.avg_retrieval_score:.3f} (avg), {eval_metrics.max_retrieval_score:.3f} (max)\n"
-            yield f"• **Result Points Returned:** {eval_metrics.num_sources_used} segments\n"
-            yield f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n"
-            yield f"• **Confidence:** {eval_metrics.confidence_score:.3f}/1.0\n"
-            yield f"• **Coverage:** {eval_metrics.coverage_score:.3f}/1.0\n"
-            yield f"• **Source Diversity:** {eval_metrics.source_diversity:.3f}/1.0\n"
+                yield line_buffer + _NEWLINE_MARK
+            yield from self._metrics_trailer(plan)
         except Exception as e:
             logger.warning(f"Streaming LLM answer failed: {e}")
             yield f"I apologize, but I encountered an error while processing your request: {str(e)}"
 
+    async def astream_answer(self, request: QueryRequest) -> AsyncGenerator[str, None]:
+        """Async variant of stream_answer, output identical.
+
+        Embedding and vector search still block, so they run once on a worker thread; the
+        Gemini stream is awaited on the event loop via the async client, so a waiting
+        answer holds no thread for the length of the generation.
+        """
+        try:
+            plan = await asyncio.to_thread(self._prepare_stream, request)
+            if plan.reply is not None:
+                yield plan.reply
+                return
+            stream = await self.llm_client.aio.models.generate_content_stream(
+                model="gemini-2.5-flash", contents=plan.prompt
+            )
+            chunk_count = 0
+            line_buffer = ""
+            async for chunk in stream:
+                part = getattr(chunk, "text", None)
+                if not part:
+                    continue
+                chunk_count += 1
+                # Lazy %-formatting behind a level check: nothing is built per chunk unless DEBUG is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("LLM async chunk %d len=%d", chunk_count, len(part))
+                # Complete lines (if any) go out as one block; the partial tail stays buffered
+                line_buffer, emit = drain_lines(line_buffer, part)
+                if emit:
+                    yield emit.replace('\n', '⏎\n') if _DEBUG_NEWLINES else emit
+            # Flush any remaining buffered partial line
+            if line_buffer:
+                yield line_buffer + _NEWLINE_MARK
+            for line in self._metrics_trailer(plan):
+                yield line
+        except Exception as e:
+            logger.warning(f"Async streaming LLM answer failed: {e}")
+            yield f"I apologize, but I encountered an error while processing your request: {str(e)}"
+
+    def _prepare_stream(self, request: QueryRequest) -> "_StreamPlan":
+        """Blocking half of stream_answer / astream_answer: retrieval, metrics and the prompt.
+
+        Returns a plan whose `reply` is set when the answer is known without the LLM.
+        """
+        # No files selected: answer before spending any embedding or vector search work
+        if (request.filters and 
+            "selected_files" in request.filters and 
+            isinstance(request.filters["selected_files"], list) and 
+            len(request.filters["selected_files"]) == 0):
+            
+            # No files selected - provide helpful message
+            if is_greeting(request.question):
+                return _StreamPlan("Hello! I'm IRA (Information Retrieval Assistant), your RAG assistant. I'd be happy to help you! To get started, please **select one or more files** from the knowledge base using the file manager, then ask your question.")
+            return _StreamPlan(f"I'd like to help answer your question, but **no files are currently selected** from the knowledge base. Please use the file manager to select the documents you want me to search through, then ask your question again.")
+
+        pending = self._submit_sparse_colbert(request.question)
+        dense_query = self.embedder.embed_dense_query(request.question)
+        sparse_query, colbert_query = self._collect_sparse_colbert(request.question, pending)
+        
+        # Convert selected_files filter to Qdrant filter format
+        qdrant_filters = self._build_qdrant_filters(request.filters)
+        
+        results = self._search_batcher.submit((dense_query, sparse_query, colbert_query, qdrant_filters, request.top_k))
+        sources = [r.payload for r in results]
+
+        # Meta identity question bypass: respond directly without LLM (or with minimal)
+        if self._is_meta_identity_question(request.question):
+            return _StreamPlan(self._identity_answer())
+        
+        # Calculate evaluation metrics
+        eval_metrics = self._calculate_evaluation_metrics(request.question, results, sources)
+        
+        if not self.llm_client:
+            return _StreamPlan("LLM not configured. Provide GOOGLE API credentials to enable answer synthesis.")
+            
+        # Check if we have any relevant documents
+        if not sources or len(sources) == 0:
+            # Handle empty knowledge base with a helpful response
+            if is_greeting(request.question):
+                return _StreamPlan("Hello! I'm IRA. I'd be happy to help you, but I don't have any documents in my knowledge base yet. Please upload some documents first, and then I can answer questions based on their content.")
+            return _StreamPlan(f"I'd like to help answer your question about '{request.question}', but I don't have any documents in my knowledge base yet. Please upload some relevant documents first, and then I'll be able to provide accurate answers based on their content.")
+        
+        context_block = self._build_context(sources)
+        style = self._classify_answer_style(request.question)
+        system_instruction = self._system_instruction(style)
+        prompt = (
+            f"{system_instruction}\n"
+            f"Question: {request.question}\n"
+            f"Answer style directive: {style['directive']}\n"
+            f"Hard word limit: {style['max_words']} words.\n"
+            "If question is brief, respond with a single concise layman sentence. If detailed, give a succinct structured answer without fluff.\n"
+            "If a detail (like a teammate name) is not in sources, explicitly say it's not specified in the provided documents.\n"
+            "Do NOT hallucinate names, numbers, dates, or attributions.\n\n"
+            f"Sources (verbatim snippets):\n{context_block}\n\nAnswer:" )
+        return _StreamPlan(None, prompt, sources, eval_metrics)
+
+    def _metrics_trailer(self, plan: "_StreamPlan") -> List[str]:
+        """Evaluation metrics lines streamed after the answer."""
+        eval_metrics = plan.eval_metrics
+        # Unique filenames among returned points (files actually contributing)
+        unique_files = list(dict.fromkeys(s.get('filename') or 'Unknown' for s in plan.sources))
+        # Prepare file listing (truncate if extremely long)
+        display_files = unique_files[:_METRICS_MAX_FILE_LIST]
+        files_list_str = ', '.join(display_files)
+        if len(unique_files) > _METRICS_MAX_FILE_LIST:
+            files_list_str += ', …'
+        return [
+            f"\n\n---\n**📊 Response Quality Metrics:**\n",
+            f"• **Retrieval Quality:** {eval_metrics.avg_retrieval_score:.3f} (avg), {eval_metrics.max_retrieval_score:.3f} (max)\n",
+            f"• **Result Points Returned:** {eval_metrics.num_sources_used} segments\n",
+            f"• **Source Files Used:** {len(unique_files)} files ({files_list_str})\n",
+            f"• **Confidence:** {eval_metrics.confidence_score:.3f}/1.0\n",
+            f"• **Coverage:** {eval_metrics.coverage_score:.3f}/1.0\n",
+            f"• **Source Diversity:** {eval_metrics.source_diversity:.3f}/1.0\n",
+        ]
+
     def stream_answer_with_function_calling(self, request: QueryRequest) -> Generator[str, None, None]:
         """New streaming method that uses function calling instead of manual RAG."""
         if not self.is_available():
@@ -825,12 +995,16 @@ class QueryService:
         if request.filters and "selected_files" in request.filters:
             selected_files = request.filters["selected_files"]
 
-        # Use the function calling streaming method
-        for chunk in self.auto_answer_stream(request.question, selected_files, request.top_k):
-            yield chunk
+        # Use the function calling streaming method; line chunks are merged over STREAM_BATCH_MS
+        # (flushed early at STREAM_BATCH_MAX_CHARS) so each transport write carries more text
+        yield from coalesce_stream(
+            self.auto_answer_stream(request.question, selected_files, request.top_k),
+            window_s=float(os.getenv("STREAM_BATCH_MS", "20")) / 1000.0,
+            max_chars=int(os.getenv("STREAM_BATCH_MAX_CHARS", "256")),
+        )
 
     # --- System instruction -----------------------------------------------------------
-    def _system_instruction(self, style: Dict[str, Any]) -> str:
+    def _system_instruction(self, style: Mapping[str, Any]) -> str:
         """Return a single authoritative system instruction for IRA.
 
         IRA = Information Resource Assistant (short form). Principles:
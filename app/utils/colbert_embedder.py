@@ -91,3 +91,15 @@ class ColBERTEmbedder:
             logger.warning("ColBERT model not available, returning empty query embedding")
             return []
         return next(self.colbert_model.embed([query]))
+
+    def embed_dense_queries(self, queries: List[str]) -> List[List[float]]:
+        return list(self.dense_model.embed(queries))
+
+    def embed_sparse_queries(self, queries: List[str]):
+        return list(self.sparse_model.query_embed(queries))
+
+    def embed_colbert_queries(self, queries: List[str]) -> List[List[List[float]]]:
+        if self.colbert_model is None:
+            logger.warning("ColBERT model not available, returning empty query embeddings")
+            return [[] for _ in queries]
+        return list(self.colbert_model.embed(queries))
@@ -0,0 +1,36 @@
+"""
+collection_events.py
+Hooks run whenever the Qdrant collection contents change (ingestion, file deletion).
+
+Query-side caches (ProximityCache, the rag_search hit cache) register a clear function
+here, so the writers invalidate them without importing the query services.
+"""
+
+import threading
+from typing import Callable, List
+
+from app.utils.logging_config import logger
+
+_LISTENERS: List[Callable[[], None]] = []
+_LISTENERS_LOCK = threading.Lock()
+
+
+def on_collection_change(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register `callback` to run after every collection change; returns it unchanged."""
+    with _LISTENERS_LOCK:
+        _LISTENERS.append(callback)
+    return callback
+
+
+def collection_changed() -> None:
+    """Run every registered callback; one failing callback does not stop the others."""
+    with _LISTENERS_LOCK:
+        listeners = list(_LISTENERS)
+    for callback in listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Collection change hook {callback!r} failed: {e}")
+
+
+__all__ = ["collection_changed", "on_collection_change"]
@@ -0,0 +1,231 @@
+"""
+embedding_cache.py
+Content-hash keyed LRU cache for (dense, sparse, ColBERT) document embeddings.
+
+Duplicate segment text (repeated categorical strings, boilerplate columns, repeated
+headers) is embedded once; later occurrences are served from memory. CSV and PDF
+ingestion share one instance (shared_embedding_cache) and so one persisted file,
+written as plain numeric arrays (no pickling).
+
+Environment variables:
+- EMBED_CACHE_SIZE (int, default 4096) -> max cached texts (0 disables the cache)
+- EMBED_CACHE_DIR (path, optional) -> persist the cache with np.savez for warm restarts
+- EMBED_CONCURRENT (0/1, default 1) -> run the dense, sparse and ColBERT models concurrently
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.logging_config import logger
+
+_CACHE_FILENAME = "embedding_cache.npz"
+
+# Shared by all ingestions; one worker per model
+_EMBED_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+# One cache for every ingestion service, so they never overwrite each other's file
+_SHARED_CACHE: Optional["EmbeddingCache"] = None
+_SHARED_CACHE_LOCK = threading.Lock()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _get_embed_executor() -> ThreadPoolExecutor:
+    global _EMBED_EXECUTOR
+    if _EMBED_EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EMBED_EXECUTOR is None:
+                _EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="embed")
+    return _EMBED_EXECUTOR
+
+
+def embed_all(embedder, texts: List[str]):
+    """Run the dense, sparse and ColBERT models over `texts`, concurrently unless EMBED_CONCURRENT=0.
+
+    The three models are independent ONNX sessions that release the GIL during inference,
+    so wall time is roughly the slowest model instead of the sum of all three.
+    """
+    if len(texts) == 0 or os.getenv("EMBED_CONCURRENT", "1") == "0":
+        return embedder.embed_dense(texts), embedder.embed_sparse(texts), embedder.embed_colbert(texts)
+    executor = _get_embed_executor()
+    dense_future = executor.submit(embedder.embed_dense, texts)
+    sparse_future = executor.submit(embedder.embed_sparse, texts)
+    colbert_future = executor.submit(embedder.embed_colbert, texts)
+    return dense_future.result(), sparse_future.result(), colbert_future.result()
+
+
+def _sparse_parts(sparse) -> Tuple[np.ndarray, np.ndarray]:
+    """(indices, values) of a fastembed SparseEmbedding or an {"indices", "values"} dict."""
+    if hasattr(sparse, "indices"):
+        return np.asarray(sparse.indices, dtype=np.int64), np.asarray(sparse.values, dtype=np.float32)
+    return np.asarray(sparse["indices"], dtype=np.int64), np.asarray(sparse["values"], dtype=np.float32)
+
+
+def _offsets(lengths: List[int]) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))).astype(np.int64)
+
+
+class EmbeddingCache:
+    """Bounded LRU of text-hash -> {"dense", "sparse", "colbert"} vectors.
+
+    functools.lru_cache is not used because results are per-text slices of a batched
+    embedder call (and numpy arrays are not useful cache return values).
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, cache_dir: Optional[str] = None):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv("EMBED_CACHE_DIR")
+        self._entries: "OrderedDict[bytes, Dict[str, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.enabled and self.cache_dir:
+            self.load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: bytes) -> Optional[Dict[str, object]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: bytes, entry: Dict[str, object]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def find_uncached_texts(self, texts: List[str]) -> Tuple[List[bytes], List[str]]:
+        """Return (keys for every text, unique texts that still need embedding)."""
+        keys = [text_key(t) for t in texts]
+        missing: "OrderedDict[bytes, str]" = OrderedDict()
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key not in missing and key not in self._entries:
+                    missing[key] = text
+        return keys, list(missing.values())
+
+    def embed(self, embedder, texts: List[str]):
+        """Embed `texts` with `embedder`, only running the models on uncached (unique) texts.
+
+        Returns (dense_vecs, sparse_vecs, colbert_vecs) aligned with `texts`.
+        """
+        if not self.enabled:
+            return embed_all(embedder, texts)
+
+        keys, miss_texts = self.find_uncached_texts(texts)
+        fresh: Dict[bytes, Dict[str, object]] = {}
+        if miss_texts:
+            dense, sparse, colbert = embed_all(embedder, miss_texts)
+            for text, d, s, c in zip(miss_texts, dense, sparse, colbert):
+                fresh[text_key(text)] = {"dense": d, "sparse": s, "colbert": c}
+
+        with self._lock:
+            # Resolve cached hits before inserting fresh entries so a small cache cannot evict them mid-batch
+            entries = [fresh.get(key) or self._get(key) for key in keys]
+            for key, entry in fresh.items():
+                self._put(key, entry)
+            self.misses += len(miss_texts)
+            self.hits += len(keys) - len(miss_texts)
+
+        # Entries evicted by a concurrent ingestion since find_uncached_texts: embed them directly
+        lost = [i for i, entry in enumerate(entries) if entry is None]
+        if lost:
+            lost_texts = [texts[i] for i in lost]
+            for i, d, s, c in zip(lost, *embed_all(embedder, lost_texts)):
+                entries[i] = {"dense": d, "sparse": s, "colbert": c}
+
+        return (
+            [e["dense"] for e in entries],
+            [e["sparse"] for e in entries],
+            [e["colbert"] for e in entries],
+        )
+
+    # ------------------------------------------------------------------
+    # Optional disk persistence
+    # ------------------------------------------------------------------
+    def _path(self) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, _CACHE_FILENAME)
+
+    def save(self) -> None:
+        """Persist as plain arrays: dense stacked, sparse and ColBERT flattened with row offsets."""
+        path = self._path()
+        if not path or not self.enabled:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._lock:
+                items = list(self._entries.items())
+            keys = np.frombuffer(b"".join(k for k, _ in items), dtype=np.uint8).reshape(-1, 16)
+            dense = np.asarray([entry["dense"] for _, entry in items], dtype=np.float32)
+            sparse = [_sparse_parts(entry["sparse"]) for _, entry in items]
+            colbert = [np.asarray(entry["colbert"], dtype=np.float32) for _, entry in items]
+            colbert_dim = next((c.shape[1] for c in colbert if c.size), 0)
+            arrays = dict(
+                keys=keys,
+                dense=dense,
+                sparse_offsets=_offsets([len(i) for i, _ in sparse]),
+                sparse_indices=np.concatenate([i for i, _ in sparse]) if sparse else np.empty(0, np.int64),
+                sparse_values=np.concatenate([v for _, v in sparse]) if sparse else np.empty(0, np.float32),
+                colbert_offsets=_offsets([len(c) for c in colbert]),
+                colbert=np.concatenate([c.reshape(-1, colbert_dim) for c in colbert]) if colbert_dim
+                else np.empty((0, 0), np.float32),
+            )
+            # Write then rename, so a concurrent load never sees a half-written file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+            logger.info(f"Saved {len(items)} cached embeddings to {path}")
+        except Exception as e:
+            logger.warning(f"Could not persist embedding cache: {e}")
+
+    def load(self) -> None:
+        path = self._path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                keys, dense = data["keys"], data["dense"]
+                s_off, s_idx, s_val = data["sparse_offsets"], data["sparse_indices"], data["sparse_values"]
+                c_off, colbert = data["colbert_offsets"], data["colbert"]
+            with self._lock:
+                for i, key in enumerate(keys):
+                    self._put(key.tobytes(), {
+                        "dense": dense[i],
+                        "sparse": {
+                            "indices": s_idx[s_off[i]:s_off[i + 1]].tolist(),
+                            "values": s_val[s_off[i]:s_off[i + 1]].tolist(),
+                        },
+                        "colbert": colbert[c_off[i]:c_off[i + 1]],
+                    })
+            logger.info(f"Loaded {len(self._entries)} cached embeddings from {path}")
+        except Exception as e:
+            logger.warning(f"Could not load embedding cache from {path}: {e}")
+
+
+def shared_embedding_cache() -> EmbeddingCache:
+    """The process-wide EmbeddingCache used by CSV and PDF ingestion (loaded from disk once)."""
+    global _SHARED_CACHE
+    if _SHARED_CACHE is None:
+        with _SHARED_CACHE_LOCK:
+            if _SHARED_CACHE is None:
+                _SHARED_CACHE = EmbeddingCache()
+    return _SHARED_CACHE
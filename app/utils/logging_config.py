@@ -1,14 +1,26 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
 def configure_logging():
-    logging.basicConfig(
-        level=LOG_LEVEL,
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    )
+    # Request threads only enqueue records; a background listener formats and writes them,
+    # so stream I/O never blocks the request path
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Keep the bare message here; the listener's handler applies the real format
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[queue_handler])
     logging.getLogger("qdrant-client").setLevel(logging.WARNING)
     return logging.getLogger("rag")
 
-logger = configure_logging()
\ No newline at end of file
+logger = configure_logging()
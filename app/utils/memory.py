@@ -0,0 +1,126 @@
+"""
+memory.py
+Lightweight memory-pressure probes used by the adaptive ingestion batch loops.
+
+Both torch (CUDA) and psutil are optional; when neither is usable the probe
+reports no pressure and callers fall back to exception-driven OOM handling.
+"""
+
+import gc
+import os
+from typing import Optional, Tuple
+
+try:
+    import torch
+except ImportError:  # pragma: no cover
+    torch = None
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover
+    psutil = None
+
+
+def _free_and_total() -> Optional[Tuple[int, int]]:
+    """(free, total) bytes of the current CUDA device when one is in use, otherwise system RAM."""
+    if torch is not None:
+        try:
+            if torch.cuda.is_available() and torch.cuda.is_initialized():
+                free, total = torch.cuda.mem_get_info()
+                return free, total
+        except Exception:
+            pass
+    if psutil is not None:
+        try:
+            vm = psutil.virtual_memory()
+            return vm.available, vm.total
+        except Exception:
+            pass
+    return None
+
+
+def memory_headroom() -> Optional[float]:
+    """Return the free/total memory fraction of the device doing the embedding work.
+
+    Prefers the current CUDA device when one is in use, otherwise system RAM.
+    Returns None when no probe is available.
+    """
+    info = _free_and_total()
+    if info is None or not info[1]:
+        return None
+    free, total = info
+    return free / total
+
+
+def memory_free_bytes() -> Optional[int]:
+    """Free bytes on the device doing the embedding work, or None when no probe is available."""
+    info = _free_and_total()
+    return info[0] if info is not None else None
+
+
+def target_utilization() -> float:
+    """Share of currently free memory a batch may plan to use (INGEST_MEMORY_TARGET_UTILIZATION)."""
+    return float(os.getenv("INGEST_MEMORY_TARGET_UTILIZATION", "0.8"))
+
+
+def batch_size_for_headroom(max_batch: int, bytes_per_item: Optional[float], min_batch: int = 1) -> int:
+    """Largest batch (between min_batch and max_batch) expected to fit in the free memory budget.
+
+    `bytes_per_item` comes from a calibration pass; without it, or without a probe,
+    `max_batch` is returned unchanged.
+    """
+    if not bytes_per_item or bytes_per_item <= 0:
+        return max_batch
+    free = memory_free_bytes()
+    if free is None:
+        return max_batch
+    fits = int(target_utilization() * free / bytes_per_item)
+    return max(min_batch, min(max_batch, fits))
+
+
+def low_memory_watermark() -> float:
+    """Free-memory fraction below which ingestion proactively shrinks batches (INGEST_MEMORY_LOW_WATERMARK)."""
+    return float(os.getenv("INGEST_MEMORY_LOW_WATERMARK", "0.15"))
+
+
+def under_memory_pressure() -> bool:
+    headroom = memory_headroom()
+    return headroom is not None and headroom < low_memory_watermark()
+
+
+# ONNX Runtime (the fastembed encoders) reports allocation failures only in the message text
+_OOM_MARKERS = ("failed to allocate", "out of memory", "allocation failed")
+
+
+def is_oom_error(error: BaseException) -> bool:
+    """True when `error`, or an exception it wraps, is an out-of-memory failure.
+
+    Typed errors (MemoryError, torch.cuda.OutOfMemoryError) are recognised directly; other
+    errors fall back to matching allocator messages. Unrelated CUDA errors do not count.
+    """
+    oom_types = [MemoryError]
+    if torch is not None and hasattr(torch.cuda, "OutOfMemoryError"):
+        oom_types.append(torch.cuda.OutOfMemoryError)
+    oom_types = tuple(oom_types)
+    seen = set()
+    err: Optional[BaseException] = error
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        if isinstance(err, oom_types):
+            return True
+        msg = str(err).lower()
+        if any(marker in msg for marker in _OOM_MARKERS):
+            return True
+        err = err.__cause__ or err.__context__
+    return False
+
+
+def release_memory():
+    """Drop unreachable Python objects and return cached CUDA blocks to the driver."""
+    gc.collect()
+    if torch is not None:
+        try:
+            if torch.cuda.is_available() and torch.cuda.is_initialized():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
@@ -0,0 +1,101 @@
+"""
+micro_batch.py
+Coalesces concurrent single-text requests into one batched model call.
+
+Callers on different threads (e.g. concurrent function-calling rag_search tools)
+block in `submit`; a background worker drains whatever is queued, runs one batched
+call and hands each caller its own result. With window_s=0 a lone request is run
+immediately, and requests arriving while a batch is running form the next batch,
+so batching only kicks in under concurrency and adds no latency when idle.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.utils.logging_config import logger
+
+
+class MicroBatcher:
+    """Run `batch_fn(texts) -> results` (one result per text, same order) over queued texts.
+
+    A batch is closed when it reaches `max_batch` texts, when adding the next text would
+    exceed `max_tokens` (whitespace tokens, to bound padding), or `window_s` after its
+    first text arrived. Items need not be strings when `cost_fn` gives their cost.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[str]], List[Any]],
+        max_batch: int = 32,
+        max_tokens: int = 1024,
+        window_s: float = 0.0,
+        name: str = "micro-batch",
+        cost_fn: Optional[Callable[[Any], int]] = None,
+    ):
+        self._batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_tokens = max(1, max_tokens)
+        self.window_s = max(0.0, window_s)
+        self._name = name
+        if cost_fn is not None:
+            self._cost = cost_fn
+        self._queue: "queue.SimpleQueue[Tuple[str, Future]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+    def submit(self, text: str) -> Any:
+        """Queue `text` for the next batch and block until its result is ready."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    @staticmethod
+    def _cost(text: str) -> int:
+        return len(text.split()) or 1
+
+    def _run(self) -> None:
+        carry: Optional[Tuple[str, Future]] = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            batch = [first]
+            tokens = self._cost(first[0])
+            deadline = time.monotonic() + self.window_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                cost = self._cost(item[0])
+                if tokens + cost > self.max_tokens:
+                    carry = item  # opens the next batch
+                    break
+                batch.append(item)
+                tokens += cost
+            self._execute(batch)
+
+    def _execute(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            results = self._batch_fn([text for text, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} inputs")
+        except BaseException as e:
+            logger.warning(f"{self._name} batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
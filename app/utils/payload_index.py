@@ -0,0 +1,104 @@
+"""
+payload_index.py
+Idempotent, cached creation of Qdrant keyword payload indexes.
+
+Every service start used to call create_payload_index and treat the "already exists"
+error as success. The check is now answered, cheapest first, by:
+1. a per-process set of (server, collection, field) keys already ensured,
+2. a marker file in the temp dir shared by all workers on the host,
+3. the collection's payload_schema (one get_collection call, no error path),
+and create_payload_index is only called when the index is actually missing.
+
+A payload_schema passed in by the caller is authoritative: the caches are skipped, and
+a schema without the index drops the stale marker (collection recreated elsewhere).
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Optional, Set, Tuple
+
+from qdrant_client import QdrantClient, models
+
+from app.utils.logging_config import logger
+
+_INDEX_ENSURED: Set[Tuple[str, str, str]] = set()
+_INDEX_LOCK = threading.Lock()
+
+
+def _marker_path(server_url: str, collection_name: str, field_name: str) -> str:
+    # Keyed by server too, so pointing QDRANT_URL elsewhere never reuses another server's marker
+    server = hashlib.blake2b(server_url.encode("utf-8"), digest_size=8).hexdigest()
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{collection_name}_{field_name}")
+    return os.path.join(tempfile.gettempdir(), f"qdrant_idx_{server}_{safe}")
+
+
+def _has_keyword_index(payload_schema: Optional[dict], field_name: str) -> bool:
+    info = (payload_schema or {}).get(field_name)
+    return info is not None and getattr(info, "data_type", None) == models.PayloadSchemaType.KEYWORD
+
+
+def _mark_ensured(key: Tuple[str, str, str]) -> None:
+    _INDEX_ENSURED.add(key)
+    try:
+        with open(_marker_path(*key), "a"):
+            pass
+    except OSError:
+        pass  # marker is only an optimization
+
+
+def _forget_ensured(key: Tuple[str, str, str]) -> None:
+    _INDEX_ENSURED.discard(key)
+    try:
+        os.remove(_marker_path(*key))
+    except OSError:
+        pass
+
+
+def ensure_keyword_index(
+    client: QdrantClient,
+    collection_name: str,
+    field_name: str = "filename",
+    payload_schema: Optional[dict] = None,
+    force: bool = False,
+    server_url: Optional[str] = None,
+) -> None:
+    """Make sure `field_name` has a KEYWORD payload index on `collection_name`.
+
+    Pass `payload_schema` when the caller already fetched the collection info; it is
+    trusted over the process/marker caches. `force=True` skips those caches too (e.g.
+    right after creating the collection). `server_url` defaults to QDRANT_URL.
+    """
+    if server_url is None:
+        server_url = os.getenv("QDRANT_URL", "")
+    key = (server_url, collection_name, field_name)
+    with _INDEX_LOCK:
+        if not force and payload_schema is None:
+            if key in _INDEX_ENSURED:
+                return
+            if os.path.exists(_marker_path(*key)):
+                _INDEX_ENSURED.add(key)
+                return
+        try:
+            if payload_schema is None:
+                payload_schema = client.get_collection(collection_name).payload_schema
+            if _has_keyword_index(payload_schema, field_name):
+                logger.debug(f"Index on '{field_name}' field already exists for collection {collection_name}")
+                _mark_ensured(key)
+                return
+            # Missing despite any marker: the collection was recreated or the server changed
+            _forget_ensured(key)
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType.KEYWORD,
+            )
+            logger.info(f"Created index on '{field_name}' field for collection {collection_name}")
+            _mark_ensured(key)
+        except Exception as e:
+            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
+                _mark_ensured(key)
+            else:
+                logger.warning(f"Could not create index on '{field_name}' field: {e}")
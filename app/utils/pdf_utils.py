@@ -3,10 +3,16 @@ pdf_utils.py
 Utility functions for PDF processing and page extraction.
 """
 
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from pathlib import Path
 from PyPDF2 import PdfReader, PdfWriter
+import hashlib
 import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 class PDFUtils:
     """Utility class for PDF file operations."""
@@ -30,6 +36,39 @@ class PDFUtils:
             pages.append(page_bytes.getvalue())
         return pages
 
+    @staticmethod
+    def file_digest(pdf_path: str) -> str:
+        """
+        Hex content hash of a file, read in 1 MiB blocks.
+        Args:
+            pdf_path (str): Path to the file.
+        Returns:
+            str: blake2b-128 hex digest of the file bytes.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def iter_text_from_pages(pdf_path: str, cache_dir: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Lazily extracts text content from each page of a PDF.
+        Args:
+            pdf_path (str): Path to the PDF file.
+            cache_dir (str, optional): Directory memoizing extracted text per file content hash;
+                re-ingesting the same bytes (retry, re-upload under any name) skips parsing.
+        Yields:
+            Tuple[int, str]: (page index, text content) for each page, in order.
+        """
+        if cache_dir:
+            yield from PDFUtils._iter_text_cached(pdf_path, cache_dir)
+            return
+        reader = PdfReader(pdf_path)
+        for page_num in range(len(reader.pages)):
+            yield page_num, reader.pages[page_num].extract_text()
+
     @staticmethod
     def extract_text_from_pages(pdf_path: str) -> List[str]:
         """
@@ -39,10 +78,28 @@ class PDFUtils:
         Returns:
             List[str]: List of text content from each page.
         """
-        reader = PdfReader(pdf_path)
-        pages_text = []
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text = page.extract_text()
-            pages_text.append(text)
-        return pages_text
+        return [text for _, text in PDFUtils.iter_text_from_pages(pdf_path)]
+
+    @staticmethod
+    def _iter_text_cached(pdf_path: str, cache_dir: str) -> Iterator[Tuple[int, str]]:
+        cache_path = Path(cache_dir) / f"{PDFUtils.file_digest(pdf_path)}.json"
+        try:
+            texts = json.loads(cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            texts = None
+        if texts is not None:
+            yield from enumerate(texts)
+            return
+
+        texts = []
+        for page_num, text in PDFUtils.iter_text_from_pages(pdf_path):
+            texts.append(text)
+            yield page_num, text
+        # Only a complete extraction is stored; written atomically so readers never see a partial file
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(texts), encoding="utf-8")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write PDF text cache {cache_path}: {e}")
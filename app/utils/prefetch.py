@@ -0,0 +1,69 @@
+"""
+prefetch.py
+Run an iterator on a background thread, a bounded number of items ahead of its consumer.
+
+Used to overlap CPU-bound producer stages (PDF text extraction + segmentation) with the
+consumer's embedding batches, which release the GIL during model inference. The bounded
+queue caps how much produced work is held in memory at once.
+"""
+
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(items: Iterable[T], maxsize: int = 2, name: str = "prefetch") -> Iterator[T]:
+    """Yield `items` in order while a helper thread produces up to `maxsize` items ahead.
+
+    An exception raised by the producer is re-raised in the consumer at the point it
+    occurred. Closing the returned generator early stops the producer.
+    """
+    items_q: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Poll so an abandoned consumer never leaves the producer blocked on a full queue
+        while not stop.is_set():
+            try:
+                items_q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items_q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+__all__ = ["prefetch"]
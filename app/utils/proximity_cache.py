@@ -0,0 +1,130 @@
+"""
+proximity_cache.py
+Approximate in-process query cache keyed by dense query embedding.
+
+Near-duplicate questions (cosine similarity >= tau against a previously answered
+question with the same filters / top_k) reuse the stored response, skipping the
+Qdrant round-trip and the LLM call entirely.
+
+Cached answers go stale when the collection changes, so entries expire after
+PROXIMITY_TTL seconds and invalidate_all() (registered as a collection_events
+hook, run on ingestion / file deletion) drops every live cache.
+
+Environment variables:
+- PROXIMITY_TAU (float, default 0.97) -> similarity threshold for a hit
+- PROXIMITY_CACHE_SIZE (int, default 0) -> ring buffer capacity (0 disables the cache)
+- PROXIMITY_TTL (float seconds, default 300) -> lifetime of a cached answer
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+from app.utils.collection_events import on_collection_change
+
+
+# Every live cache, so a collection change can invalidate them without wiring instances around
+_instances: "weakref.WeakSet[ProximityCache]" = weakref.WeakSet()
+
+
+class ProximityCache:
+    """Fixed-size ring buffer of (L2-normalized embedding, scope, value, expiry) entries.
+
+    Lookup is a single vectorized matrix-vector product over the cached embeddings.
+    When the buffer is full the oldest entry is overwritten (FIFO eviction); entries
+    older than the TTL never match.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, tau: Optional[float] = None, ttl: Optional[float] = None):
+        self.capacity = capacity if capacity is not None else int(os.getenv("PROXIMITY_CACHE_SIZE", "0"))
+        self.tau = tau if tau is not None else float(os.getenv("PROXIMITY_TAU", "0.97"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("PROXIMITY_TTL", "300"))
+        self._vectors: Optional[np.ndarray] = None  # shape (capacity, d), allocated on first insert
+        self._scopes: List[Optional[Hashable]] = [None] * max(self.capacity, 0)
+        self._values: List[Any] = [None] * max(self.capacity, 0)
+        self._expires = np.zeros(max(self.capacity, 0), dtype=np.float64)
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vec = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        if vec.size == 0 or norm == 0.0:
+            return None
+        return vec / norm
+
+    def get(self, vector, scope: Hashable = None) -> Optional[Any]:
+        """Return the cached value whose embedding is most similar to `vector` (>= tau), else None."""
+        if not self.enabled:
+            return None
+        q = self._normalize(vector)
+        if q is None:
+            return None
+        with self._lock:
+            if self._size == 0 or self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                return None
+            sims = self._vectors[: self._size] @ q
+            # Only entries answered under the same filters / top_k are eligible
+            mismatch = np.fromiter(
+                (s != scope for s in self._scopes[: self._size]), dtype=bool, count=self._size
+            )
+            # Expired entries are skipped too
+            mismatch |= self._expires[: self._size] <= time.monotonic()
+            sims[mismatch] = -np.inf
+            best = int(np.argmax(sims))
+            if sims[best] >= self.tau:
+                return self._values[best]
+        return None
+
+    def put(self, vector, value: Any, scope: Hashable = None) -> None:
+        """Insert an entry, overwriting the oldest one when the buffer is full."""
+        if not self.enabled:
+            return
+        q = self._normalize(vector)
+        if q is None:
+            return
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                # (Re)allocate on first insert or if the embedding model dimension changed
+                self._vectors = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+                self._scopes = [None] * self.capacity
+                self._values = [None] * self.capacity
+                self._expires = np.zeros(self.capacity, dtype=np.float64)
+                self._size = 0
+                self._next = 0
+            self._vectors[self._next] = q
+            self._scopes[self._next] = scope
+            self._values[self._next] = value
+            self._expires[self._next] = time.monotonic() + self.ttl
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._scopes = [None] * max(self.capacity, 0)
+            self._values = [None] * max(self.capacity, 0)
+            self._expires = np.zeros(max(self.capacity, 0), dtype=np.float64)
+            self._size = 0
+            self._next = 0
+
+
+@on_collection_change
+def invalidate_all() -> None:
+    """Clear every live ProximityCache (called whenever the collection contents change)."""
+    for cache in list(_instances):
+        cache.clear()
@@ -1,29 +1,73 @@
 
+import functools
 import os
 import time
-from typing import List
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import numpy as np
 from qdrant_client import QdrantClient, models
 from app.utils.logging_config import logger
+from app.utils.payload_index import ensure_keyword_index
 try:
     import httpx  # for exception types
 except Exception:  # pragma: no cover
     httpx = None
 
+# Qdrant's default optimizer indexing_threshold (KB); used if the original value can't be read back
+_DEFAULT_INDEXING_THRESHOLD = 20000
+
+
+@functools.lru_cache(maxsize=128)
+def filename_filter(filenames: Tuple[str, ...]) -> models.Filter:
+    """Filter restricting a search to `filenames` (one MatchAny condition).
+
+    Memoized: sessions keep asking questions against the same file selection, so pass a
+    sorted tuple to reuse the Filter object. The result is shared; do not mutate it.
+    """
+    return models.Filter(
+        must=[models.FieldCondition(key="filename", match=models.MatchAny(any=list(filenames)))]
+    )
+
+def transport_kwargs() -> dict:
+    """QdrantClient transport options shared by the ingestion and PDF query clients.
+
+    - QDRANT_PREFER_GRPC (flag) -> send points and queries over gRPC (binary protobuf vectors
+      instead of JSON floats); the server's gRPC port must be reachable
+    - QDRANT_GRPC_PORT (int, default 6334)
+    - QDRANT_TIMEOUT (int seconds, default 60) -> large multivector upserts outlast the default
+    """
+    kwargs = {"timeout": int(os.getenv("QDRANT_TIMEOUT", "60"))}
+    if os.getenv("QDRANT_PREFER_GRPC") is not None:
+        kwargs["prefer_grpc"] = True
+        kwargs["grpc_port"] = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    return kwargs
+
 class QdrantClientWrapper:
     def __init__(self):
         self.client = QdrantClient(
             url=os.getenv("QDRANT_URL"),
-            api_key=os.getenv("QDRANT_API")
+            api_key=os.getenv("QDRANT_API"),
+            **transport_kwargs(),
         )
         self.collection_name = os.getenv("COLLECTION_NAME", "hybrid-search")
+        self._bulk_lock = threading.Lock()
+        self._bulk_depth = 0
+        self._saved_indexing_threshold = None
+        # COLBERT_FLOAT16: ColBERT multivectors are sent and (for new collections) stored as float16
+        self._colbert_float16 = os.getenv("COLBERT_FLOAT16") is not None
         self._ensure_hybrid_collection()
+        if os.getenv("COLBERT_SCALAR_QUANTIZATION") is not None:
+            self._enable_colbert_scalar_quantization()
 
     def _ensure_hybrid_collection(self):
         try:
             existing = self.client.get_collection(self.collection_name)
             logger.info(f"Collection '{self.collection_name}' already exists (vectors: {existing.vectors_count}).")
-            # Ensure filename index exists for existing collection
-            self._ensure_filename_index()
+            # Ensure filename index exists for existing collection (schema already fetched above)
+            self._ensure_filename_index(payload_schema=existing.payload_schema)
         except Exception:
             logger.info(f"Creating hybrid collection '{self.collection_name}'.")
             self.client.create_collection(
@@ -39,7 +83,8 @@ class QdrantClientWrapper:
                         multivector_config=models.MultiVectorConfig(
                             comparator=models.MultiVectorComparator.MAX_SIM,
                         ),
-                        hnsw_config=models.HnswConfigDiff(m=0)
+                        hnsw_config=models.HnswConfigDiff(m=0),
+                        datatype=models.Datatype.FLOAT16 if self._colbert_float16 else None,
                     ),
                 },
                 sparse_vectors_config={
@@ -47,23 +92,48 @@ class QdrantClientWrapper:
                 }
             )
             logger.info(f"Hybrid collection '{self.collection_name}' created.")
-            # Create filename index for new collection
-            self._ensure_filename_index()
+            # Create filename index for new collection; stale markers from a previous collection must not skip it
+            self._ensure_filename_index(force=True)
 
-    def _ensure_filename_index(self):
-        """Ensure that the filename field is indexed for efficient filtering."""
+    def _enable_colbert_scalar_quantization(self):
+        """INT8-quantize the ColBERT multivectors (kept in RAM) so MaxSim reranking scans 1 byte per dimension."""
         try:
-            self.client.create_payload_index(
+            self.client.update_collection(
                 collection_name=self.collection_name,
-                field_name="filename",
-                field_schema=models.PayloadSchemaType.KEYWORD
+                vectors_config={
+                    "colbertv2.0": models.VectorParamsDiff(
+                        quantization_config=models.ScalarQuantization(
+                            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+                        )
+                    )
+                },
             )
-            logger.info(f"Created index on 'filename' field for collection {self.collection_name}")
+            logger.info(f"Scalar quantization enabled for 'colbertv2.0' vectors in '{self.collection_name}'")
         except Exception as e:
-            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
-                logger.info(f"Index on 'filename' field already exists for collection {self.collection_name}")
-            else:
-                logger.warning(f"Could not create index on 'filename' field: {e}")
+            logger.warning(f"Could not enable scalar quantization on '{self.collection_name}': {e}")
+
+    def _ensure_filename_index(self, payload_schema=None, force: bool = False):
+        """Ensure that the filename field is indexed for efficient filtering."""
+        ensure_keyword_index(self.client, self.collection_name, "filename", payload_schema=payload_schema, force=force)
+
+    def _build_points(self, dense_vectors, sparse_vectors, colbert_vectors, payloads) -> List[models.PointStruct]:
+        disable_colbert = os.getenv("QDRANT_DISABLE_COLBERT") is not None
+        points: List[models.PointStruct] = []
+        for dense, sparse, colbert, payload in zip(dense_vectors, sparse_vectors, colbert_vectors, payloads):
+            vector_payload = {
+                "all-MiniLM-L6-v2": dense,
+                "bm25": sparse.as_object() if hasattr(sparse, 'as_object') else sparse,
+            }
+            if not disable_colbert:
+                if self._colbert_float16 and len(colbert):
+                    colbert = np.asarray(colbert, dtype=np.float16)
+                vector_payload["colbertv2.0"] = colbert
+            points.append(models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector_payload,
+                payload=payload
+            ))
+        return points
 
     def upsert_hybrid_batch(self, dense_vectors, sparse_vectors, colbert_vectors, payloads):
         """Upsert a batch of hybrid (dense+sparse+ColBERT) vectors with safe sub-batching & retries.
@@ -74,33 +144,21 @@ class QdrantClientWrapper:
         - QDRANT_UPSERT_BACKOFF_BASE (float seconds, default 0.5)
         - QDRANT_DISABLE_COLBERT (bool flag) -> if set, omit ColBERT vectors
         """
-        from qdrant_client.models import PointStruct
-        import uuid
-
         max_points = int(os.getenv("QDRANT_MAX_POINTS_PER_UPSERT", "16"))
         retries = int(os.getenv("QDRANT_UPSERT_RETRIES", "3"))
         backoff_base = float(os.getenv("QDRANT_UPSERT_BACKOFF_BASE", "0.5"))
-        disable_colbert = os.getenv("QDRANT_DISABLE_COLBERT") is not None
 
         # Build full point list first
-        points: List[PointStruct] = []
-        for dense, sparse, colbert, payload in zip(dense_vectors, sparse_vectors, colbert_vectors, payloads):
-            vector_payload = {
-                "all-MiniLM-L6-v2": dense,
-                "bm25": sparse.as_object() if hasattr(sparse, 'as_object') else sparse,
-            }
-            if not disable_colbert:
-                vector_payload["colbertv2.0"] = colbert
-            points.append(PointStruct(
-                id=str(uuid.uuid4()),
-                vector=vector_payload,
-                payload=payload
-            ))
+        points = self._build_points(dense_vectors, sparse_vectors, colbert_vectors, payloads)
 
         if not points:
             logger.warning("No points to upsert (empty batch).")
             return
 
+        self._upsert_points(points, max_points, retries, backoff_base)
+
+    def _upsert_points(self, points, max_points: int, retries: int, backoff_base: float):
+        """Upsert prepared points in sub-batches of `max_points` with retries on transient failures."""
         # Iterate in sub-batches to avoid large payload disconnects
         total = len(points)
         idx = 0
@@ -131,12 +189,81 @@ class QdrantClientWrapper:
                     raise
             idx += len(sub)
 
-    def query_hybrid_with_rerank(self, dense_query, sparse_query, colbert_query, filters, top_k):
-        from qdrant_client import models
-        prefetch = [
+    def upsert_hybrid_parallel(self, dense_vectors, sparse_vectors, colbert_vectors, payloads, parallel: int = 4, batch_size: Optional[int] = None):
+        """Upsert hybrid vectors with `parallel` concurrent HTTP requests.
+
+        Points are split into batches of `batch_size` (default QDRANT_MAX_POINTS_PER_UPSERT) and each batch
+        is upserted on a worker thread with the same retry/backoff policy as `upsert_hybrid_batch`.
+        Upserts are network-bound, so threads are sufficient to overlap round-trips.
+        """
+        max_points = int(os.getenv("QDRANT_MAX_POINTS_PER_UPSERT", "16"))
+        retries = int(os.getenv("QDRANT_UPSERT_RETRIES", "3"))
+        backoff_base = float(os.getenv("QDRANT_UPSERT_BACKOFF_BASE", "0.5"))
+        batch_size = batch_size or max_points
+
+        points = self._build_points(dense_vectors, sparse_vectors, colbert_vectors, payloads)
+        if not points:
+            logger.warning("No points to upsert (empty batch).")
+            return
+        if parallel <= 1 or len(points) <= batch_size:
+            self._upsert_points(points, max_points, retries, backoff_base)
+            return
+
+        batches = [points[i: i + batch_size] for i in range(0, len(points), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(parallel, len(batches))) as executor:
+            futures = [executor.submit(self._upsert_points, batch, max_points, retries, backoff_base) for batch in batches]
+            for future in futures:
+                future.result()  # re-raise the first failure
+        logger.info(f"Parallel upsert of {len(points)} points in {len(batches)} batches (parallel={parallel}) into '{self.collection_name}'.")
+
+    @contextmanager
+    def bulk_indexing(self):
+        """Disable HNSW indexing (indexing_threshold=0) for the duration of a bulk upload, then restore it.
+
+        Nested/concurrent users are reference counted so indexing is only restored by the last one out.
+        """
+        with self._bulk_lock:
+            self._bulk_depth += 1
+            if self._bulk_depth == 1:
+                try:
+                    info = self.client.get_collection(self.collection_name)
+                    self._saved_indexing_threshold = getattr(info.config.optimizer_config, "indexing_threshold", None)
+                    self.client.update_collection(
+                        collection_name=self.collection_name,
+                        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+                    )
+                    logger.info(f"Disabled indexing on '{self.collection_name}' for bulk upload.")
+                except Exception as e:
+                    logger.warning(f"Could not disable indexing for bulk upload: {e}")
+                    self._saved_indexing_threshold = None
+        try:
+            yield
+        finally:
+            with self._bulk_lock:
+                self._bulk_depth -= 1
+                if self._bulk_depth == 0:
+                    threshold = self._saved_indexing_threshold
+                    if threshold is None:
+                        threshold = _DEFAULT_INDEXING_THRESHOLD
+                    try:
+                        self.client.update_collection(
+                            collection_name=self.collection_name,
+                            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=threshold),
+                        )
+                        logger.info(f"Restored indexing_threshold={threshold} on '{self.collection_name}'.")
+                    except Exception as e:
+                        logger.warning(f"Could not restore indexing threshold: {e}")
+
+    @staticmethod
+    def _rerank_prefetch(dense_query, sparse_query) -> List[models.Prefetch]:
+        """Dense + BM25 candidate stages reranked by ColBERT in query_hybrid_with_rerank(_batch)."""
+        return [
             models.Prefetch(query=dense_query, using="all-MiniLM-L6-v2", limit=20),
             models.Prefetch(query=models.SparseVector(**sparse_query.as_object()), using="bm25", limit=20)
         ]
+
+    def query_hybrid_with_rerank(self, dense_query, sparse_query, colbert_query, filters, top_k):
+        prefetch = self._rerank_prefetch(dense_query, sparse_query)
         
         try:
             # Check if ColBERT query is available and valid
@@ -147,7 +274,6 @@ class QdrantClientWrapper:
                     # Support numpy arrays, lists, tuples
                     if hasattr(colbert_query, 'shape'):
                         # numpy ndarray
-                        import numpy as np  # local import to avoid hard dependency elsewhere
                         if isinstance(colbert_query, np.ndarray):
                             colbert_len = colbert_query.shape[0]
                             # Convert to list-of-lists if ndarray for Qdrant
@@ -209,3 +335,73 @@ class QdrantClientWrapper:
             except Exception as fallback_error:
                 logger.error(f"Fallback query also failed: {fallback_error}")
                 raise
+
+    def query_hybrid_with_rerank_batch(self, searches: List[tuple]) -> List[list]:
+        """Run several query_hybrid_with_rerank searches in one query_batch_points round-trip.
+
+        `searches` holds (dense, sparse, colbert, filters, top_k) tuples; returns one point list
+        per search, in order. Searches without a usable ColBERT query, or all of them if the
+        batch call fails, go through query_hybrid_with_rerank individually (with its fallbacks).
+        """
+        results: List[Optional[list]] = [None] * len(searches)
+        requests, batched = [], []
+        for i, (dense_query, sparse_query, colbert_query, filters, top_k) in enumerate(searches):
+            if isinstance(colbert_query, np.ndarray) and colbert_query.dtype != object:
+                colbert_query = colbert_query.tolist()
+            if not isinstance(colbert_query, list) or not colbert_query:
+                continue
+            requests.append(models.QueryRequest(
+                prefetch=self._rerank_prefetch(dense_query, sparse_query),
+                query=colbert_query,
+                using="colbertv2.0",
+                limit=top_k,
+                with_payload=True,
+                filter=filters if filters else None,
+            ))
+            batched.append(i)
+        if requests:
+            try:
+                responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+                for i, response in zip(batched, responses):
+                    results[i] = response.points
+                logger.info(f"Batched hybrid query served {len(requests)} searches in one request.")
+            except Exception as e:
+                logger.warning(f"Batched hybrid query failed, running searches individually: {e}")
+        return [
+            points if points is not None else self.query_hybrid_with_rerank(*search)
+            for points, search in zip(results, searches)
+        ]
+
+    def query_hybrid_rrf(self, dense_query, sparse_query, filters, top_k):
+        """Dense + BM25 candidates fused with Reciprocal Rank Fusion, without the ColBERT rerank stage.
+
+        Cheaper than query_hybrid_with_rerank (no late-interaction scoring and no ColBERT query
+        embedding needed); suited to callers whose consumer (e.g. the LLM) re-reads the hits anyway.
+        """
+        prefetch_limit = max(20, top_k)
+        prefetch = [
+            models.Prefetch(query=dense_query, using="all-MiniLM-L6-v2", limit=prefetch_limit),
+            models.Prefetch(query=models.SparseVector(**sparse_query.as_object()), using="bm25", limit=prefetch_limit),
+        ]
+        try:
+            results = self.client.query_points(
+                collection_name=self.collection_name,
+                prefetch=prefetch,
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=top_k,
+                with_payload=True,
+                query_filter=filters if filters else None
+            )
+            logger.info(f"Hybrid RRF query returned {len(results.points)} results.")
+            return results.points
+        except Exception as e:
+            logger.error(f"Hybrid RRF query failed, falling back to dense-only search: {e}")
+            results = self.client.query_points(
+                collection_name=self.collection_name,
+                query=dense_query,
+                using="all-MiniLM-L6-v2",
+                limit=top_k,
+                with_payload=True,
+                query_filter=filters if filters else None
+            )
+            return results.points
@@ -22,15 +22,16 @@ from typing import List, Tuple, Optional
 import math
 
 
+# Replace common punctuation with spaces to isolate tokens; built once, not per call
+_PUNCT = "\n\t,.!?;:()[]{}<>\"'`|/\\"  # minimal set
+_PUNCT_TRANS = str.maketrans({ch: " " for ch in _PUNCT})
+
+
 def simple_tokenize(text: str) -> List[str]:  # lightweight tokenizer (whitespace + basic punctuation splitting)
     if not text:
         return []
-    # Replace common punctuation with space-delimited versions to isolate tokens
-    punct = "\n\t,.!?;:()[]{}<>\"'`|/\\"  # minimal set
-    trans = str.maketrans({ch: " " for ch in punct})
-    normalized = text.translate(trans)
-    # Split on whitespace
-    return [tok for tok in normalized.split() if tok]
+    # translate + split both run in C; split() never yields empty tokens
+    return text.translate(_PUNCT_TRANS).split()
 
 
 def segment_text_by_tokens(
@@ -54,7 +55,21 @@ def segment_text_by_tokens(
     Returns:
         List of segmented text strings.
     """
-    tokens = simple_tokenize(text)
+    return _segment_tokens(
+        text, simple_tokenize(text), target_tokens, soft_max_tokens, overlap_tokens, hard_max_tokens, safety_cap
+    )
+
+
+def _segment_tokens(
+    text: str,
+    tokens: List[str],
+    target_tokens: int,
+    soft_max_tokens: int,
+    overlap_tokens: int,
+    hard_max_tokens: int,
+    safety_cap: int = 20000,
+) -> List[str]:
+    """Core of segment_text_by_tokens on an already tokenized text (lets callers tokenize once)."""
     n = len(tokens)
     if n == 0:
         return []
@@ -62,7 +77,6 @@ def segment_text_by_tokens(
         return [text]
 
     segments: List[str] = []
-    step = max(1, target_tokens - overlap_tokens) if target_tokens > overlap_tokens else target_tokens
     start = 0
     iterations = 0
     while start < n and iterations < safety_cap:
@@ -119,7 +133,7 @@ def dynamic_segment_text(
       1. Tokenize once.
       2. If total tokens <= max_tokens -> return single segment.
       3. Compute window via compute_dynamic_window.
-      4. Use segment_text_by_tokens with (target=window, soft_max=window*2 capped, overlap=overlap_tokens).
+      4. Segment the same tokens as segment_text_by_tokens would, with (target=window, soft_max=window*2 capped, overlap=overlap_tokens).
     """
     tokens = simple_tokenize(text)
     total = len(tokens)
@@ -129,8 +143,10 @@ def dynamic_segment_text(
         return [text]
     window = compute_dynamic_window(total, target_segment_count, min_tokens, max_tokens, hard_max_tokens)
     soft = min(hard_max_tokens, max(window, int(window * 1.5)))
-    return segment_text_by_tokens(
-        text=text,
+    # Reuse the tokens computed above instead of tokenizing the text a second time
+    return _segment_tokens(
+        text,
+        tokens,
         target_tokens=window,
         soft_max_tokens=soft,
         overlap_tokens=overlap_tokens,
@@ -138,8 +154,22 @@ def dynamic_segment_text(
     )
 
 
+def segment_or_whole(text: str, dynamic: bool, params: dict) -> List[str]:
+    """Segment one text with the static or dynamic strategy, falling back to the whole text.
+
+    Module-level (picklable) so ingestion can map it over a process pool.
+    `params` are the keyword arguments of `dynamic_segment_text` / `segment_text_by_tokens`.
+    """
+    if dynamic:
+        segs = dynamic_segment_text(text, **params)
+    else:
+        segs = segment_text_by_tokens(text, **params)
+    return segs or [text]
+
+
 __all__ = [
     "simple_tokenize",
+    "segment_or_whole",
     "segment_text_by_tokens",
     "dynamic_segment_text",
     "compute_dynamic_window",
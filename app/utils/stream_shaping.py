@@ -0,0 +1,132 @@
+"""
+stream_shaping.py
+Re-chunking helpers for streamed LLM output.
+
+Providers emit either bursts of tiny chunks (per-yield transport overhead dominates) or
+occasional very large chunks (nothing renders, then a wall of text). These wrappers sit
+between the provider stream and the HTTP layer and never change the concatenated text.
+
+Environment variables (read by shape_stream):
+- STREAM_COALESCE_MS (float, default 10) -> merge chunks that arrive within this window (0 disables)
+- STREAM_COALESCE_MAX_CHARS (int, default 64) -> flush a merged chunk once it reaches this size
+- STREAM_PACE_MS (float, default 0) -> emit oversized chunks as small pieces this far apart (0 disables)
+- STREAM_PACE_SPLIT_OVER (int, default 50) -> chunks longer than this are paced
+- STREAM_PACE_PIECE (int, default 4) -> characters per paced piece
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Iterable, Iterator, Tuple
+
+_DONE = object()
+
+
+def drain_lines(buffer: str, part: str) -> Tuple[str, str]:
+    """Split `buffer + part` into (new partial-line buffer, complete lines to emit).
+
+    Only the new `part` is scanned (one rfind), and all complete lines are returned as
+    one block so the caller can yield them at once; emit is "" while no line completes.
+    """
+    i = part.rfind("\n")
+    if i < 0:
+        return buffer + part, ""
+    return part[i + 1:], buffer + part[: i + 1]
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def coalesce_stream(chunks: Iterable[str], window_s: float, max_chars: int) -> Iterator[str]:
+    """Merge chunks arriving less than `window_s` after the previous flush, up to `max_chars`.
+
+    The first chunk after a quiet period is flushed immediately, so time to first token is
+    unchanged. The source is read on a helper thread, so a buffered chunk is flushed when
+    its window expires even if the provider stalls.
+    """
+    if window_s <= 0:
+        yield from chunks
+        return
+
+    items: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                items.put(chunk)
+        except BaseException as e:
+            items.put(_Failure(e))
+        finally:
+            items.put(_DONE)
+
+    threading.Thread(target=produce, name="stream-coalesce", daemon=True).start()
+    buffer: list = []
+    size = 0
+    last_flush = float("-inf")
+    try:
+        while True:
+            timeout = max(0.0, last_flush + window_s - time.monotonic()) if buffer else None
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                yield "".join(buffer)
+                buffer, size, last_flush = [], 0, time.monotonic()
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                if buffer:
+                    yield "".join(buffer)
+                raise item.error
+            if not item:
+                continue
+            buffer.append(item)
+            size += len(item)
+            if size >= max_chars or time.monotonic() - last_flush >= window_s:
+                yield "".join(buffer)
+                buffer, size, last_flush = [], 0, time.monotonic()
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        stop.set()
+
+
+def pace_stream(chunks: Iterable[str], pace_s: float, split_over: int = 50, piece: int = 4) -> Iterator[str]:
+    """Emit chunks longer than `split_over` as `piece`-sized slices spaced `pace_s` apart."""
+    if pace_s <= 0:
+        yield from chunks
+        return
+    for chunk in chunks:
+        if len(chunk) <= split_over:
+            yield chunk
+            continue
+        for i in range(0, len(chunk), piece):
+            if i:
+                time.sleep(pace_s)
+            yield chunk[i:i + piece]
+
+
+def shape_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """Apply pacing (opt-in) then coalescing, configured from the environment."""
+    paced = pace_stream(
+        chunks,
+        pace_s=float(os.getenv("STREAM_PACE_MS", "0")) / 1000.0,
+        split_over=int(os.getenv("STREAM_PACE_SPLIT_OVER", "50")),
+        piece=max(1, int(os.getenv("STREAM_PACE_PIECE", "4"))),
+    )
+    return coalesce_stream(
+        paced,
+        window_s=float(os.getenv("STREAM_COALESCE_MS", "10")) / 1000.0,
+        max_chars=int(os.getenv("STREAM_COALESCE_MAX_CHARS", "64")),
+    )
+
+
+__all__ = ["coalesce_stream", "drain_lines", "pace_stream", "shape_stream"]
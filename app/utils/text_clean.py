@@ -0,0 +1,38 @@
+"""
+text_clean.py
+Light normalization of source snippets used as LLM context.
+
+Ingestion applies it to the stored full-text field and marks the payload with
+CLEANED_MARKER, so queries can use that text as-is instead of re-cleaning every
+retrieved source on every request. The cleaning is idempotent, so points
+ingested before the marker existed are simply cleaned at query time.
+"""
+
+import re
+
+# Payload flag set by ingestion when the full-text field is already normalized
+CLEANED_MARKER = "_text_cleaned"
+
+# Runs of 3+ newlines, compiled once
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def clean_source_text(text: str) -> str:
+    """Normalize line endings, strip each line and collapse blank-line runs (keeps single newlines)."""
+    if not text:
+        return ""
+    # Collapse windows line endings
+    text = text.replace('\r\n', '\n')
+    # Strip leading/trailing whitespace on each line first, so whitespace-only lines
+    # count as blank for the collapse below (this ordering is what makes it idempotent)
+    lines = [ln.strip() for ln in text.split('\n')]
+    # Remove empty lines at start/end
+    while lines and lines[0] == '':
+        lines.pop(0)
+    while lines and lines[-1] == '':
+        lines.pop()
+    # Trim excessive blank lines in source snippets (but keep single newlines)
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(lines))
+
+
+__all__ = ["CLEANED_MARKER", "clean_source_text"]
@@ -0,0 +1,78 @@
+"""
+upsert_pipeline.py
+Two-stage producer/consumer helper that overlaps embedding with Qdrant upserts.
+
+The producer (ingestion loop) embeds batch N+1 while a background thread upserts
+batch N. A bounded queue provides backpressure so at most `maxsize` embedded
+batches are held in memory. Both stages release the GIL (model inference / HTTP),
+so a plain thread is enough.
+"""
+
+import queue
+import threading
+from typing import Callable, Optional
+
+from app.utils.logging_config import logger
+
+
+class UpsertPipeline:
+    """Run `upsert_fn(*item)` on a background thread for every submitted item.
+
+    Usage:
+        with UpsertPipeline(qdrant.upsert_hybrid_batch) as pipeline:
+            pipeline.submit(dense, sparse, colbert, payloads)
+
+    A failure in the consumer is re-raised in the producer on the next `submit`
+    or when the pipeline is closed; remaining queued items are discarded.
+    """
+
+    _SENTINEL = object()
+
+    def __init__(self, upsert_fn: Callable, maxsize: int = 2, name: str = "upsert-pipeline"):
+        self._upsert_fn = upsert_fn
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def __enter__(self) -> "UpsertPipeline":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Producer already failing: stop the consumer but keep the original exception
+            try:
+                self.close()
+            except Exception as consumer_error:
+                logger.warning(f"Upsert pipeline also failed during shutdown: {consumer_error}")
+        return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._SENTINEL:
+                return
+            if self._error is not None:
+                continue  # drain without upserting after a failure
+            try:
+                self._upsert_fn(*item)
+            except BaseException as e:
+                self._error = e
+
+    def raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, *item):
+        """Queue one batch for upsert; blocks while the queue is full."""
+        self.raise_if_failed()
+        self._queue.put(item)
+
+    def close(self):
+        """Wait for all queued batches to be upserted, then re-raise any consumer failure."""
+        if self._thread.is_alive():
+            self._queue.put(self._SENTINEL)
+            self._thread.join()
+        self.raise_if_failed()
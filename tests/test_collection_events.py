@@ -0,0 +1,31 @@
+"""
+Tests for the collection-change hooks that invalidate query-side caches.
+"""
+from unittest.mock import MagicMock, patch
+
+from app.utils import collection_events
+from app.utils.collection_events import collection_changed, on_collection_change
+from app.utils.proximity_cache import ProximityCache
+
+
+def test_registered_callbacks_run_on_change():
+    """Every registered callback runs, even after an earlier one raises."""
+    failing = MagicMock(side_effect=RuntimeError("boom"))
+    ok = MagicMock()
+    with patch.object(collection_events, "_LISTENERS", []):
+        on_collection_change(failing)
+        assert on_collection_change(ok) is ok
+        collection_changed()
+
+    failing.assert_called_once()
+    ok.assert_called_once()
+
+
+def test_collection_change_clears_proximity_caches():
+    """ProximityCache registers itself, so writers never need to import it."""
+    cache = ProximityCache(capacity=4, tau=0.9)
+    cache.put([1.0, 0.0], "stale answer")
+
+    collection_changed()
+
+    assert cache.get([1.0, 0.0]) is None
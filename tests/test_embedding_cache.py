@@ -0,0 +1,90 @@
+"""
+Tests for the content-hash EmbeddingCache shared by CSV and PDF ingestion.
+"""
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.utils.embedding_cache import EmbeddingCache, embed_all, shared_embedding_cache
+
+
+def _fake_embedder():
+    embedder = MagicMock()
+    embedder.embed_dense.side_effect = lambda texts: [f"d:{t}" for t in texts]
+    embedder.embed_sparse.side_effect = lambda texts: [f"s:{t}" for t in texts]
+    embedder.embed_colbert.side_effect = lambda texts: [f"c:{t}" for t in texts]
+    return embedder
+
+
+def test_duplicates_are_embedded_once_and_order_preserved():
+    """Only unique uncached texts reach the embedder; results stay aligned with input."""
+    cache = EmbeddingCache(maxsize=16, cache_dir="")
+    embedder = _fake_embedder()
+
+    dense, sparse, colbert = cache.embed(embedder, ["a", "b", "a"])
+
+    embedder.embed_dense.assert_called_once_with(["a", "b"])
+    assert dense == ["d:a", "d:b", "d:a"]
+    assert sparse == ["s:a", "s:b", "s:a"]
+    assert colbert == ["c:a", "c:b", "c:a"]
+
+
+def test_cached_texts_skip_the_embedder():
+    """A second batch only embeds texts not seen before."""
+    cache = EmbeddingCache(maxsize=16, cache_dir="")
+    embedder = _fake_embedder()
+    cache.embed(embedder, ["a", "b"])
+
+    dense, _, _ = cache.embed(embedder, ["b", "c"])
+
+    assert embedder.embed_dense.call_args_list[-1].args == (["c"],)
+    assert dense == ["d:b", "d:c"]
+    assert cache.hits == 1
+
+
+def test_lru_bound_is_respected():
+    """The cache never grows beyond maxsize."""
+    cache = EmbeddingCache(maxsize=2, cache_dir="")
+    cache.embed(_fake_embedder(), ["a", "b", "c"])
+
+    assert len(cache) == 2
+
+
+def test_embed_all_runs_models_concurrently_and_sequentially(monkeypatch):
+    """embed_all returns the same aligned results with and without the thread pool."""
+    embedder = _fake_embedder()
+
+    concurrent = embed_all(embedder, ["x", "y"])
+    monkeypatch.setenv("EMBED_CONCURRENT", "0")
+    sequential = embed_all(embedder, ["x", "y"])
+
+    assert concurrent == sequential == (["d:x", "d:y"], ["s:x", "s:y"], ["c:x", "c:y"])
+
+
+def test_disk_round_trip_uses_plain_arrays(tmp_path):
+    """Saved vectors reload with allow_pickle=False and keep their values and shapes."""
+    cache = EmbeddingCache(maxsize=8, cache_dir=str(tmp_path))
+    embedder = MagicMock()
+    embedder.embed_dense.side_effect = lambda texts: [np.full(3, len(t), dtype=np.float32) for t in texts]
+    embedder.embed_sparse.side_effect = lambda texts: [
+        SimpleNamespace(indices=np.arange(len(t)), values=np.ones(len(t))) for t in texts
+    ]
+    embedder.embed_colbert.side_effect = lambda texts: [np.ones((len(t), 4), dtype=np.float32) for t in texts]
+    cache.embed(embedder, ["ab", "xyz"])
+    cache.save()
+
+    with np.load(tmp_path / "embedding_cache.npz", allow_pickle=False) as data:
+        assert all(data[name].dtype != object for name in data.files)
+    reloaded = EmbeddingCache(maxsize=8, cache_dir=str(tmp_path))
+    dense, sparse, colbert = reloaded.embed(MagicMock(), ["xyz", "ab"])
+
+    assert reloaded.hits == 2
+    assert dense[0].tolist() == [3.0, 3.0, 3.0]
+    assert sparse[1] == {"indices": [0, 1], "values": [1.0, 1.0]}
+    assert colbert[0].shape == (3, 4)
+
+
+def test_shared_cache_is_one_instance():
+    """CSV and PDF ingestion get the same cache, so they never overwrite each other's file."""
+    assert shared_embedding_cache() is shared_embedding_cache()
@@ -0,0 +1,180 @@
+"""
+Tests for LLMService prompt building and answer caching (Gemini client mocked).
+"""
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from app.services.llm_service import (
+    LLMService,
+    _lacks_context,
+    _normalize_context,
+    classify_answer_style,
+    get_llm_service,
+    is_chitchat,
+    is_greeting,
+    is_identity_question,
+    rag_search,
+)
+from app.utils.proximity_cache import ProximityCache
+
+
+def _service(**kwargs):
+    service = LLMService(**kwargs)
+    service.client = MagicMock()
+    service.client.models.generate_content.return_value = SimpleNamespace(text=" cached answer ")
+    return service
+
+
+def test_semantic_cache_skips_second_llm_call():
+    """A near-duplicate question over the same context reuses the stored answer."""
+    vectors = {"What is the leave policy?": [1.0, 0.0], "what is the leave policy": [0.99, 0.01]}
+    service = _service(semantic_cache=ProximityCache(capacity=4, tau=0.95), embed_fn=vectors.__getitem__)
+
+    first = service.synthesize_answer("What is the leave policy?", "ctx")
+    second = service.synthesize_answer("what is the leave policy", "ctx")
+
+    assert first == second
+    assert first[0] == "cached answer"
+    service.client.models.generate_content.assert_called_once()
+
+
+def test_semantic_cache_is_scoped_to_context():
+    """The same question over different context is not served from the cache."""
+    service = _service(semantic_cache=ProximityCache(capacity=4, tau=0.95), embed_fn=lambda q: [1.0, 0.0])
+
+    service.synthesize_answer("q", "context A")
+    service.synthesize_answer("q", "context B")
+
+    assert service.client.models.generate_content.call_count == 2
+
+
+def test_exact_cache_serves_identical_prompt():
+    """Re-asking the identical question over the identical context skips the LLM."""
+    service = _service()
+
+    first = service.synthesize_answer("q", "ctx")
+    second = service.synthesize_answer("q", "ctx")
+
+    assert first == second
+    service.client.models.generate_content.assert_called_once()
+
+
+def test_synthesize_answer_renders_prompt_once():
+    """One render serves both the exact-cache key and the request contents (full prompt without a preamble cache)."""
+    service = _service()
+
+    with patch.object(service, "_build_rag_prompt", wraps=service._build_rag_prompt) as build:
+        service.synthesize_answer("q", "ctx")
+
+    assert build.call_count == 1
+    sent = service.client.models.generate_content.call_args.kwargs["contents"]
+    assert sent == service._build_rag_prompt("q", "ctx")
+
+
+def test_normalize_context_dedupes_source_blocks_not_paragraphs():
+    """Repeated sources are dropped even when renumbered; paragraphs inside a source stay intact."""
+    context = (
+        "**Source 1** (a.pdf):\nIntro\n\nIntro\n\n"
+        "**Source 2** (b.pdf):\nOther text\n\n"
+        "**Source 3** (a.pdf):\nIntro\n\nIntro"
+    )
+    assert _normalize_context(context, max_chars=1000) == (
+        "**Source 1** (a.pdf):\nIntro\n\nIntro\n\n**Source 2** (b.pdf):\nOther text"
+    )
+
+
+def test_normalize_context_without_headers_dedupes_paragraphs_and_caps_size():
+    """Plain context is deduped per blank-line block and kept whole-block within the budget."""
+    context = "A block\n\nB block\n  \nA block\n\nC block"
+    assert _normalize_context(context, max_chars=1000) == "A block\n\nB block\n\nC block"
+    assert _normalize_context(context, max_chars=16) == "A block\n\nB block"
+    assert _normalize_context("x" * 50, max_chars=10) == "x" * 10
+
+
+def test_normalize_context_caps_source_blocks():
+    """The budget also applies to headed context, dropping whole trailing sources."""
+    context = "**Source 1** (a.pdf):\n" + "a" * 40 + "\n\n**Source 2** (b.pdf):\n" + "b" * 40
+    assert _normalize_context(context, max_chars=70) == "**Source 1** (a.pdf):\n" + "a" * 40
+
+
+def test_is_greeting_matches_whole_words_only():
+    """Greetings match case-insensitively as whole words; words containing them do not."""
+    assert is_greeting("Hello there")
+    assert is_greeting("good Morning team")
+    assert not is_greeting("What is this policy?")
+
+
+def test_metrics_trailer_is_a_single_chunk():
+    """The metrics block follows the answer as one chunk listing each source file once."""
+    service = _service()
+    service._stream_raw = MagicMock(return_value=iter(["answer\n"]))
+    metrics = SimpleNamespace(
+        avg_retrieval_score=0.5, max_retrieval_score=0.9, num_sources_used=3,
+        confidence_score=0.7, coverage_score=0.2, source_diversity=0.4,
+    )
+
+    chunks = list(service.stream_answer_with_metrics("q", "ctx", metrics, [{"filename": "a.csv"}, {"filename": "a.csv"}]))
+
+    assert chunks[0] == "answer\n"
+    assert len(chunks) == 2
+    assert "**Source Files Used:** 1 files (a.csv)" in chunks[1]
+
+
+def test_lacks_context_detects_placeholder_only():
+    """Empty context and the no-content placeholder skip the LLM; real context does not."""
+    assert _lacks_context("")
+    assert _lacks_context("  No relevant content found in the documents.\n")
+    assert not _lacks_context("No relevant content found in the documents." + " extra" * 100)
+
+
+def test_get_llm_service_is_a_singleton():
+    """Every caller (and every request via Depends) shares one LLMService and its caches."""
+    assert get_llm_service() is get_llm_service()
+
+
+def test_identity_and_chitchat_bypass_triggers():
+    """Identity questions match anywhere; chit-chat needs an exact greeting or a small-talk opener."""
+    assert is_identity_question("So, WHO ARE YOU exactly?")
+    assert not is_identity_question("Who owns the leave policy?")
+    assert is_chitchat("  Hey ")
+    assert is_chitchat("how are you today")
+    assert not is_chitchat("hey, what is the leave policy?")
+
+
+def test_classify_answer_style_labels():
+    """Explicit depth requests are detailed, short questions minimal, everything else concise."""
+    assert classify_answer_style("Explain why the rollout failed")["label"] == "detailed"
+    assert classify_answer_style("what is the leave policy")["label"] == "minimal"
+    assert classify_answer_style("how do I apply")["label"] == "concise"
+    assert classify_answer_style("what is the leave policy for contractors in the india office")["label"] == "concise"
+
+
+def test_classify_answer_style_result_is_read_only():
+    """The lru_cached style is shared across callers, so it cannot be mutated."""
+    style = classify_answer_style("how do I apply")
+    try:
+        style["max_words"] = 1
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("cached style was mutable")
+    assert classify_answer_style("how do I apply")["max_words"] != 1
+
+
+def test_auto_answer_bypasses_model_for_chitchat():
+    """Greetings and identity questions are answered directly without a Gemini call."""
+    service = _service()
+
+    assert service.auto_answer("hello") == LLMService._CHITCHAT_REPLY
+    assert service.auto_answer("who are you?") == LLMService._IDENTITY_REPLY
+    service.client.models.generate_content.assert_not_called()
+
+
+def test_rag_search_delegates_to_query_service():
+    """The llm_service tool reuses query_service.rag_search (its embedding LRU and search TTLCache)."""
+    hits = {"question": "q", "segments": [], "files": [], "num_segments": 0, "unique_files": 0}
+    with patch("app.services.query_service.rag_search", return_value=hits) as delegate:
+        assert rag_search("q", top_k=3, selected_files=["a.pdf"]) is hits
+
+    assert delegate.call_args.kwargs["top_k"] == 3
+    assert delegate.call_args.kwargs["selected_files"] == ["a.pdf"]
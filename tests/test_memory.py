@@ -0,0 +1,50 @@
+"""
+Tests for the memory probes that size ingestion batches from free memory.
+"""
+from unittest.mock import patch
+
+from app.utils.memory import batch_size_for_headroom, is_oom_error, memory_headroom
+
+
+def test_batch_size_fits_target_share_of_free_memory():
+    """With a calibrated per-item cost the batch uses about 80% of free memory."""
+    with patch("app.utils.memory.memory_free_bytes", return_value=1000):
+        assert batch_size_for_headroom(64, bytes_per_item=100) == 8
+
+
+def test_batch_size_clamped_between_min_and_max():
+    """Plenty of memory never exceeds max_batch; too little still returns min_batch."""
+    with patch("app.utils.memory.memory_free_bytes", return_value=10**12):
+        assert batch_size_for_headroom(64, bytes_per_item=100) == 64
+    with patch("app.utils.memory.memory_free_bytes", return_value=10):
+        assert batch_size_for_headroom(64, bytes_per_item=100, min_batch=2) == 2
+
+
+def test_uncalibrated_or_unprobed_keeps_max_batch():
+    """Without a per-item estimate or a memory probe the configured batch is used."""
+    assert batch_size_for_headroom(32, bytes_per_item=None) == 32
+    with patch("app.utils.memory.memory_free_bytes", return_value=None):
+        assert batch_size_for_headroom(32, bytes_per_item=100) == 32
+
+
+def test_headroom_is_free_over_total():
+    """memory_headroom reports the free fraction from the underlying probe."""
+    with patch("app.utils.memory._free_and_total", return_value=(25, 100)):
+        assert memory_headroom() == 0.25
+    with patch("app.utils.memory._free_and_total", return_value=None):
+        assert memory_headroom() is None
+
+
+def test_oom_detection_by_type_message_and_cause():
+    """Typed OOMs, allocator messages and wrapped OOMs count; unrelated errors do not."""
+    assert is_oom_error(MemoryError())
+    assert is_oom_error(RuntimeError("[ONNXRuntimeError] : 6 : BFCArena Failed to allocate memory"))
+    try:
+        try:
+            raise MemoryError()
+        except MemoryError as inner:
+            raise RuntimeError("embedding failed") from inner
+    except RuntimeError as wrapped:
+        assert is_oom_error(wrapped)
+    assert not is_oom_error(RuntimeError("CUDA error: device-side assert triggered"))
+    assert not is_oom_error(ValueError("bad input"))
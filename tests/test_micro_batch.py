@@ -0,0 +1,89 @@
+"""
+Tests for MicroBatcher, which coalesces concurrent rag_search query embeddings.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.utils.micro_batch import MicroBatcher
+
+
+def test_single_submit_returns_its_own_result():
+    """A lone request is run immediately and gets its own result back."""
+    batcher = MicroBatcher(lambda texts: [t.upper() for t in texts])
+
+    assert batcher.submit("hello") == "HELLO"
+
+
+def test_concurrent_submits_share_a_batch():
+    """Requests queued while a batch is running are served together in the next call."""
+    calls = []
+    release = threading.Event()
+
+    def batch_fn(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            release.wait(timeout=5)  # hold the first batch so the rest queue up
+        return [len(t) for t in texts]
+
+    batcher = MicroBatcher(batch_fn, max_batch=8)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(batcher.submit, "a")
+        while not calls:
+            time.sleep(0.001)
+        rest = [pool.submit(batcher.submit, "b" * n) for n in (2, 3, 4)]
+        while batcher._queue.qsize() < 3:
+            time.sleep(0.001)
+        release.set()
+        assert first.result() == 1
+        assert [f.result() for f in rest] == [2, 3, 4]
+
+    assert len(calls) == 2
+    assert sorted(calls[1]) == ["bb", "bbb", "bbbb"]
+
+
+def test_token_budget_splits_batches():
+    """A text that would overflow max_tokens is carried into the following batch."""
+    calls = []
+    release = threading.Event()
+
+    def batch_fn(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            release.wait(timeout=5)
+        return texts
+
+    batcher = MicroBatcher(batch_fn, max_batch=8, max_tokens=3)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        first = pool.submit(batcher.submit, "x")
+        while not calls:
+            time.sleep(0.001)
+        a = pool.submit(batcher.submit, "one two")
+        while batcher._queue.qsize() < 1:
+            time.sleep(0.001)
+        b = pool.submit(batcher.submit, "three four")
+        while batcher._queue.qsize() < 2:
+            time.sleep(0.001)
+        release.set()
+        assert (first.result(), a.result(), b.result()) == ("x", "one two", "three four")
+
+    assert calls[1:] == [["one two"], ["three four"]]
+
+
+def test_batch_failure_propagates_to_every_caller():
+    """An exception in batch_fn is raised in each waiting caller."""
+    def batch_fn(texts):
+        raise ValueError("encoder down")
+
+    batcher = MicroBatcher(batch_fn)
+    with pytest.raises(ValueError, match="encoder down"):
+        batcher.submit("q")
+
+
+def test_cost_fn_allows_non_text_items():
+    """With a cost_fn, arbitrary items (e.g. search tuples) are batched and budgeted by that cost."""
+    batcher = MicroBatcher(lambda items: [a + b for a, b in items], cost_fn=lambda item: 1)
+
+    assert batcher.submit((2, 3)) == 5
@@ -0,0 +1,83 @@
+"""
+Tests for the cached keyword payload-index check.
+"""
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from qdrant_client import models
+
+from app.utils import payload_index
+
+
+def _reset(monkeypatch, tmp_path):
+    monkeypatch.setattr(payload_index.tempfile, "gettempdir", lambda: str(tmp_path))
+    monkeypatch.setattr(payload_index, "_INDEX_ENSURED", set())
+    monkeypatch.setenv("QDRANT_URL", "http://qdrant-a:6333")
+
+
+def _marker(server_url="http://qdrant-a:6333"):
+    return Path(payload_index._marker_path(server_url, "col", "filename"))
+
+
+def test_existing_index_in_schema_skips_create(monkeypatch, tmp_path):
+    """A KEYWORD entry in payload_schema means no create_payload_index call."""
+    _reset(monkeypatch, tmp_path)
+    client = MagicMock()
+    schema = {"filename": SimpleNamespace(data_type=models.PayloadSchemaType.KEYWORD)}
+
+    payload_index.ensure_keyword_index(client, "col", "filename", payload_schema=schema)
+
+    client.create_payload_index.assert_not_called()
+    assert _marker().exists()
+
+
+def test_missing_index_created_once_per_process(monkeypatch, tmp_path):
+    """The index is created once; later calls are answered from the in-process cache."""
+    _reset(monkeypatch, tmp_path)
+    client = MagicMock()
+    client.get_collection.return_value = SimpleNamespace(payload_schema={})
+
+    payload_index.ensure_keyword_index(client, "col", "filename")
+    payload_index.ensure_keyword_index(client, "col", "filename")
+
+    client.create_payload_index.assert_called_once()
+    client.get_collection.assert_called_once()
+
+
+def test_marker_file_skips_server_round_trip(monkeypatch, tmp_path):
+    """Another worker's marker file avoids any Qdrant call."""
+    _reset(monkeypatch, tmp_path)
+    _marker().touch()
+    client = MagicMock()
+
+    payload_index.ensure_keyword_index(client, "col", "filename")
+
+    client.get_collection.assert_not_called()
+    client.create_payload_index.assert_not_called()
+
+
+def test_schema_without_index_overrides_stale_marker(monkeypatch, tmp_path):
+    """A caller-supplied schema missing the index recreates it even with a marker from a dropped collection."""
+    _reset(monkeypatch, tmp_path)
+    _marker().touch()
+    client = MagicMock()
+    client.create_payload_index.side_effect = RuntimeError("strict mode: connection refused")
+
+    payload_index.ensure_keyword_index(client, "col", "filename", payload_schema={})
+
+    client.create_payload_index.assert_called_once()
+    assert not _marker().exists()
+
+
+def test_marker_is_keyed_by_server(monkeypatch, tmp_path):
+    """A marker written for one Qdrant server does not skip the check on another."""
+    _reset(monkeypatch, tmp_path)
+    _marker("http://qdrant-b:6333").touch()
+    client = MagicMock()
+    client.get_collection.return_value = SimpleNamespace(payload_schema={})
+
+    payload_index.ensure_keyword_index(client, "col", "filename")
+
+    client.create_payload_index.assert_called_once()
+    assert _marker().exists()
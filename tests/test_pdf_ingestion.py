@@ -0,0 +1,94 @@
+"""
+Tests for PDFIngestionService.ingest_pdf's adaptive embedding batches and page segmentation.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from app.services import pdf_service
+from app.services.pdf_service import PDFIngestionService, _PDFIngestConfig, _segment_pages
+
+
+class _RecordingCache:
+    """Stands in for EmbeddingCache: records batch sizes and raises MemoryError on chosen calls."""
+
+    hits = misses = 0
+
+    def __init__(self, fail_calls=()):
+        self.sizes = []
+        self.fail_calls = set(fail_calls)
+
+    def embed(self, embedder, texts):
+        self.sizes.append(len(texts))
+        if len(self.sizes) in self.fail_calls:
+            raise MemoryError("out of memory")
+        return list(texts), list(texts), list(texts)
+
+    def save(self):
+        pass
+
+
+def _service(cache, batch_size=64):
+    service = object.__new__(PDFIngestionService)
+    service.embedder = MagicMock()
+    service.qdrant = MagicMock()
+    service.embedding_cache = cache
+    service._config = _PDFIngestConfig.from_env()._replace(
+        segment_fn=lambda text: [text], batch_size=batch_size, sort_window=batch_size, segment_workers=1,
+    )
+    return service
+
+
+def _ingest(service, n_pages):
+    pages = [(i, f"page {i} text") for i in range(n_pages)]
+    with patch.object(pdf_service.PDFUtils, "iter_text_from_pages", return_value=iter(pages)), \
+         patch.object(pdf_service, "release_memory"):
+        service.ingest_pdf("doc.pdf", {"filename": "doc.pdf"})
+
+
+def test_oom_halves_the_batch_that_failed_not_the_configured_size():
+    """With headroom capping the batch at 10, an OOM retries at 5 rather than 64 // 2."""
+    cache = _RecordingCache(fail_calls={1})
+    service = _service(cache, batch_size=64)
+
+    with patch.object(pdf_service, "batch_size_for_headroom", side_effect=lambda max_batch, *a: min(max_batch, 10)):
+        _ingest(service, 64)
+
+    assert cache.sizes[:2] == [10, 5]
+    assert max(cache.sizes[1:]) <= 10
+    upserted = sum(len(call.args[3]) for call in service.qdrant.upsert_hybrid_batch.call_args_list)
+    assert upserted == 64
+
+
+def test_upsert_failure_is_not_retried_as_embedding_oom():
+    """An out-of-memory error surfaced by the upsert pipeline propagates instead of shrinking the batch."""
+    cache = _RecordingCache()
+    service = _service(cache, batch_size=8)
+    service.qdrant.upsert_hybrid_batch.side_effect = MemoryError("out of memory")
+
+    try:
+        _ingest(service, 32)
+    except MemoryError:
+        pass
+    else:
+        raise AssertionError("upsert failure was swallowed")
+
+    assert all(size == 8 for size in cache.sizes)
+
+
+def test_parallel_segmentation_reads_pages_in_bounded_windows():
+    """With a pool, only workers * window pages are pulled ahead, and results keep page order."""
+    pulled = []
+
+    def pages():
+        for i in range(100):
+            pulled.append(i)
+            yield i, f"page {i}"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        segmented = _segment_pages(pages(), lambda text: [text.upper()], pool, segment_workers=2)
+        assert next(segmented) == (0, ["PAGE 0"])
+        assert len(pulled) == 2 * pdf_service._SEGMENT_WINDOW_PER_WORKER
+        rest = list(segmented)
+
+    assert [idx for idx, _ in rest] == list(range(1, 100))
+    assert rest[-1] == (99, ["PAGE 99"])
@@ -0,0 +1,58 @@
+"""
+Tests for PDFUtils page-text extraction and its content-hash disk cache.
+"""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.utils.pdf_utils import PDFUtils
+
+
+def _fake_reader(texts):
+    pages = [SimpleNamespace(extract_text=lambda t=t: t) for t in texts]
+    return SimpleNamespace(pages=pages)
+
+
+def test_cached_extraction_skips_parsing_on_reingest(tmp_path):
+    """The second pass over the same bytes is served from the cache without opening a reader."""
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+    cache_dir = tmp_path / "cache"
+
+    with patch("app.utils.pdf_utils.PdfReader", return_value=_fake_reader(["one", "two"])) as reader:
+        first = list(PDFUtils.iter_text_from_pages(str(pdf), str(cache_dir)))
+        second = list(PDFUtils.iter_text_from_pages(str(pdf), str(cache_dir)))
+
+    assert first == second == [(0, "one"), (1, "two")]
+    assert reader.call_count == 1
+
+
+def test_cache_keyed_by_content_not_path(tmp_path):
+    """A copy under another name hits the cache; changed bytes are extracted again."""
+    cache_dir = str(tmp_path / "cache")
+    original = tmp_path / "a.pdf"
+    original.write_bytes(b"%PDF-same")
+    copy = tmp_path / "b.pdf"
+    copy.write_bytes(b"%PDF-same")
+    changed = tmp_path / "c.pdf"
+    changed.write_bytes(b"%PDF-other")
+
+    with patch("app.utils.pdf_utils.PdfReader", return_value=_fake_reader(["x"])) as reader:
+        list(PDFUtils.iter_text_from_pages(str(original), cache_dir))
+        list(PDFUtils.iter_text_from_pages(str(copy), cache_dir))
+        list(PDFUtils.iter_text_from_pages(str(changed), cache_dir))
+
+    assert reader.call_count == 2
+
+
+def test_partial_extraction_is_not_cached(tmp_path):
+    """Stopping iteration early leaves no cache entry behind."""
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+    cache_dir = tmp_path / "cache"
+
+    with patch("app.utils.pdf_utils.PdfReader", return_value=_fake_reader(["one", "two"])):
+        pages = PDFUtils.iter_text_from_pages(str(pdf), str(cache_dir))
+        next(pages)
+        pages.close()
+
+    assert not cache_dir.exists() or not any(cache_dir.iterdir())
@@ -0,0 +1,60 @@
+"""
+Tests for prefetch, which runs PDF extraction/segmentation ahead of embedding.
+"""
+import threading
+import time
+
+import pytest
+
+from app.utils.prefetch import prefetch
+
+
+def test_prefetch_preserves_order():
+    """Items come out in the order the source produced them."""
+    assert list(prefetch(range(50), maxsize=3)) == list(range(50))
+
+
+def test_prefetch_runs_ahead_of_consumer_but_stays_bounded():
+    """The producer fills the queue while the consumer is busy, but never beyond maxsize."""
+    produced = []
+
+    def source():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    it = prefetch(source(), maxsize=2)
+    assert next(it) == 0
+    time.sleep(0.2)
+    # one item consumed, two queued, one more blocked in put()
+    assert len(produced) <= 4
+    assert list(it) == list(range(1, 20))
+
+
+def test_prefetch_reraises_producer_error_after_earlier_items():
+    """Items before a failure are delivered, then the producer's exception is raised."""
+    def source():
+        yield 1
+        yield 2
+        raise ValueError("bad page")
+
+    it = prefetch(source())
+    assert next(it) == 1
+    assert next(it) == 2
+    with pytest.raises(ValueError, match="bad page"):
+        next(it)
+
+
+def test_closing_consumer_stops_producer():
+    """Abandoning the generator lets the producer thread exit instead of blocking forever."""
+    def source():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    it = prefetch(source(), maxsize=1, name="prefetch-test")
+    next(it)
+    it.close()
+    time.sleep(0.5)
+    assert not any(t.name == "prefetch-test" for t in threading.enumerate())
@@ -0,0 +1,71 @@
+"""
+Tests for the embedding-keyed ProximityCache used by QueryService.query.
+"""
+from unittest.mock import patch
+
+import numpy as np
+
+from app.utils.proximity_cache import ProximityCache, invalidate_all
+
+
+def test_hit_on_near_duplicate_vector():
+    """A vector above the similarity threshold returns the cached value."""
+    cache = ProximityCache(capacity=4, tau=0.97)
+    cache.put([1.0, 0.0, 0.0], "answer-a")
+
+    assert cache.get([0.99, 0.01, 0.0]) == "answer-a"
+    assert cache.get([0.0, 1.0, 0.0]) is None
+
+
+def test_scope_must_match():
+    """Entries cached under different filters/top_k are never returned."""
+    cache = ProximityCache(capacity=4, tau=0.9)
+    cache.put([1.0, 0.0], "scoped", scope="files=a")
+
+    assert cache.get([1.0, 0.0], scope="files=b") is None
+    assert cache.get([1.0, 0.0], scope="files=a") == "scoped"
+
+
+def test_fifo_eviction_when_full():
+    """The oldest entry is overwritten once capacity is reached."""
+    cache = ProximityCache(capacity=2, tau=0.99)
+    cache.put(np.array([1.0, 0.0, 0.0]), "first")
+    cache.put(np.array([0.0, 1.0, 0.0]), "second")
+    cache.put(np.array([0.0, 0.0, 1.0]), "third")
+
+    assert len(cache) == 2
+    assert cache.get([1.0, 0.0, 0.0]) is None
+    assert cache.get([0.0, 1.0, 0.0]) == "second"
+    assert cache.get([0.0, 0.0, 1.0]) == "third"
+
+
+def test_disabled_cache_is_noop():
+    """Capacity 0 disables caching entirely."""
+    cache = ProximityCache(capacity=0, tau=0.5)
+    cache.put([1.0, 0.0], "ignored")
+
+    assert cache.get([1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_entries_expire_after_ttl():
+    """An entry older than the TTL is no longer returned."""
+    with patch("app.utils.proximity_cache.time.monotonic", return_value=100.0):
+        cache = ProximityCache(capacity=4, tau=0.9, ttl=60)
+        cache.put([1.0, 0.0], "answer")
+        assert cache.get([1.0, 0.0]) == "answer"
+    with patch("app.utils.proximity_cache.time.monotonic", return_value=161.0):
+        assert cache.get([1.0, 0.0]) is None
+
+
+def test_invalidate_all_clears_every_live_cache():
+    """A collection change drops the entries of every cache instance."""
+    first = ProximityCache(capacity=4, tau=0.9)
+    second = ProximityCache(capacity=4, tau=0.9)
+    first.put([1.0, 0.0], "a")
+    second.put([0.0, 1.0], "b")
+
+    invalidate_all()
+
+    assert len(first) == len(second) == 0
+    assert first.get([1.0, 0.0]) is None
@@ -0,0 +1,60 @@
+"""
+Tests for QueryService.astream_answer, the async streaming path behind /query/stream.
+"""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.query_service import QueryService, _StreamPlan
+
+_CHUNKS = ["Leave is ", "20 days.\nAsk ", "HR."]
+
+
+def _service(plan):
+    service = object.__new__(QueryService)
+    service._prepare_stream = MagicMock(return_value=plan)
+    service.llm_client = MagicMock()
+    service.llm_client.models.generate_content_stream.return_value = iter(
+        SimpleNamespace(text=t) for t in _CHUNKS
+    )
+
+    async def astream():
+        for t in _CHUNKS:
+            yield SimpleNamespace(text=t)
+
+    service.llm_client.aio.models.generate_content_stream = AsyncMock(return_value=astream())
+    return service
+
+
+def _collect(agen):
+    async def run():
+        return [chunk async for chunk in agen]
+    return asyncio.run(run())
+
+
+def _plan():
+    metrics = SimpleNamespace(
+        avg_retrieval_score=0.5, max_retrieval_score=0.9, num_sources_used=2,
+        confidence_score=0.7, coverage_score=0.6, source_diversity=0.5,
+    )
+    return _StreamPlan(None, "prompt", [{"filename": "a.pdf"}, {"filename": "b.pdf"}], metrics)
+
+
+def test_async_stream_matches_sync_stream():
+    """Same lines and metrics trailer as stream_answer, generated through the async client."""
+    service = _service(_plan())
+
+    async_chunks = _collect(service.astream_answer(MagicMock()))
+    sync_chunks = list(service.stream_answer(MagicMock()))
+
+    assert async_chunks == sync_chunks
+    assert async_chunks[:2] == ["Leave is 20 days.\n", "Ask HR."]
+    service.llm_client.aio.models.generate_content_stream.assert_awaited_once()
+
+
+def test_async_stream_direct_reply_skips_llm():
+    """A reply decided during retrieval (e.g. no files selected) is yielded without a Gemini call."""
+    service = _service(_StreamPlan("no files are currently selected"))
+
+    assert _collect(service.astream_answer(MagicMock())) == ["no files are currently selected"]
+    service.llm_client.aio.models.generate_content_stream.assert_not_called()
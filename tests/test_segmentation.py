@@ -0,0 +1,34 @@
+"""
+Tests for token-based segmentation helpers used by CSV and PDF ingestion.
+"""
+from app.utils.segmentation import dynamic_segment_text, segment_or_whole, segment_text_by_tokens, simple_tokenize
+
+
+def test_short_text_is_single_segment():
+    """Text within the soft max is returned unchanged."""
+    text = "a short row of csv text"
+    assert segment_text_by_tokens(text, target_tokens=4, soft_max_tokens=10, overlap_tokens=0, hard_max_tokens=20) == [text]
+
+
+def test_long_text_splits_into_target_windows():
+    """Long text is split into windows of target_tokens tokens."""
+    text = " ".join(f"w{i}" for i in range(25))
+    segs = segment_text_by_tokens(text, target_tokens=10, soft_max_tokens=12, overlap_tokens=0, hard_max_tokens=20)
+
+    assert [len(simple_tokenize(s)) for s in segs] == [10, 10, 5]
+    assert " ".join(segs) == text
+
+
+def test_segment_or_whole_falls_back_to_text():
+    """Empty segmentation results fall back to the original text."""
+    params = dict(target_tokens=10, soft_max_tokens=12, overlap_tokens=0, hard_max_tokens=20)
+    assert segment_or_whole("", dynamic=False, params=params) == [""]
+    assert segment_or_whole("one two", dynamic=False, params=params) == ["one two"]
+
+
+def test_dynamic_segmentation_matches_static_on_same_window():
+    """dynamic_segment_text reuses its tokens but segments exactly like segment_text_by_tokens."""
+    text = " ".join(f"w{i}." for i in range(400))
+    dynamic = dynamic_segment_text(text, target_segment_count=4, min_tokens=50, max_tokens=120, hard_max_tokens=200)
+    static = segment_text_by_tokens(text, target_tokens=100, soft_max_tokens=150, overlap_tokens=0, hard_max_tokens=200)
+    assert dynamic == static
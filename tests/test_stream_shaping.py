@@ -0,0 +1,66 @@
+"""
+Tests for streamed-output re-chunking helpers.
+"""
+import time
+
+import pytest
+
+from app.utils.stream_shaping import coalesce_stream, drain_lines, pace_stream
+
+
+def test_coalesce_merges_fast_chunks_and_preserves_text():
+    """Chunks arriving inside the window are merged; the first chunk is not delayed."""
+    chunks = ["a", "b", "c", "d"]
+    out = list(coalesce_stream(chunks, window_s=5.0, max_chars=64))
+    assert out[0] == "a"
+    assert "".join(out) == "abcd"
+    assert len(out) == 2
+
+
+def test_coalesce_flushes_on_size():
+    """A merged chunk is flushed once it reaches max_chars."""
+    out = list(coalesce_stream(["ab", "cd", "ef", "gh", "ij"], window_s=5.0, max_chars=4))
+    assert "".join(out) == "abcdefghij"
+    assert all(len(o) <= 4 for o in out[1:])
+
+
+def test_coalesce_flushes_buffer_when_source_stalls():
+    """Buffered text is emitted after the window even if the next chunk is slow."""
+    def slow():
+        yield "a"
+        yield "b"
+        time.sleep(0.3)
+        yield "c"
+
+    gen = coalesce_stream(slow(), window_s=0.02, max_chars=64)
+    start = time.monotonic()
+    assert next(gen) == "a"
+    assert next(gen) == "b"
+    assert time.monotonic() - start < 0.25
+    assert list(gen) == ["c"]
+
+
+def test_coalesce_propagates_source_errors():
+    """A provider error reaches the consumer after buffered text is flushed."""
+    def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        list(coalesce_stream(failing(), window_s=5.0, max_chars=64))
+
+
+def test_pace_splits_only_large_chunks():
+    """Oversized chunks are split into fixed pieces; small chunks pass through."""
+    out = list(pace_stream(["hi", "x" * 10], pace_s=0.001, split_over=5, piece=4))
+    assert out == ["hi", "xxxx", "xxxx", "xx"]
+
+
+def test_drain_lines_emits_complete_lines_as_one_block():
+    """Complete lines leave together; the partial tail is buffered until its newline arrives."""
+    buffer, emit = drain_lines("", "| a |")
+    assert (buffer, emit) == ("| a |", "")
+    buffer, emit = drain_lines(buffer, " b |\n| c |\n| d")
+    assert (buffer, emit) == ("| d", "| a | b |\n| c |\n")
+    buffer, emit = drain_lines(buffer, " |\n")
+    assert (buffer, emit) == ("", "| d |\n")
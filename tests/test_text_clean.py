@@ -0,0 +1,25 @@
+"""
+Tests for clean_source_text, applied to source snippets at ingest (and at query time for older points).
+"""
+from app.utils.text_clean import clean_source_text
+
+
+def test_normalizes_line_endings_blank_runs_and_edges():
+    """CRLF becomes LF, 3+ newlines collapse to one blank line, lines and edges are trimmed."""
+    raw = "\r\n  Title  \r\n\n\n\n body line \nnext\n\n"
+    assert clean_source_text(raw) == "Title\n\nbody line\nnext"
+
+
+def test_idempotent_so_precleaned_payloads_can_skip_it():
+    """Cleaning already-clean text is a no-op, which is what lets queries trust ingest-time cleaning."""
+    # Whitespace-only lines must count as blank, or a second pass would collapse them further
+    raw = "a\n \n \nb\r\n\t\r\n  \r\n\r\nc  \n  d\n \n"
+    once = clean_source_text(raw)
+    assert once == "a\n\nb\n\nc\nd"
+    assert clean_source_text(once) == once
+
+
+def test_empty_input():
+    """Empty or None input yields an empty string."""
+    assert clean_source_text("") == ""
+    assert clean_source_text(None) == ""
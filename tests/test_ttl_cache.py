@@ -0,0 +1,40 @@
+"""
+Tests for the TTLCache used to memoize rag_search vector searches.
+"""
+from unittest.mock import patch
+
+from app.utils.ttl_cache import TTLCache
+
+
+def test_entries_expire_after_ttl():
+    """A value is served until its time-to-live elapses, then treated as missing."""
+    cache = TTLCache(maxsize=4, ttl=10)
+    with patch("app.utils.ttl_cache.time.monotonic", return_value=100.0):
+        cache.put("k", "v")
+    with patch("app.utils.ttl_cache.time.monotonic", return_value=109.0):
+        assert cache.get("k") == "v"
+    with patch("app.utils.ttl_cache.time.monotonic", return_value=110.0):
+        assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_when_full():
+    """The least recently used entry is dropped once maxsize is exceeded."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_zero_ttl_disables_cache():
+    """ttl=0 turns the cache into a no-op."""
+    cache = TTLCache(maxsize=4, ttl=0)
+    cache.put("k", "v")
+
+    assert cache.get("k") is None
+    assert len(cache) == 0
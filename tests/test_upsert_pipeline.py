@@ -0,0 +1,26 @@
+"""
+Tests for the UpsertPipeline producer/consumer helper used by ingestion.
+"""
+import pytest
+
+from app.utils.upsert_pipeline import UpsertPipeline
+
+
+def test_all_items_upserted_in_order():
+    """Every submitted batch reaches the upsert function, in submission order."""
+    seen = []
+    with UpsertPipeline(lambda *item: seen.append(item), maxsize=1) as pipeline:
+        for i in range(5):
+            pipeline.submit(i, f"payload-{i}")
+
+    assert seen == [(i, f"payload-{i}") for i in range(5)]
+
+
+def test_consumer_failure_is_reraised_on_close():
+    """An upsert error surfaces in the producer instead of being swallowed."""
+    def failing_upsert(*_):
+        raise RuntimeError("qdrant down")
+
+    with pytest.raises(RuntimeError, match="qdrant down"):
+        with UpsertPipeline(failing_upsert) as pipeline:
+            pipeline.submit("batch")